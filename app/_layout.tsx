@@ -2,8 +2,16 @@ import 'react-native-reanimated';
 import { Stack } from 'expo-router';
 import { useEffect } from 'react';
 import { StatusBar } from 'expo-status-bar';
+import { useNeuroStore } from '@/store/neuroStore';
 
 export default function RootLayout() {
+  const loadUserId = useNeuroStore(state => state.loadUserId);
+
+  useEffect(() => {
+    // Restore the signed-in user before the first background sync
+    loadUserId();
+  }, []);
+
   return (
     <>
       <StatusBar style="light" />
@@ -2,23 +2,145 @@
 FastAPI Backend for NeuroTrack-BIA + Cell2Sentence Orchestration
 """
 
-from fastapi import FastAPI, HTTPException, BackgroundTasks
+from fastapi import FastAPI, HTTPException, BackgroundTasks, Request, WebSocket, WebSocketDisconnect
+from fastapi.exceptions import RequestValidationError
 from fastapi.middleware.cors import CORSMiddleware
-from pydantic import BaseModel
-from typing import Dict, List, Optional
+from fastapi.responses import JSONResponse, PlainTextResponse, StreamingResponse
+from pydantic import BaseModel, ValidationError
+from typing import AsyncIterator, Dict, List, Optional, Tuple
+from contextlib import asynccontextmanager
 from datetime import datetime
+import asyncio
+import codecs
+import json
 import sys
 import os
+import zlib
 
 # Add services to path
 sys.path.append(os.path.dirname(__file__))
 
+from services.alertService import AlertEngine
+from services.assessmentScheduler import AssessmentScheduler
+from services.baselineService import BaselineTracker
+from services.cohortAnalytics import CohortAnalytics
+from services.cognitiveSession import SessionAccumulator, check_trial, signature_inputs
+from services.codecService import DecodeError, EncodedResponse, decode_body, dumps, is_msgpack, loads, negotiate
+from services.embeddingService import create_embedding_service
+from services.executorService import ExecutorSaturated, OrchestrationExecutor
+from services.historyStore import RESOLUTIONS
+from services.jobQueue import JobQueue
+from services.metricsService import (
+    PROMETHEUS_CONTENT_TYPE,
+    REGISTRY,
+    MetricsMiddleware,
+    SamplingProfiler,
+)
 from services.orchestrationService import OrchestrationService
+from services.pushService import PushHub
+from services.resultCache import ResultCache
+from services.sharedState import SharedStore
+from services.storageService import create_storage
+from services.trendService import TrendTracker
+from services.vectorIndex import SignatureIndex
+from services.vitalsService import VITALS_FRAME_CONTENT_TYPE, VitalsBatch, VitalsValidationError
+from services.whatIfService import WhatIfAnalyzer, WhatIfError
+
+# Persistence backend (SQLite by default, see services/storageService.py) with the
+# columnar risk history store (BIA_HISTORY_DIR empty = serve history from SQLite)
+storage = create_storage(
+    os.environ.get("BIA_DATABASE_URL", "sqlite:///suzi.db"),
+    history_path=os.environ.get("BIA_HISTORY_DIR", "suzi_history")
+)
+
+# Durable queue for post-response writes, so they survive crashes and are
+# retried (BIA_JOB_QUEUE_PATH empty = in-process BackgroundTasks only)
+JOB_QUEUE_PATH = os.environ.get("BIA_JOB_QUEUE_PATH", "suzi_jobs.db")
+job_queue = JobQueue(
+    JOB_QUEUE_PATH,
+    workers=int(os.environ.get("BIA_JOB_WORKERS", "2")),
+    max_attempts=int(os.environ.get("BIA_JOB_MAX_ATTEMPTS", "8")),
+    lease_timeout=float(os.environ.get("BIA_JOB_LEASE_SECONDS", "600"))
+) if JOB_QUEUE_PATH else None
+
+# Due-time index over every user's next assessment, with rate-limited
+# reminders (BIA_SCHEDULER_PATH empty = no reminders)
+SCHEDULER_PATH = os.environ.get("BIA_SCHEDULER_PATH", "suzi_schedule.db")
+assessment_scheduler = AssessmentScheduler(
+    SCHEDULER_PATH,
+    rate=float(os.environ.get("BIA_REMINDER_RATE", "50")),
+    repeat_interval=float(os.environ.get("BIA_REMINDER_REPEAT_HOURS", "24")) * 3600,
+    max_reminders=int(os.environ.get("BIA_REMINDER_MAX", "3"))
+) if SCHEDULER_PATH else None
+
+# Nightly population statistics served from precomputed summary tables
+cohort_analytics = CohortAnalytics(
+    storage,
+    workers=int(os.environ.get("BIA_COHORT_WORKERS", str(os.cpu_count() or 1))),
+    window_days=int(os.environ.get("BIA_COHORT_WINDOW_DAYS", "90")),
+    run_hour=int(os.environ.get("BIA_COHORT_RUN_HOUR", "3"))
+)
+
+# On-disk nearest-neighbour index of signature trajectories (empty = disabled)
+SIGNATURE_INDEX_DIR = os.environ.get("BIA_SIGNATURE_INDEX_DIR", "suzi_index")
+signature_index = SignatureIndex(SIGNATURE_INDEX_DIR) if SIGNATURE_INDEX_DIR else None
+
+# Host-wide per-user state (latest analysis, trends, baselines) shared by all
+# uvicorn workers (BIA_SHARED_STATE_PATH empty = each process keeps its own)
+SHARED_STATE_PATH = os.environ.get("BIA_SHARED_STATE_PATH", "")
+shared_state = SharedStore(
+    SHARED_STATE_PATH,
+    cache_size=int(os.environ.get("BIA_SHARED_CACHE_SIZE", "4096"))
+) if SHARED_STATE_PATH else None
+LATEST_NAMESPACE = "latest"
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    if shared_state is not None:
+        shared_state.open()
+    await storage.start()
+    await cohort_analytics.start()
+    if signature_index is not None:
+        signature_index.open()
+        # Only the worker owning the index handles adds forwarded by the others
+        if job_queue is not None:
+            if signature_index.owner:
+                job_queue.register("index_signature", add_forwarded_signatures, batch_size=500)
+            else:
+                job_queue.expect("index_signature")
+        elif not signature_index.owner:
+            print("[Index] Signature index is owned by another worker; without a job queue this worker cannot add to it")
+    if job_queue is not None:
+        await job_queue.start()
+    if assessment_scheduler is not None:
+        await assessment_scheduler.start()
+    await executor.start()
+    if embedding_service is not None:
+        await embedding_service.start(warm=EMBEDDING_WARM_START)
+    alert_forwarder = asyncio.create_task(forward_alerts())
+    try:
+        yield
+    finally:
+        alert_forwarder.cancel()
+        if embedding_service is not None:
+            await embedding_service.close()
+        await executor.close()
+        if assessment_scheduler is not None:
+            await assessment_scheduler.close()
+        if job_queue is not None:
+            await job_queue.close()
+        if signature_index is not None:
+            signature_index.close()
+        await cohort_analytics.close()
+        await storage.close()
+        if shared_state is not None:
+            shared_state.close()
 
 app = FastAPI(
     title="SUZI Neuro API",
     description="Backend orchestration for NeuroTrack-BIA with Cell2Sentence integration",
-    version="1.0.0"
+    version="1.0.0",
+    lifespan=lifespan
 )
 
 # CORS middleware for React Native
@@ -30,8 +152,81 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# Initialize orchestration service
-orchestrator = OrchestrationService()
+# Request metrics and the on-demand endpoint profiler
+profiler = SamplingProfiler()
+app.add_middleware(MetricsMiddleware, profiler=profiler)
+
+# Debug endpoints (profiler control) are only mounted when explicitly enabled
+DEBUG_ENDPOINTS = os.environ.get("BIA_DEBUG_ENDPOINTS", "0") == "1"
+
+# Personalized risk classification against each user's own baseline (opt-in)
+PERSONAL_BASELINES = os.environ.get("BIA_PERSONAL_BASELINES", "0") == "1"
+BASELINE_MIN_OBSERVATIONS = int(os.environ.get("BIA_BASELINE_MIN_OBSERVATIONS", "10"))
+
+# Initialize orchestration service (retried payloads are served from the result cache)
+orchestrator = OrchestrationService(
+    result_cache=ResultCache(
+        max_entries=int(os.environ.get("BIA_RESULT_CACHE_SIZE", "10000")),
+        ttl=float(os.environ.get("BIA_RESULT_CACHE_TTL", "300"))
+    ),
+    trend_tracker=TrendTracker(store=shared_state),
+    baseline_tracker=BaselineTracker(BASELINE_MIN_OBSERVATIONS, store=shared_state) if PERSONAL_BASELINES else None
+)
+
+# Orchestration runs off the event loop (thread or warm process pool)
+executor = OrchestrationExecutor(
+    orchestrator,
+    mode=os.environ.get("BIA_EXECUTOR_MODE", "thread"),
+    max_workers=int(os.environ.get("BIA_EXECUTOR_WORKERS", "4")),
+    max_queue=int(os.environ.get("BIA_EXECUTOR_QUEUE", "64")),
+    # Process workers build their own service (and baselines) once each;
+    # with shared state they all fold into the same per-user records
+    worker_config={
+        "shared_state_path": SHARED_STATE_PATH,
+        "shared_cache_size": shared_state.cache_size if shared_state is not None else None,
+        "personal_baselines": PERSONAL_BASELINES,
+        "baseline_min_observations": BASELINE_MIN_OBSERVATIONS,
+    },
+    # fork (Linux default), spawn or forkserver; empty = platform default
+    start_method=os.environ.get("BIA_EXECUTOR_START_METHOD") or None
+)
+
+# Phase 3 Cell2Sentence embeddings ("tiny" = deterministic stand-in; unset = proxy only)
+embedding_service = create_embedding_service(
+    os.environ.get("BIA_EMBEDDING_MODEL"),
+    max_batch_size=int(os.environ.get("BIA_EMBEDDING_BATCH_SIZE", "32")),
+    max_wait=float(os.environ.get("BIA_EMBEDDING_MAX_WAIT_MS", "10")) / 1000
+)
+EMBEDDING_WARM_START = os.environ.get("BIA_EMBEDDING_WARM_START", "1") == "1"
+
+# Caregiver alert state; notifications are emitted only on state changes
+alert_engine = AlertEngine(
+    dedupe_window=float(os.environ.get("BIA_ALERT_DEDUPE_HOURS", "6")) * 3600,
+    escalation_count=int(os.environ.get("BIA_ALERT_ESCALATION_COUNT", "3"))
+)
+
+# Server push to caregiver dashboards (WebSocket / SSE)
+push_hub = PushHub(
+    max_pending=int(os.environ.get("BIA_PUSH_MAX_PENDING", "256")),
+    latest_cache_size=int(os.environ.get("BIA_LATEST_CACHE_SIZE", "4096")),
+    latest_store=shared_state,
+    latest_namespace=LATEST_NAMESPACE
+)
+PUSH_HEARTBEAT_SECONDS = float(os.environ.get("BIA_PUSH_HEARTBEAT", "15"))
+
+# Scrape-time views of component state
+REGISTRY.gauge("bia_executor_in_flight", "Orchestration calls queued or running",
+               callback=lambda: executor.in_flight)
+REGISTRY.counter("bia_executor_rejected", "Orchestration calls rejected with 503",
+                 callback=lambda: executor.rejected)
+REGISTRY.gauge("bia_result_cache_entries", "Entries in the orchestration result cache",
+               callback=lambda: len(orchestrator.result_cache))
+REGISTRY.counter("bia_result_cache_hits", "Orchestration result cache hits",
+                 callback=lambda: orchestrator.result_cache.hits)
+REGISTRY.counter("bia_result_cache_misses", "Orchestration result cache misses",
+                 callback=lambda: orchestrator.result_cache.misses)
+REGISTRY.counter("bia_result_cache_evictions", "Orchestration result cache evictions",
+                 callback=lambda: orchestrator.result_cache.evictions)
 
 # Request/Response Models
 class BIADataRequest(BaseModel):
@@ -48,6 +243,28 @@ class BIADataRequest(BaseModel):
     active_minutes: Optional[int] = 20
     behavior_events: Optional[List[str]] = []
     medication_adherence: Optional[float] = 1.0
+    # Optional trial-level session features (see /api/v1/cognitive-session)
+    rt_cv: Optional[float] = None
+    error_bursts: Optional[int] = None
+    fatigue_slope: Optional[float] = None
+    # Optional demographics for age-cohort analytics (does not affect scoring)
+    age: Optional[int] = None
+    # Phase 3: gene names ranked by expression (a Cell2Sentence "cell sentence")
+    cell_sentence: Optional[List[str]] = None
+
+class ParameterSweep(BaseModel):
+    # Either explicit values or `steps` points from start to stop inclusive
+    values: Optional[List[float]] = None
+    start: Optional[float] = None
+    stop: Optional[float] = None
+    steps: Optional[int] = None
+    # Cost per unit of change for the cheapest crossing (default 1 / range)
+    cost: Optional[float] = None
+
+class WhatIfRequest(BaseModel):
+    base: BIADataRequest
+    sweeps: Dict[str, ParameterSweep]
+    include_surface: bool = True
 
 class OrchestrationResponse(BaseModel):
     user_id: str
@@ -55,10 +272,12 @@ class OrchestrationResponse(BaseModel):
     analysis_type: str
     cognitive_indices: Dict
     cellular_signature: Dict
+    cellular_analysis: Optional[Dict] = None
     integrated_risk: Dict
     recommendations: List[Dict]
     next_assessment_due: str
     alerts: List[Dict]
+    age: Optional[int] = None
 
 # Health check
 @app.get("/")
@@ -69,25 +288,137 @@ async def root():
         "version": "1.0.0",
         "endpoints": {
             "orchestrate": "/api/v1/orchestrate",
+            "orchestrate_batch": "/api/v1/orchestrate/batch",
+            "stream": "/api/v1/stream?user_ids=...",
+            "websocket": "/api/v1/ws?user_ids=...",
+            "cognitive_session": "/api/v1/cognitive-session",
+            "what_if": "/api/v1/what-if",
+            "similar_patients": "/api/v1/similar-patients/{user_id}",
+            "cohort_summary": "/api/v1/cohort/summary",
             "health": "/health",
+            "metrics": "/metrics",
             "docs": "/docs"
         }
     }
 
 @app.get("/health")
 async def health_check():
-    return {
-        "status": "healthy",
+    """
+    Component status. Returns 503 when a required component is down.
+    """
+    storage_status = await storage.health()
+    executor_stats = executor.stats()
+    saturated = executor_stats["in_flight"] >= executor_stats["capacity"]
+    
+    healthy = storage_status["status"] == "ok"
+    body = {
+        "status": "healthy" if healthy else "degraded",
         "timestamp": datetime.now().isoformat(),
         "services": {
-            "orchestrator": "active",
-            "cell2sentence": "phase2_proxy"  # Will be "active" when C2S integrated
+            "orchestrator": {
+                "status": "saturated" if saturated else "active",
+                "executor": executor_stats,
+                "result_cache": orchestrator.result_cache.stats()
+            },
+            "storage": storage_status,
+            "shared_state": (
+                shared_state.stats() if shared_state is not None
+                else {"status": "not_configured"}
+            ),
+            "jobs": (
+                await job_queue.stats() if job_queue is not None
+                else {"status": "not_configured"}
+            ),
+            "cohort_analytics": cohort_analytics.stats(),
+            "assessment_scheduler": (
+                assessment_scheduler.stats() if assessment_scheduler is not None
+                else {"status": "not_configured"}
+            ),
+            "alerts": alert_engine.stats(),
+            "push": push_hub.stats(),
+            "signature_index": (
+                signature_index.stats() if signature_index is not None
+                else {"status": "not_configured"}
+            ),
+            "cell2sentence": (
+                embedding_service.stats() if embedding_service is not None
+                else {"status": "not_configured", "analysis_type": "proxy_biomarkers"}
+            )
         }
     }
+    return JSONResponse(body, status_code=200 if healthy else 503)
+
+@app.get("/metrics")
+async def metrics():
+    """Prometheus scrape endpoint"""
+    if job_queue is not None:
+        # Queue depth is shared by every worker, so it is read at scrape time
+        await job_queue.counts()
+    return PlainTextResponse(REGISTRY.render(), media_type=PROMETHEUS_CONTENT_TYPE)
+
+@app.post("/debug/profiler", include_in_schema=False)
+async def start_profiler(path: str, interval_ms: float = 5.0):
+    """Start sampling requests to a single endpoint path"""
+    if not DEBUG_ENDPOINTS:
+        raise HTTPException(status_code=404, detail="Not Found")
+    if interval_ms < 1:
+        raise HTTPException(status_code=422, detail="interval_ms must be at least 1")
+    profiler.enable(path, interval_ms / 1000)
+    return {"status": "enabled", "path": path, "interval_ms": interval_ms}
+
+@app.get("/debug/profiler", include_in_schema=False)
+async def profiler_report(limit: int = 25):
+    """Current profile of the sampled endpoint"""
+    if not DEBUG_ENDPOINTS:
+        raise HTTPException(status_code=404, detail="Not Found")
+    return profiler.report(limit)
+
+@app.delete("/debug/profiler", include_in_schema=False)
+async def stop_profiler(limit: int = 25):
+    """Stop sampling and return the final profile"""
+    if not DEBUG_ENDPOINTS:
+        raise HTTPException(status_code=404, detail="Not Found")
+    profiler.disable()
+    return profiler.report(limit)
+
+ORCHESTRATE_REQUEST_BODY = {
+    "required": True,
+    "content": {
+        media_type: {"schema": BIADataRequest.model_json_schema()}
+        for media_type in ("application/json", "application/msgpack")
+    }
+}
+
+async def parse_bia_request(request: Request) -> Dict:
+    """
+    Decode and validate a BIADataRequest body straight from bytes
+    
+    JSON is parsed by pydantic-core during validation and msgpack by the
+    codec. Returns only the fields the client set, so trends skip the rest.
+    """
+    body = await request.body()
+    content_type = request.headers.get("content-type", "")
+    try:
+        if is_msgpack(content_type):
+            data = BIADataRequest.model_validate(decode_body(body, content_type))
+        else:
+            data = BIADataRequest.model_validate_json(body)
+    except DecodeError as e:
+        raise HTTPException(status_code=e.status_code, detail=str(e))
+    except ValidationError as e:
+        raise RequestValidationError(
+            [{**error, "loc": ("body", *error["loc"])} for error in e.errors()],
+            body=body
+        )
+    return data.model_dump(exclude_unset=True)
 
-@app.post("/api/v1/orchestrate", response_model=OrchestrationResponse)
+@app.post(
+    "/api/v1/orchestrate",
+    response_model=OrchestrationResponse,
+    openapi_extra={"requestBody": ORCHESTRATE_REQUEST_BODY}
+)
 async def orchestrate_analysis(
-    data: BIADataRequest,
+    request: Request,
     background_tasks: BackgroundTasks
 ):
     """
@@ -98,22 +429,71 @@ async def orchestrate_analysis(
     - Risk scores
     - Personalized recommendations
     - Alerts
+    
+    With a cell_sentence and the embedding service configured, the analysis
+    includes a summary of its Cell2Sentence embedding under cellular_analysis.
+    
+    The body may be JSON or msgpack (Content-Type: application/msgpack); the
+    response is msgpack when the Accept header prefers it. The service builds
+    the response itself, so it is encoded once without re-validation.
     """
+    bia_data = await parse_bia_request(request)
+    await attach_cellular_embedding(bia_data)
+    
     try:
-        # Convert request to dict
-        bia_data = data.dict()
-        
-        # Run orchestration
-        result = orchestrator.orchestrate(bia_data)
+        # Run orchestration on the executor
+        result = await executor.orchestrate(bia_data)
+        alert_engine.process_result(result)
+        push_hub.publish_analysis(result)
+        await share_latest([result])
+        if assessment_scheduler is not None:
+            assessment_scheduler.schedule_result(result)
         
-        # Save to database in background
-        background_tasks.add_task(save_to_database, result)
+        # Durably queue the database write before responding
+        if job_queue is not None:
+            await job_queue.enqueue("save_analysis", result)
+        else:
+            background_tasks.add_task(save_to_database, result)
+        background_tasks.add_task(index_signatures, [result])
         
-        return result
+        return EncodedResponse(
+            result,
+            media_type=negotiate(request.headers.get("accept")),
+            headers={"Vary": "Accept"}
+        )
         
+    except ExecutorSaturated as e:
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": "1"})
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.post("/api/v1/orchestrate/batch")
+async def orchestrate_batch(request: Request, chunk_size: int = 256):
+    """
+    Bulk orchestration endpoint
+    
+    Accepts a JSON array of BIA records, or NDJSON (Content-Type:
+    application/x-ndjson) with one record per line. Records are parsed
+    incrementally and orchestrated in chunks, and one NDJSON line is
+    streamed back per record as soon as its chunk is done:
+    
+    - {"index": i, "status": "ok", "result": {...}}
+    - {"index": i, "status": "error", "error": "..."}
+    
+    A final {"summary": {...}} line reports the totals. Invalid records are
+    reported inline and do not abort the rest of the upload.
+    """
+    if chunk_size < 1 or chunk_size > MAX_BATCH_CHUNK_SIZE:
+        raise HTTPException(
+            status_code=422,
+            detail=f"chunk_size must be between 1 and {MAX_BATCH_CHUNK_SIZE}"
+        )
+    
+    return RequestStreamingResponse(
+        stream_batch_orchestration(iter_batch_records(request), chunk_size),
+        media_type="application/x-ndjson"
+    )
+
 @app.post("/api/v1/cognitive-assessment")
 async def submit_cognitive_assessment(
     user_id: str,
@@ -143,6 +523,49 @@ async def submit_cognitive_assessment(
         "message": "Cognitive assessment saved"
     }
 
+@app.post("/api/v1/cognitive-session")
+async def submit_cognitive_session(
+    request: Request,
+    user_id: str,
+    assessment_type: str,
+    score: Optional[float] = None
+):
+    """
+    Submit the raw trials of a cognitive test session
+    
+    The body is a JSON array or NDJSON of trials, e.g.
+    {"reaction_time": 412, "correct": true}, read as a stream: each trial
+    is folded into the session features as it arrives, in constant memory.
+    The returned signature_inputs can be sent with the next orchestration
+    request to include within-session variability in the signature.
+    """
+    session = SessionAccumulator()
+    async for trial, error in iter_batch_records(request):
+        if error is None:
+            error = check_trial(trial)
+        if error is not None:
+            raise HTTPException(status_code=422, detail=f"Trial {session.trials}: {error}")
+        session.add(trial.get("reaction_time"), trial.get("correct", True))
+    
+    if session.trials == 0:
+        raise HTTPException(status_code=422, detail="Session has no trials")
+    
+    features = session.features()
+    await save_assessment({
+        "user_id": user_id,
+        "timestamp": datetime.now().isoformat(),
+        "type": assessment_type,
+        "score": score,
+        "errors": session.errors
+    })
+    
+    return {
+        "status": "success",
+        "assessment_id": generate_id(),
+        "features": features,
+        "signature_inputs": signature_inputs(features)
+    }
+
 @app.post("/api/v1/behavior-event")
 async def submit_behavior_event(
     user_id: str,
@@ -162,6 +585,7 @@ async def submit_behavior_event(
     }
     
     await save_behavior_event(event)
+    alert_engine.process_behavior_event(event)
     
     return {
         "status": "success",
@@ -170,39 +594,317 @@ async def submit_behavior_event(
     }
 
 @app.post("/api/v1/vitals-sync")
-async def sync_vitals(
-    user_id: str,
-    vitals: List[Dict]
-):
+async def sync_vitals(user_id: str, request: Request):
     """
     Bulk sync of HealthKit/Health Connect vitals
+    
+    The body is a list of vitals, or an object with a "vitals" list, encoded
+    as JSON or msgpack (Content-Type: application/msgpack) and optionally
+    gzip-compressed (Content-Encoding: gzip). Samples are deduplicated on
+    (user_id, type, timestamp) and written in a single bulk operation.
+    """
+    payload = await read_vitals_payload(request)
+    records = payload.get('vitals') if isinstance(payload, dict) else payload
+    
+    try:
+        batch = VitalsBatch.from_records(user_id, records)
+    except VitalsValidationError as e:
+        raise HTTPException(status_code=422, detail=str(e))
+    
+    inserted = await storage.save_vital_signs_bulk(batch) if len(batch) else 0
+    
+    return {
+        "status": "success",
+        "received_count": len(records),
+        "synced_count": inserted,
+        "duplicate_count": len(records) - inserted,
+        "message": f"Synced {inserted} vital signs"
+    }
+
+MAX_HISTORY_DAYS = 3650
+MAX_HISTORY_USERS = 500
+
+def check_history_params(days: int, resolution: str):
+    if days < 1 or days > MAX_HISTORY_DAYS:
+        raise HTTPException(status_code=422, detail=f"days must be between 1 and {MAX_HISTORY_DAYS}")
+    if resolution not in RESOLUTIONS:
+        raise HTTPException(status_code=422, detail=f"resolution must be one of {', '.join(RESOLUTIONS)}")
+
+@app.get("/api/v1/sync/cursors")
+async def get_sync_cursors(user_id: str, device_id: str):
+    """
+    What the server already has from a device: the newest stored sample
+    time (epoch ms) per vital type. Clients upload only newer samples.
+    """
+    return {
+        "user_id": user_id,
+        "device_id": device_id,
+        "cursors": await storage.fetch_sync_cursors(user_id, device_id)
+    }
+
+@app.post("/api/v1/sync/delta")
+async def sync_vitals_delta(user_id: str, device_id: str, request: Request):
     """
-    saved_count = 0
-    for vital in vitals:
-        vital['user_id'] = user_id
-        await save_vital_sign(vital)
-        saved_count += 1
+    Incremental vitals sync for one device
+    
+    The body is a binary vitals frame (Content-Type: application/x-bia-vitals,
+    see services/vitalsService.py) or the same JSON/msgpack payload as
+    /api/v1/vitals-sync, optionally gzip-compressed. Samples at or before the
+    device's cursor for their type are skipped as already synced; the rest
+    are stored and the cursors advanced in one transaction. The response
+    carries the new cursors, so the next sync needs no extra round trip.
+    """
+    try:
+        if VITALS_FRAME_CONTENT_TYPE in request.headers.get("content-type", ""):
+            batch = VitalsBatch.from_frame(user_id, await read_request_body(request))
+            received = len(batch) + batch.duplicates
+        else:
+            payload = await read_vitals_payload(request)
+            records = payload.get('vitals') if isinstance(payload, dict) else payload
+            batch = VitalsBatch.from_records(user_id, records)
+            received = len(records)
+    except VitalsValidationError as e:
+        raise HTTPException(status_code=422, detail=str(e))
+    
+    outcome = await storage.save_vitals_delta(batch, device_id)
     
     return {
         "status": "success",
-        "synced_count": saved_count,
-        "message": f"Synced {saved_count} vital signs"
+        "device_id": device_id,
+        "received_count": received,
+        "synced_count": outcome["inserted"],
+        "stale_count": outcome["stale"],
+        "duplicate_count": received - outcome["stale"] - outcome["inserted"],
+        "cursors": outcome["cursors"]
+    }
+
+@app.get("/api/v1/risk-history")
+async def get_group_risk_history(user_ids: str, days: int = 30, resolution: str = "daily"):
+    """
+    Historical risk scores for a group of users (comma-separated user_ids),
+    e.g. everyone in a caregiver's dashboard
+    """
+    check_history_params(days, resolution)
+    users = list(dict.fromkeys(u for u in user_ids.split(",") if u))
+    if not users or len(users) > MAX_HISTORY_USERS:
+        raise HTTPException(status_code=422, detail=f"user_ids must list 1 to {MAX_HISTORY_USERS} users")
+    
+    histories = await storage.fetch_risk_histories(users, days, resolution)
+    
+    return {
+        "period_days": days,
+        "resolution": resolution,
+        "users": histories
     }
 
 @app.get("/api/v1/risk-history/{user_id}")
-async def get_risk_history(user_id: str, days: int = 30):
+async def get_risk_history(user_id: str, days: int = 30, resolution: str = "raw"):
     """
     Get historical risk scores for user
+    
+    resolution "daily" or "weekly" returns one aggregated row per period
+    (mean/min/max score, worst risk level, analysis count) instead of
+    every analysis.
     """
-    # In production: query database
-    history = await fetch_risk_history(user_id, days)
+    check_history_params(days, resolution)
+    history = await fetch_risk_history(user_id, days, resolution)
     
     return {
         "user_id": user_id,
         "period_days": days,
+        "resolution": resolution,
         "history": history
     }
 
+@app.get("/api/v1/similar-patients/{user_id}")
+async def get_similar_patients(user_id: str, k: int = 5):
+    """
+    Patients whose recent signature trajectory is closest to this user's
+    
+    Trajectories are the last few four-dimension cellular signatures,
+    compared with the on-disk approximate nearest-neighbour index.
+    """
+    if signature_index is None:
+        raise HTTPException(status_code=503, detail="Signature index is not configured")
+    if k < 1 or k > 100:
+        raise HTTPException(status_code=422, detail="k must be between 1 and 100")
+    
+    return {
+        "user_id": user_id,
+        "window": signature_index.window,
+        "similar": signature_index.similar(user_id, k)
+    }
+
+@app.get("/api/v1/baseline/{user_id}")
+async def get_personal_baseline(user_id: str):
+    """
+    A user's personal baseline (observations, mean, median, std) per
+    signature metric, as used for personalized risk classification
+    """
+    if orchestrator.baseline_tracker is None or (executor.mode == "process" and shared_state is None):
+        raise HTTPException(status_code=503, detail="Personal baselines are not available on this server")
+    baseline = orchestrator.baseline_tracker.snapshot(user_id)
+    if baseline is None:
+        raise HTTPException(status_code=404, detail="No baseline for this user yet")
+    return {"user_id": user_id, "baseline": baseline}
+
+@app.get("/api/v1/schedule/{user_id}")
+async def get_assessment_schedule(user_id: str):
+    """
+    When the user's next assessment is due and how many reminders were sent
+    """
+    if assessment_scheduler is None:
+        raise HTTPException(status_code=503, detail="Assessment scheduling is not configured")
+    entry = await assessment_scheduler.get(user_id)
+    if entry is None:
+        raise HTTPException(status_code=404, detail="No assessment scheduled for this user")
+    return entry
+
+what_if_analyzer = WhatIfAnalyzer(
+    orchestrator.signature_calculator,
+    max_points=int(os.environ.get("BIA_WHATIF_MAX_POINTS", "1000000"))
+)
+
+@app.post("/api/v1/what-if")
+async def what_if_analysis(request: Request, body: WhatIfRequest):
+    """
+    Sensitivity analysis around one BIA record
+    
+    Scores every combination of the swept inputs (e.g. steps and
+    sleep_efficiency) in one vectorized pass and returns:
+    - The risk surface over the sweep grid
+    - Per-input marginal effects (others at base, and partial dependence)
+    - The cheapest change that lowers the risk level, applied step by step
+    
+    Nothing is stored; the base record's user history is not consulted.
+    """
+    try:
+        analysis = await asyncio.get_running_loop().run_in_executor(
+            None,
+            what_if_analyzer.analyze,
+            body.base.model_dump(exclude_unset=True),
+            {name: sweep.model_dump() for name, sweep in body.sweeps.items()},
+            body.include_surface
+        )
+    except WhatIfError as e:
+        raise HTTPException(status_code=422, detail=str(e))
+    analysis["user_id"] = body.base.user_id
+    return EncodedResponse(
+        analysis,
+        media_type=negotiate(request.headers.get("accept")),
+        headers={"Vary": "Accept"}
+    )
+
+@app.get("/api/v1/cohort/summary")
+async def get_cohort_summary():
+    """
+    Latest population statistics from the nightly cohort job
+    
+    Risk-level distribution and contributing-factor prevalence over each
+    user's latest analysis, ad_risk_score percentiles per age band and the
+    biggest week-over-week movers.
+    """
+    summary = await cohort_analytics.summary()
+    if summary is None:
+        raise HTTPException(status_code=404, detail="Cohort statistics have not been computed yet")
+    return summary
+
+@app.get("/api/v1/cohort/users/{user_id}")
+async def get_cohort_user(user_id: str):
+    """A user's age band, percentile within it and week-over-week change"""
+    stats = await cohort_analytics.user_stats(user_id)
+    if stats is None:
+        raise HTTPException(status_code=404, detail="User not in the latest cohort run")
+    return stats
+
+@app.post("/api/v1/cohort/refresh")
+async def refresh_cohort():
+    """Recompute cohort statistics now instead of waiting for the nightly run"""
+    return await cohort_analytics.refresh()
+
+@app.get("/api/v1/alerts/{user_id}")
+async def get_active_alerts(user_id: str):
+    """
+    Currently open alerts for user (deduplicated, with escalation state)
+    """
+    return {
+        "user_id": user_id,
+        "alerts": alert_engine.active_alerts(user_id)
+    }
+
+@app.get("/api/v1/stream")
+async def stream_updates(user_ids: str):
+    """
+    Server-Sent Events feed for caregiver dashboards
+    
+    Starts with a "snapshot" event per user (latest analysis and open
+    alerts), then pushes "analysis", "alert" and "recommendations" (delta)
+    events as they happen. A comment line is sent as heartbeat.
+    """
+    users = parse_push_users(user_ids)
+    
+    async def events() -> AsyncIterator[str]:
+        # Subscribed before the snapshots are read so nothing published in
+        # between is lost, and only once the stream runs so finally releases it
+        subscriber = push_hub.subscribe(users)
+        try:
+            for user_id in users:
+                yield f"event: snapshot\ndata: {await push_snapshot(user_id)}\n\n"
+            while True:
+                frames = await subscriber.next(PUSH_HEARTBEAT_SECONDS)
+                if frames is None:
+                    return
+                if not frames:
+                    yield ": heartbeat\n\n"
+                    continue
+                yield "".join(f"event: {event}\ndata: {frame}\n\n" for event, frame in frames)
+        finally:
+            subscriber.close()
+    
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+@app.websocket("/api/v1/ws")
+async def websocket_updates(websocket: WebSocket, user_ids: str):
+    """
+    WebSocket feed for caregiver dashboards
+    Same JSON messages as /api/v1/stream, one per text frame
+    """
+    try:
+        users = parse_push_users(user_ids)
+    except HTTPException as e:
+        await websocket.close(code=1008, reason=e.detail)
+        return
+    
+    await websocket.accept()
+    subscriber = push_hub.subscribe(users)
+    
+    async def watch_disconnect():
+        try:
+            while (await websocket.receive())["type"] != "websocket.disconnect":
+                pass
+        finally:
+            subscriber.close()
+    
+    watcher = asyncio.create_task(watch_disconnect())
+    try:
+        for user_id in users:
+            await websocket.send_text(await push_snapshot(user_id))
+        while True:
+            frames = await subscriber.next(PUSH_HEARTBEAT_SECONDS)
+            if frames is None:
+                break
+            for _, frame in frames or [("heartbeat", '{"event": "heartbeat"}')]:
+                await websocket.send_text(frame)
+    except WebSocketDisconnect:
+        pass
+    finally:
+        watcher.cancel()
+        subscriber.close()
+
 @app.get("/api/v1/recommendations/{user_id}")
 async def get_recommendations(user_id: str):
     """
@@ -224,41 +926,340 @@ async def get_recommendations(user_id: str):
         "recommendations": latest_analysis['recommendations']
     }
 
-# Database functions (placeholders - implement with actual DB)
+async def attach_cellular_embedding(bia_data: Dict):
+    """
+    Replace a request's cell_sentence with its Cell2Sentence embedding
+    Concurrent requests are micro-batched by the embedding service
+    """
+    cell_sentence = bia_data.pop('cell_sentence', None)
+    if not cell_sentence:
+        return
+    if embedding_service is None:
+        raise HTTPException(
+            status_code=422,
+            detail="cell_sentence requires the Cell2Sentence embedding service (set BIA_EMBEDDING_MODEL)"
+        )
+    embedding = await embedding_service.embed(cell_sentence)
+    bia_data['cellular_embedding'] = embedding.tolist()
+
+# Server push helpers
+MAX_PUSH_USERS = 100
+
+def parse_push_users(user_ids: str) -> List[str]:
+    users = list(dict.fromkeys(u for u in user_ids.split(",") if u))
+    if not users or len(users) > MAX_PUSH_USERS:
+        raise HTTPException(status_code=422, detail=f"user_ids must list 1 to {MAX_PUSH_USERS} users")
+    return users
+
+async def push_snapshot(user_id: str) -> str:
+    """Current state for a new subscriber, encoded as a snapshot frame"""
+    return PushHub.encode("snapshot", user_id, {
+        "analysis": await fetch_latest_analysis(user_id),
+        "alerts": alert_engine.active_alerts(user_id)
+    })
+
+async def forward_alerts():
+    """Relay alert engine notifications to dashboard subscribers"""
+    subscription = alert_engine.subscribe()
+    try:
+        while True:
+            notification = await subscription.get()
+            push_hub.publish(notification["user_id"], "alert", notification)
+    finally:
+        subscription.close()
+
+# Batch streaming helpers
+MAX_BATCH_CHUNK_SIZE = 4096
+MAX_BATCH_RECORD_BYTES = 1 << 20
+
+class RequestStreamingResponse(StreamingResponse):
+    """
+    StreamingResponse that can be sent while the request body is still
+    being read.
+    
+    Starlette's StreamingResponse listens for client disconnects on the same
+    receive channel the request body arrives on, which would swallow body
+    chunks. Here a disconnect surfaces through request.stream() instead.
+    """
+    
+    async def __call__(self, scope, receive, send) -> None:
+        await self.stream_response(send)
+        if self.background is not None:
+            await self.background()
+
+async def iter_batch_records(request: Request) -> AsyncIterator[Tuple[Optional[Dict], Optional[str]]]:
+    """
+    Incrementally parse a JSON array or NDJSON request body
+    
+    Yields (record, error) pairs, one per record, without ever holding more
+    than one request chunk plus one partial record in memory.
+    """
+    content_type = request.headers.get("content-type", "")
+    ndjson = "ndjson" in content_type or "jsonl" in content_type
+    decoder = codecs.getincrementaldecoder("utf-8")()
+    json_decoder = json.JSONDecoder()
+    buffer = ""
+    array_opened = False
+    
+    async for chunk in request.stream():
+        buffer += decoder.decode(chunk)
+        
+        if ndjson:
+            *lines, buffer = buffer.split("\n")
+            for line in lines:
+                if line.strip():
+                    yield _decode_batch_line(line)
+        else:
+            pos = 0
+            while True:
+                pos = _skip_array_separators(buffer, pos)
+                if pos >= len(buffer):
+                    break
+                if not array_opened:
+                    if buffer[pos] != "[":
+                        yield None, "Request body must be a JSON array or NDJSON"
+                        return
+                    array_opened = True
+                    pos += 1
+                    continue
+                if buffer[pos] == "]":
+                    return
+                try:
+                    record, pos = json_decoder.raw_decode(buffer, pos)
+                except json.JSONDecodeError:
+                    break  # Incomplete record, wait for more data
+                yield _check_batch_record(record)
+            buffer = buffer[pos:]
+        
+        if len(buffer) > MAX_BATCH_RECORD_BYTES:
+            yield None, f"Record exceeds {MAX_BATCH_RECORD_BYTES} bytes or is malformed"
+            return
+    
+    buffer += decoder.decode(b"", final=True)
+    if ndjson:
+        if buffer.strip():
+            yield _decode_batch_line(buffer)
+    elif buffer.strip() or not array_opened:
+        yield None, "Unterminated or malformed JSON array"
+
+def _skip_array_separators(buffer: str, pos: int) -> int:
+    """Skip whitespace and commas between JSON array elements"""
+    while pos < len(buffer) and buffer[pos] in " \t\r\n,":
+        pos += 1
+    return pos
+
+def _decode_batch_line(line: str) -> Tuple[Optional[Dict], Optional[str]]:
+    """Decode one NDJSON line"""
+    try:
+        record = loads(line)
+    except ValueError as e:
+        return None, f"Invalid JSON: {getattr(e, 'msg', e)}"
+    return _check_batch_record(record)
+
+def _check_batch_record(record) -> Tuple[Optional[Dict], Optional[str]]:
+    """Ensure a decoded batch record is a JSON object"""
+    if not isinstance(record, dict):
+        return None, "Record must be a JSON object"
+    return record, None
+
+async def orchestrate_batch_chunk(chunk: List[Tuple[Optional[Dict], Optional[str]]]) -> List[Tuple[Optional[Dict], Optional[str]]]:
+    """
+    Validate and orchestrate a chunk of batch records
+    
+    Returns (result, error) pairs in input order. Valid records are sent to
+    the executor as a single task, waiting for capacity rather than failing.
+    """
+    outcomes: List[Tuple[Optional[Dict], Optional[str]]] = []
+    valid_positions = []
+    valid_records = []
+    for record, error in chunk:
+        if error is None:
+            try:
+                valid_records.append(BIADataRequest(**record).model_dump(exclude_unset=True))
+                valid_positions.append(len(outcomes))
+            except ValidationError as e:
+                error = format_validation_error(e)
+        outcomes.append((None, error))
+    
+    if valid_records:
+        embedded = await asyncio.gather(
+            *(attach_cellular_embedding(record) for record in valid_records),
+            return_exceptions=True
+        )
+        for i, outcome in reversed(list(enumerate(embedded))):
+            if isinstance(outcome, Exception):
+                detail = outcome.detail if isinstance(outcome, HTTPException) else str(outcome)
+                outcomes[valid_positions[i]] = (None, detail)
+                del valid_records[i], valid_positions[i]
+    
+    if valid_records:
+        results = await executor.orchestrate_many(valid_records, wait=True)
+        for position, outcome in zip(valid_positions, results):
+            outcomes[position] = outcome
+    return outcomes
+
+async def stream_batch_orchestration(
+    records: AsyncIterator[Tuple[Optional[Dict], Optional[str]]],
+    chunk_size: int
+) -> AsyncIterator[bytes]:
+    """Orchestrate parsed batch records chunk by chunk and yield NDJSON lines"""
+    index = 0
+    succeeded = 0
+    failed = 0
+    chunk = []
+    finished = False
+    
+    while not finished:
+        try:
+            chunk.append(await records.__anext__())
+        except StopAsyncIteration:
+            finished = True
+        if not chunk or (len(chunk) < chunk_size and not finished):
+            continue
+        
+        lines = []
+        saved = []
+        for result, error in await orchestrate_batch_chunk(chunk):
+            if error is None:
+                alert_engine.process_result(result)
+                push_hub.publish_analysis(result)
+                if assessment_scheduler is not None:
+                    assessment_scheduler.schedule_result(result)
+                saved.append(result)
+                lines.append({"index": index, "status": "ok", "result": result})
+                succeeded += 1
+            else:
+                lines.append({"index": index, "status": "error", "error": error})
+                failed += 1
+            index += 1
+        chunk = []
+        await share_latest(saved)
+        await index_signatures(saved)
+        if job_queue is not None and saved:
+            await job_queue.enqueue_many("save_analysis", saved)
+        else:
+            for result in saved:
+                await save_to_database(result)
+        yield b"".join(dumps(line) + b"\n" for line in lines)
+    
+    summary = {"processed": index, "succeeded": succeeded, "failed": failed}
+    yield dumps({"summary": summary}) + b"\n"
+
+def format_validation_error(error: ValidationError) -> str:
+    """Flatten a Pydantic ValidationError into a single line"""
+    return "; ".join(
+        f"{'.'.join(str(part) for part in err['loc'])}: {err['msg']}"
+        for err in error.errors()
+    )
+
+# Vitals payload decoding
+MAX_VITALS_BODY_BYTES = 64 << 20
+
+async def read_request_body(request: Request) -> bytes:
+    """Request body, inflated when sent with Content-Encoding: gzip"""
+    body = await request.body()
+    
+    encoding = request.headers.get("content-encoding", "").lower()
+    if encoding == "gzip":
+        inflater = zlib.decompressobj(wbits=zlib.MAX_WBITS | 16)
+        try:
+            body = inflater.decompress(body, MAX_VITALS_BODY_BYTES)
+        except zlib.error:
+            raise HTTPException(status_code=400, detail="Invalid gzip body")
+        if inflater.unconsumed_tail:
+            raise HTTPException(status_code=413, detail="Decompressed body too large")
+    elif encoding not in ("", "identity"):
+        raise HTTPException(status_code=415, detail=f"Unsupported Content-Encoding: {encoding}")
+    return body
+
+async def read_vitals_payload(request: Request):
+    """Decode a (possibly gzip-compressed) JSON or msgpack vitals body"""
+    body = await read_request_body(request)
+    
+    try:
+        return decode_body(body, request.headers.get("content-type", ""))
+    except DecodeError as e:
+        raise HTTPException(status_code=e.status_code, detail=str(e))
+
+# Database functions (delegate to the configured storage backend)
 async def save_to_database(result: Dict):
     """Save orchestration result to SUZI unified database"""
-    print(f"[DB] Saving analysis for user {result['user_id']}")
-    # TODO: Implement actual database save
-    # await db.analyses.insert_one(result)
+    await storage.save_analysis(result)
+
+async def save_analyses(results: List[Dict]):
+    """Job handler: durably write a batch of queued results before acking"""
+    await storage.save_analyses(results)
+
+if job_queue is not None:
+    job_queue.register("save_analysis", save_analyses, batch_size=500)
+
+async def send_assessment_reminders(reminders: List[Dict]):
+    """Push assessment-due reminders to the users' subscribed app and dashboards"""
+    for reminder in reminders:
+        push_hub.publish(reminder["user_id"], "assessment_due", reminder)
+
+if assessment_scheduler is not None:
+    assessment_scheduler.set_handler(send_assessment_reminders)
+
+async def index_signatures(results: List[Dict]):
+    """
+    Add the results' cellular signatures to the similarity index
+    
+    Only the worker owning the index writes it; the others forward the
+    signatures through the job queue (without one they cannot be indexed).
+    """
+    if signature_index is None or not results:
+        return
+    if signature_index.owner:
+        await asyncio.get_running_loop().run_in_executor(None, add_signatures, results)
+    elif job_queue is not None:
+        await job_queue.enqueue_many("index_signature", [
+            {"user_id": r['user_id'], "cellular_signature": r['cellular_signature']} for r in results
+        ])
+
+def add_signatures(results: List[Dict]):
+    for result in results:
+        signature_index.add(result['user_id'], result['cellular_signature'])
+
+async def add_forwarded_signatures(signatures: List[Dict]):
+    """Job handler (index owner only): signatures forwarded by other workers"""
+    await asyncio.get_running_loop().run_in_executor(None, add_signatures, signatures)
 
 async def save_assessment(assessment: Dict):
     """Save cognitive assessment"""
-    print(f"[DB] Saving assessment: {assessment['type']}")
-    # TODO: Implement
+    await storage.save_assessment(assessment)
 
 async def save_behavior_event(event: Dict):
     """Save behavior event"""
-    print(f"[DB] Saving behavior event: {event['type']}")
-    # TODO: Implement
+    await storage.save_behavior_event(event)
 
 async def save_vital_sign(vital: Dict):
     """Save vital sign"""
-    print(f"[DB] Saving vital: {vital.get('type')}")
-    # TODO: Implement
+    await storage.save_vital_sign(vital)
 
-async def fetch_risk_history(user_id: str, days: int) -> List[Dict]:
+async def fetch_risk_history(user_id: str, days: int, resolution: str = "raw") -> List[Dict]:
     """Fetch risk history from database"""
-    # TODO: Implement actual database query
-    return [
-        {"date": "2026-01-28", "risk_score": 0.35, "risk_level": "medium"},
-        {"date": "2026-01-21", "risk_score": 0.32, "risk_level": "low"},
-        {"date": "2026-01-14", "risk_score": 0.38, "risk_level": "medium"}
-    ]
+    return await storage.fetch_risk_history(user_id, days, resolution)
 
 async def fetch_latest_analysis(user_id: str) -> Optional[Dict]:
-    """Fetch latest analysis for user"""
-    # TODO: Implement
-    return None
+    """
+    Fetch latest analysis for user (push hub first, which reads shared
+    state when configured, then storage)
+    """
+    latest = push_hub.latest(user_id)
+    if latest is None:
+        latest = await storage.fetch_latest_analysis(user_id)
+        if latest is not None:
+            push_hub.remember(latest)
+            await share_latest([latest])
+    return latest
+
+async def share_latest(results: List[Dict]):
+    """Make results the latest analyses every worker reads (one write transaction)"""
+    if shared_state is None or not results:
+        return
+    items = [(result['user_id'], dumps(result)) for result in results]
+    await asyncio.get_running_loop().run_in_executor(None, shared_state.put_many, LATEST_NAMESPACE, items)
 
 def generate_id() -> str:
     """Generate unique ID"""
@@ -0,0 +1,351 @@
+"""
+Benchmark harness for the orchestration pipeline and API
+
+Run from the repository root:
+    python -m benchmarks.bench_orchestration --size 5000 --output bench.json
+    python -m benchmarks.bench_orchestration --compare bench.json
+
+Reports p50/p95/p99 latency, rows/sec, CPU time per row and peak RSS per
+benchmark as JSON.
+"""
+
+from typing import Callable, Dict, Iterable, List, Optional
+from datetime import datetime, timedelta
+import argparse
+import asyncio
+import json
+import os
+import platform
+import resource
+import sys
+import time
+
+import numpy as np
+
+try:
+    import msgpack
+except ImportError:  # Optional: msgpack benchmarks are skipped
+    msgpack = None
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from services.orchestrationService import (
+    BiomarkerMapper,
+    CellularSignatureCalculator,
+    OrchestrationService,
+    RecommendationEngine,
+)
+
+
+# Synthetic cohort generators
+
+def generate_cohort(size: int, seed: int = 42) -> Dict[str, np.ndarray]:
+    """Columnar synthetic cohort covering low, medium and high risk profiles"""
+    rng = np.random.default_rng(seed)
+    return {
+        "sleep_efficiency": rng.uniform(0.45, 0.98, size).round(2),
+        "sleep_interruptions": rng.integers(0, 8, size),
+        "hrv": rng.uniform(15, 80, size).round(1),
+        "resting_hr": rng.uniform(50, 100, size).round(0),
+        "cognitive_score": rng.uniform(30, 100, size).round(0),
+        "reaction_time": rng.uniform(300, 1200, size).round(0),
+        "errors": rng.integers(0, 12, size),
+        "steps": rng.integers(500, 15000, size),
+        "active_minutes": rng.integers(0, 90, size),
+    }
+
+
+def cohort_records(cohort: Dict[str, np.ndarray], users: int = 1000) -> List[Dict]:
+    """Row-oriented BIA payloads for a columnar cohort"""
+    size = len(next(iter(cohort.values())))
+    start = datetime(2026, 1, 1)
+    columns = {name: values.tolist() for name, values in cohort.items()}
+    records = []
+    for i in range(size):
+        record = {name: values[i] for name, values in columns.items()}
+        record["user_id"] = f"user{i % users}"
+        record["timestamp"] = (start + timedelta(hours=i)).isoformat()
+        records.append(record)
+    return records
+
+
+# Measurement helpers
+
+def peak_rss_mb() -> float:
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in kilobytes on Linux and bytes on macOS
+    return round(peak / (1024 * 1024 if sys.platform == "darwin" else 1024), 1)
+
+
+def summarize(name: str, samples_ns: List[int], rows: int, total_s: float, cpu_s: Optional[float] = None) -> Dict:
+    latencies = np.asarray(samples_ns, dtype=np.float64) / 1e3
+    p50, p95, p99 = np.percentile(latencies, [50, 95, 99])
+    return {
+        "name": name,
+        "calls": len(samples_ns),
+        "rows": rows,
+        "total_s": round(total_s, 4),
+        "rows_per_sec": round(rows / total_s, 1) if total_s else None,
+        "cpu_us_per_row": round(cpu_s / rows * 1e6, 2) if cpu_s is not None and rows else None,
+        "latency_us": {
+            "p50": round(float(p50), 2),
+            "p95": round(float(p95), 2),
+            "p99": round(float(p99), 2),
+            "mean": round(float(latencies.mean()), 2),
+        },
+        "peak_rss_mb": peak_rss_mb(),
+    }
+
+
+def measure(name: str, fn: Callable, inputs: Iterable, rows_per_call: int = 1) -> Dict:
+    """Time fn(item) for every item"""
+    samples = []
+    clock = time.perf_counter_ns
+    cpu_start = time.process_time()
+    start = clock()
+    for item in inputs:
+        t0 = clock()
+        fn(item)
+        samples.append(clock() - t0)
+    total = (clock() - start) / 1e9
+    cpu = time.process_time() - cpu_start
+    return summarize(name, samples, len(samples) * rows_per_call, total, cpu)
+
+
+async def measure_async(name: str, fn: Callable, inputs: Iterable, rows_per_call: int = 1) -> Dict:
+    """Time await fn(item) for every item (CPU time covers client and server)"""
+    samples = []
+    clock = time.perf_counter_ns
+    cpu_start = time.process_time()
+    start = clock()
+    for item in inputs:
+        t0 = clock()
+        await fn(item)
+        samples.append(clock() - t0)
+    total = (clock() - start) / 1e9
+    cpu = time.process_time() - cpu_start
+    return summarize(name, samples, len(samples) * rows_per_call, total, cpu)
+
+
+# Benchmarks
+
+def bench_pipeline(size: int, seed: int) -> List[Dict]:
+    cohort = generate_cohort(size, seed)
+    records = cohort_records(cohort)
+    mapper = BiomarkerMapper()
+    calculator = CellularSignatureCalculator()
+    results = []
+
+    results.append(measure(
+        "mapper.map_sleep_to_microglial_activation",
+        lambda r: mapper.map_sleep_to_microglial_activation(r["sleep_efficiency"], r["sleep_interruptions"]),
+        records
+    ))
+    results.append(measure(
+        "mapper.map_hrv_to_inflammatory_state",
+        lambda r: mapper.map_hrv_to_inflammatory_state(r["hrv"], r["resting_hr"]),
+        records
+    ))
+    results.append(measure(
+        "mapper.map_cognitive_to_neuronal_health",
+        lambda r: mapper.map_cognitive_to_neuronal_health(r["cognitive_score"], r["reaction_time"], r["errors"]),
+        records
+    ))
+    results.append(measure(
+        "mapper.map_activity_to_metabolic_health",
+        lambda r: mapper.map_activity_to_metabolic_health(r["steps"], r["active_minutes"]),
+        records
+    ))
+
+    results.append(measure("signature.calculate_signature", calculator.calculate_signature, records))
+
+    batch_size = min(size, 10000)
+    chunks = [
+        {name: values[i:i + batch_size] for name, values in cohort.items()}
+        for i in range(0, size - batch_size + 1, batch_size)
+    ]
+    results.append(measure(
+        "signature.calculate_signatures_batch",
+        calculator.calculate_signatures_batch,
+        chunks,
+        rows_per_call=batch_size
+    ))
+
+    signatures = [calculator.calculate_signature(r) for r in records]
+    results.append(measure(
+        "recommendations.generate_recommendations",
+        lambda i: RecommendationEngine.generate_recommendations(signatures[i], records[i]),
+        range(size)
+    ))
+
+    service = OrchestrationService()
+    results.append(measure("orchestration.orchestrate", service.orchestrate, records))
+    return results
+
+
+async def bench_api(size: int, seed: int) -> List[Dict]:
+    try:
+        import httpx
+    except ImportError:
+        print("httpx not installed; skipping API benchmarks", file=sys.stderr)
+        return []
+
+    os.environ.setdefault("BIA_DATABASE_URL", "sqlite:///:memory:")
+    os.environ.setdefault("BIA_SIGNATURE_INDEX_DIR", "")
+    os.environ.setdefault("BIA_HISTORY_DIR", "")
+    os.environ.setdefault("BIA_JOB_QUEUE_PATH", "")
+    os.environ.setdefault("BIA_SCHEDULER_PATH", "")
+    import backend_api
+
+    records = cohort_records(generate_cohort(size, seed))
+    app = backend_api.app
+    results = bench_codec(backend_api, records)
+
+    async with app.router.lifespan_context(app):
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+            async def get_health(_):
+                (await client.get("/health")).raise_for_status()
+
+            async def post_orchestrate(record):
+                (await client.post("/api/v1/orchestrate", json=record)).raise_for_status()
+
+            async def post_orchestrate_msgpack(body):
+                response = await client.post(
+                    "/api/v1/orchestrate",
+                    content=body,
+                    headers={"content-type": "application/msgpack", "accept": "application/msgpack"}
+                )
+                response.raise_for_status()
+
+            async def post_batch(chunk):
+                body = "".join(json.dumps(r) + "\n" for r in chunk)
+                response = await client.post(
+                    "/api/v1/orchestrate/batch",
+                    content=body,
+                    headers={"content-type": "application/x-ndjson"}
+                )
+                response.raise_for_status()
+
+            results.append(await measure_async("api.GET /health", get_health, range(min(size, 1000))))
+            results.append(await measure_async("api.POST /api/v1/orchestrate", post_orchestrate, records))
+            if msgpack is not None:
+                results.append(await measure_async(
+                    "api.POST /api/v1/orchestrate (msgpack)",
+                    post_orchestrate_msgpack,
+                    [msgpack.packb(r) for r in records]
+                ))
+
+            batch_size = min(size, 1000)
+            chunks = [records[i:i + batch_size] for i in range(0, size - batch_size + 1, batch_size)]
+            results.append(await measure_async(
+                "api.POST /api/v1/orchestrate/batch",
+                post_batch,
+                chunks,
+                rows_per_call=batch_size
+            ))
+    return results
+
+
+def bench_codec(backend_api, records: List[Dict]) -> List[Dict]:
+    """
+    Request decode + response encode cost per orchestrate call, without the
+    HTTP stack: the FastAPI model path (json.loads, BIADataRequest, .dict(),
+    OrchestrationResponse re-validation, stdlib json.dumps) against the fast
+    path the endpoint now uses (pydantic-core JSON parsing, codec encoding)
+    """
+    from services import codecService
+
+    service = OrchestrationService()
+    pairs = [(json.dumps(r).encode("utf-8"), service.orchestrate(r)) for r in records]
+    BIADataRequest = backend_api.BIADataRequest
+    OrchestrationResponse = backend_api.OrchestrationResponse
+
+    def legacy(pair):
+        body, result = pair
+        BIADataRequest(**json.loads(body)).model_dump(exclude_unset=True)
+        content = OrchestrationResponse.model_validate(result).model_dump(mode="json")
+        json.dumps(content, ensure_ascii=False, allow_nan=False, separators=(",", ":")).encode("utf-8")
+
+    def fast(pair):
+        body, result = pair
+        BIADataRequest.model_validate_json(body).model_dump(exclude_unset=True)
+        codecService.dumps(result)
+
+    results = [
+        measure("codec.orchestrate_roundtrip (fastapi models)", legacy, pairs),
+        measure("codec.orchestrate_roundtrip (fast path)", fast, pairs),
+    ]
+    if msgpack is not None:
+        packed = [(msgpack.packb(json.loads(body)), result) for body, result in pairs]
+        results.append(measure(
+            "codec.orchestrate_roundtrip (msgpack)",
+            lambda pair: (
+                BIADataRequest.model_validate(codecService.decode_body(pair[0], codecService.MSGPACK_CONTENT_TYPE)),
+                codecService.encode(pair[1], codecService.MSGPACK_CONTENT_TYPE)
+            ),
+            packed
+        ))
+    return results
+
+
+def compare(current: Dict, baseline: Dict) -> List[str]:
+    """Human-readable p50 and throughput deltas against a previous run"""
+    previous = {b["name"]: b for b in baseline.get("benchmarks", [])}
+    lines = []
+    for bench in current["benchmarks"]:
+        before = previous.get(bench["name"])
+        if not before or not before.get("rows_per_sec"):
+            continue
+        speedup = bench["rows_per_sec"] / before["rows_per_sec"]
+        line = (
+            f"{bench['name']:<45} p50 {before['latency_us']['p50']:>9.2f} -> "
+            f"{bench['latency_us']['p50']:>9.2f} us   throughput x{speedup:.2f}"
+        )
+        if before.get("cpu_us_per_row") and bench.get("cpu_us_per_row"):
+            line += f"   cpu/row {before['cpu_us_per_row']:.2f} -> {bench['cpu_us_per_row']:.2f} us"
+        lines.append(line)
+    return lines
+
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description="Benchmark the orchestration pipeline")
+    parser.add_argument("--size", type=int, default=5000, help="Synthetic cohort size")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--skip-api", action="store_true", help="Only benchmark in-process functions")
+    parser.add_argument("--output", help="Write JSON results to this file instead of stdout")
+    parser.add_argument("--compare", help="Previous JSON results to compare against")
+    args = parser.parse_args(argv)
+
+    benchmarks = bench_pipeline(args.size, args.seed)
+    if not args.skip_api:
+        benchmarks += asyncio.run(bench_api(args.size, args.seed))
+
+    report = {
+        "meta": {
+            "timestamp": datetime.now().isoformat(),
+            "python": platform.python_version(),
+            "numpy": np.__version__,
+            "platform": platform.platform(),
+            "size": args.size,
+            "seed": args.seed,
+        },
+        "benchmarks": benchmarks,
+        "peak_rss_mb": peak_rss_mb(),
+    }
+
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(output + "\n")
+    else:
+        print(output)
+
+    if args.compare:
+        with open(args.compare) as f:
+            for line in compare(report, json.load(f)):
+                print(line, file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
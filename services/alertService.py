@@ -0,0 +1,254 @@
+"""
+Streaming alert engine
+Turns per-analysis alert conditions and behavior events into caregiver
+notifications, emitted only when a user's alert state changes
+"""
+
+from typing import Dict, List, Optional, Set
+from datetime import datetime
+import asyncio
+import time
+
+from services.metricsService import REGISTRY
+
+SEVERITIES = ("low", "medium", "high", "critical")
+
+# Behavior events are reported with a 1-5 severity
+BEHAVIOR_SEVERITY = {1: "low", 2: "medium", 3: "medium", 4: "high", 5: "high"}
+
+BEHAVIOR_MESSAGES = {
+    "confusion": "Episódios de confusão registrados.",
+    "agitation": "Episódios de agitação registrados.",
+    "wandering": "Episódio de perambulação registrado.",
+    "fall": "Queda registrada.",
+}
+
+NOTIFICATIONS = REGISTRY.counter(
+    "bia_alert_notifications",
+    "Alert notifications emitted, by status",
+    labelnames=("status",)
+)
+SUPPRESSED = REGISTRY.counter(
+    "bia_alert_suppressed",
+    "Alert occurrences suppressed as duplicates"
+)
+
+
+class ActiveAlert:
+    """State of one open alert type for one user"""
+
+    __slots__ = ("severity", "base_severity", "message", "source", "occurrences", "recent", "notified_at", "escalated")
+
+    def __init__(self, severity: str, message: str, source: str, now: float):
+        self.severity = severity
+        self.base_severity = severity
+        self.message = message
+        self.source = source
+        self.occurrences = 0
+        # Occurrence times within the escalation window
+        self.recent: List[float] = []
+        self.notified_at = now
+        self.escalated = False
+
+
+class AlertSubscription:
+    """Queue of notifications for one subscriber (one user, or every user with None)"""
+
+    def __init__(self, engine: "AlertEngine", user_id: Optional[str], max_queue: int):
+        self.engine = engine
+        self.user_id = user_id
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=max_queue)
+        self.dropped = 0
+
+    def push(self, notification: Dict):
+        if self.queue.full():
+            # Slow subscriber: drop its oldest notification rather than block producers
+            self.queue.get_nowait()
+            self.dropped += 1
+        self.queue.put_nowait(notification)
+
+    async def get(self) -> Dict:
+        return await self.queue.get()
+
+    def close(self):
+        self.engine.unsubscribe(self)
+
+
+class AlertEngine:
+    """
+    Per-user alert state machine with deduplication, escalation and fan-out
+
+    For every (user, alert type):
+        raised     - first occurrence, or the condition came back after resolving
+        suppressed - repeated within dedupe_window of the last notification
+                     (counted, not emitted)
+        reminder   - still occurring after dedupe_window
+        escalated  - escalation_count occurrences within escalation_window;
+                     severity moves one step up, once per open alert
+        resolved   - an analysis no longer reports the condition, or a
+                     behavior alert saw no new events for dedupe_window
+
+    Notifications are pushed to subscriber queues, so their cost scales
+    with alert state changes rather than with request volume.
+    """
+
+    def __init__(
+        self,
+        dedupe_window: float = 6 * 3600,
+        escalation_count: int = 3,
+        escalation_window: float = 24 * 3600,
+        max_queue: int = 1000
+    ):
+        self.dedupe_window = dedupe_window
+        self.escalation_count = escalation_count
+        self.escalation_window = escalation_window
+        self.max_queue = max_queue
+        self.suppressed = 0
+        self.emitted = 0
+        self._active: Dict[str, Dict[str, ActiveAlert]] = {}
+        self._subscribers: Dict[Optional[str], Set[AlertSubscription]] = {}
+
+    # Inputs
+
+    def process_result(self, result: Dict, now: Optional[float] = None) -> List[Dict]:
+        """Consume an orchestration result; returns the notifications it caused"""
+        now = time.time() if now is None else now
+        user_id = result.get("user_id")
+        if user_id is None:
+            return []
+        notifications = []
+        seen = set()
+        for alert in result.get("alerts", []):
+            seen.add(alert["type"])
+            notification = self._occur(user_id, alert["type"], alert["severity"], alert["message"], "analysis", now)
+            if notification is not None:
+                notifications.append(notification)
+
+        # Analysis conditions that no longer hold are resolved
+        active = self._active.get(user_id, {})
+        for alert_type in [t for t, a in active.items() if a.source == "analysis" and t not in seen]:
+            notifications.append(self._resolve(user_id, alert_type, now))
+        notifications.extend(self._expire(user_id, now))
+        return notifications
+
+    def process_behavior_event(self, event: Dict, now: Optional[float] = None) -> List[Dict]:
+        """Consume a caregiver-reported behavior event"""
+        now = time.time() if now is None else now
+        user_id = event["user_id"]
+        event_type = event.get("type") or "unknown"
+        severity = BEHAVIOR_SEVERITY.get(int(event.get("severity") or 1), "high")
+        message = BEHAVIOR_MESSAGES.get(event_type, f"Evento de comportamento registrado: {event_type}.")
+
+        notifications = self._expire(user_id, now)
+        notification = self._occur(user_id, f"behavior_{event_type}", severity, message, "behavior", now)
+        if notification is not None:
+            notifications.append(notification)
+        return notifications
+
+    # State transitions
+
+    def _occur(self, user_id: str, alert_type: str, severity: str, message: str, source: str, now: float) -> Optional[Dict]:
+        alerts = self._active.setdefault(user_id, {})
+        alert = alerts.get(alert_type)
+        if alert is None:
+            alert = alerts[alert_type] = ActiveAlert(severity, message, source, now)
+            alert.occurrences = 1
+            alert.recent.append(now)
+            return self._emit(user_id, alert_type, alert, "raised", now)
+
+        alert.occurrences += 1
+        alert.recent.append(now)
+        cutoff = now - self.escalation_window
+        while alert.recent and alert.recent[0] < cutoff:
+            alert.recent.pop(0)
+        if SEVERITIES.index(severity) > SEVERITIES.index(alert.base_severity):
+            alert.base_severity = severity
+            if SEVERITIES.index(severity) > SEVERITIES.index(alert.severity):
+                alert.severity = severity
+                alert.message = message
+                return self._emit(user_id, alert_type, alert, "escalated", now)
+
+        if not alert.escalated and len(alert.recent) >= self.escalation_count:
+            alert.escalated = True
+            alert.severity = SEVERITIES[min(SEVERITIES.index(alert.severity) + 1, len(SEVERITIES) - 1)]
+            return self._emit(user_id, alert_type, alert, "escalated", now)
+
+        if now - alert.notified_at >= self.dedupe_window:
+            return self._emit(user_id, alert_type, alert, "reminder", now)
+
+        self.suppressed += 1
+        SUPPRESSED.inc()
+        return None
+
+    def _resolve(self, user_id: str, alert_type: str, now: float) -> Dict:
+        alerts = self._active[user_id]
+        alert = alerts.pop(alert_type)
+        if not alerts:
+            del self._active[user_id]
+        return self._emit(user_id, alert_type, alert, "resolved", now)
+
+    def _expire(self, user_id: str, now: float) -> List[Dict]:
+        """Resolve behavior alerts that have been quiet for a full dedupe window"""
+        active = self._active.get(user_id, {})
+        stale = [
+            alert_type for alert_type, alert in active.items()
+            if alert.source == "behavior" and now - alert.recent[-1] >= self.dedupe_window
+        ]
+        return [self._resolve(user_id, alert_type, now) for alert_type in stale]
+
+    def _emit(self, user_id: str, alert_type: str, alert: ActiveAlert, status: str, now: float) -> Dict:
+        alert.notified_at = now
+        notification = {
+            "user_id": user_id,
+            "type": alert_type,
+            "status": status,
+            "severity": alert.severity,
+            "message": alert.message,
+            "occurrences": alert.occurrences,
+            "timestamp": datetime.fromtimestamp(now).isoformat(),
+        }
+        self.emitted += 1
+        NOTIFICATIONS.inc(status)
+        for key in (user_id, None):
+            for subscription in self._subscribers.get(key, ()):
+                subscription.push(notification)
+        return notification
+
+    # Fan-out
+
+    def subscribe(self, user_id: Optional[str] = None) -> AlertSubscription:
+        """Notifications for one user, or for every user when user_id is None"""
+        subscription = AlertSubscription(self, user_id, self.max_queue)
+        self._subscribers.setdefault(user_id, set()).add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription: AlertSubscription):
+        subscribers = self._subscribers.get(subscription.user_id)
+        if subscribers is not None:
+            subscribers.discard(subscription)
+            if not subscribers:
+                del self._subscribers[subscription.user_id]
+
+    # Queries
+
+    def active_alerts(self, user_id: str) -> List[Dict]:
+        return [
+            {
+                "type": alert_type,
+                "severity": alert.severity,
+                "message": alert.message,
+                "occurrences": alert.occurrences,
+                "escalated": alert.escalated,
+                "last_notified": datetime.fromtimestamp(alert.notified_at).isoformat(),
+            }
+            for alert_type, alert in self._active.get(user_id, {}).items()
+        ]
+
+    def stats(self) -> Dict:
+        return {
+            "users_with_alerts": len(self._active),
+            "active_alerts": sum(len(alerts) for alerts in self._active.values()),
+            "subscribers": sum(len(subs) for subs in self._subscribers.values()),
+            "emitted": self.emitted,
+            "suppressed": self.suppressed,
+        }
@@ -0,0 +1,296 @@
+"""
+Assessment scheduler
+Persistent due-time index over every user's next assessment, fed by
+orchestration results, with rate-limited reminder batches
+"""
+
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple
+from datetime import datetime
+import asyncio
+import sqlite3
+import time
+
+from services.metricsService import REGISTRY, STAGE_DURATION
+from services.storageService import AsyncConnectionPool
+
+SCHEDULE_SCHEMA = """
+CREATE TABLE IF NOT EXISTS schedule (
+    user_id TEXT PRIMARY KEY,
+    due_at REAL NOT NULL,
+    risk_level TEXT,
+    reminders INTEGER NOT NULL DEFAULT 0,
+    assessed_at REAL NOT NULL
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS idx_schedule_due ON schedule (due_at);
+"""
+
+REMINDERS_SENT = REGISTRY.counter(
+    "bia_assessment_reminders",
+    "Assessment-due reminders emitted, by risk level",
+    labelnames=("risk_level",)
+)
+RESCHEDULES = REGISTRY.counter(
+    "bia_assessment_reschedules",
+    "Due times written to the assessment schedule"
+)
+
+ReminderHandler = Callable[[List[Dict]], Awaitable[None]]
+
+
+class AssessmentScheduler:
+    """
+    Keeps every user's next_assessment_due in a SQLite table indexed by due
+    time and emits reminders for users who are due
+
+    The B-tree index on due_at is the on-disk priority queue: finding the
+    next reminders is a range scan from its head, O(log n + batch) however
+    many users are scheduled, and after a restart the dispatcher resumes
+    from the persisted index without any rebuild.
+
+    schedule() is synchronous and only buffers the latest due time per user;
+    the buffer is written in one upsert transaction every flush_interval
+    (and before each dispatch), so a user assessed repeatedly costs one row
+    write per flush. A new assessment resets the user's reminder count.
+
+    The dispatcher drains due users with a token bucket of `rate` reminders
+    per second (bursts up to batch_size) and hands each batch to the
+    handler. A reminded user is re-armed repeat_interval later, up to
+    max_reminders times, after which the row is dropped until the next
+    assessment. A failing handler re-arms its batch retry_interval later.
+    """
+
+    def __init__(
+        self,
+        path: str = "suzi_schedule.db",
+        rate: float = 50.0,
+        batch_size: int = 500,
+        repeat_interval: float = 86400.0,
+        max_reminders: int = 3,
+        retry_interval: float = 60.0,
+        flush_interval: float = 1.0
+    ):
+        self.pool = AsyncConnectionPool(path, size=1)
+        self.rate = rate
+        self.batch_size = batch_size
+        self.repeat_interval = repeat_interval
+        self.max_reminders = max_reminders
+        self.retry_interval = retry_interval
+        self.flush_interval = flush_interval
+        self.sent = 0
+        self.failed_batches = 0
+        self.next_due: Optional[float] = None
+        self._handler: Optional[ReminderHandler] = None
+        self._pending: Dict[str, Tuple[float, Optional[str], float]] = {}
+        self._tokens = float(batch_size)
+        self._task: Optional[asyncio.Task] = None
+
+    def set_handler(self, handler: ReminderHandler):
+        """handler(reminders) delivers a batch of reminder dicts"""
+        self._handler = handler
+
+    async def start(self):
+        await self.pool.open()
+        await self.pool.run(self._create_schema)
+        self._task = asyncio.create_task(self._run())
+
+    async def close(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        await self.flush()
+        await self.pool.close()
+
+    @staticmethod
+    def _create_schema(conn: sqlite3.Connection):
+        conn.executescript(SCHEDULE_SCHEMA)
+
+    # Producers
+
+    def schedule(self, user_id: str, due_at: float, risk_level: Optional[str] = None):
+        """Set a user's next due time (epoch seconds); written on the next flush"""
+        self._pending[user_id] = (due_at, risk_level, time.time())
+
+    def schedule_result(self, result: Dict):
+        """Schedule from an orchestration result's next_assessment_due"""
+        user_id = result.get('user_id')
+        due = result.get('next_assessment_due')
+        if user_id is None or due is None:
+            return
+        self.schedule(
+            user_id,
+            datetime.fromisoformat(due).timestamp(),
+            result.get('integrated_risk', {}).get('risk_level')
+        )
+
+    async def flush(self):
+        """Write buffered due times in one transaction"""
+        if not self._pending:
+            return
+        batch, self._pending = self._pending, {}
+        try:
+            with STAGE_DURATION.time("schedule_flush"):
+                await self.pool.run(self._upsert, batch)
+        except Exception:
+            # Keep the batch, minus users rescheduled meanwhile
+            batch.update(self._pending)
+            self._pending = batch
+            raise
+        RESCHEDULES.inc(amount=len(batch))
+
+    @staticmethod
+    def _upsert(conn: sqlite3.Connection, batch: Dict[str, Tuple[float, Optional[str], float]]):
+        conn.execute("BEGIN")
+        try:
+            conn.executemany(
+                "INSERT INTO schedule (user_id, due_at, risk_level, reminders, assessed_at) "
+                "VALUES (?, ?, ?, 0, ?) "
+                "ON CONFLICT (user_id) DO UPDATE SET "
+                "due_at = excluded.due_at, risk_level = excluded.risk_level, "
+                "reminders = 0, assessed_at = excluded.assessed_at",
+                [(user_id, due_at, risk, assessed_at) for user_id, (due_at, risk, assessed_at) in batch.items()]
+            )
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+
+    async def get(self, user_id: str) -> Optional[Dict]:
+        """A user's schedule entry"""
+        if user_id in self._pending:
+            due_at, risk_level, assessed_at = self._pending[user_id]
+            return self._entry(user_id, due_at, risk_level, 0, assessed_at)
+        row = await self.pool.run(self._fetch, user_id)
+        return self._entry(*row) if row else None
+
+    @staticmethod
+    def _fetch(conn: sqlite3.Connection, user_id: str):
+        return conn.execute(
+            "SELECT user_id, due_at, risk_level, reminders, assessed_at FROM schedule WHERE user_id = ?",
+            (user_id,)
+        ).fetchone()
+
+    @staticmethod
+    def _entry(user_id: str, due_at: float, risk_level: Optional[str], reminders: int, assessed_at: float) -> Dict:
+        return {
+            "user_id": user_id,
+            "due_at": datetime.fromtimestamp(due_at).isoformat(),
+            "risk_level": risk_level,
+            "reminders_sent": reminders,
+            "last_assessed_at": datetime.fromtimestamp(assessed_at).isoformat(),
+        }
+
+    # Dispatcher
+
+    async def _run(self):
+        last = time.monotonic()
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            now = time.monotonic()
+            self._tokens = min(float(self.batch_size), self._tokens + (now - last) * self.rate)
+            last = now
+            try:
+                await self.flush()
+                await self.dispatch()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f"[Schedule] Dispatch failed: {e}")
+
+    async def dispatch(self) -> int:
+        """Emit one batch of due reminders within the rate budget; returns its size"""
+        limit = int(self._tokens)
+        if self._handler is None or limit < 1:
+            return 0
+        reminders, self.next_due = await self.pool.run(
+            self._claim, time.time(), limit, self.repeat_interval, self.max_reminders
+        )
+        self._tokens -= len(reminders)
+        # Users assessed since the last flush are not due any more; their
+        # buffered due time replaces the re-armed one on the next flush
+        reminders = [reminder for reminder in reminders if reminder["user_id"] not in self._pending]
+        if not reminders:
+            return 0
+        try:
+            with STAGE_DURATION.time("assessment_reminders"):
+                await self._handler(reminders)
+        except Exception:
+            self.failed_batches += 1
+            await self.pool.run(self._retry, reminders, time.time() + self.retry_interval)
+            raise
+        self.sent += len(reminders)
+        for reminder in reminders:
+            REMINDERS_SENT.inc(reminder["risk_level"] or "unknown")
+        return len(reminders)
+
+    @staticmethod
+    def _claim(
+        conn: sqlite3.Connection, now: float, limit: int, repeat_interval: float, max_reminders: int
+    ) -> Tuple[List[Dict], Optional[float]]:
+        """Take the earliest due users and re-arm (or retire) them in one transaction"""
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            rows = conn.execute(
+                "SELECT user_id, due_at, risk_level, reminders, assessed_at FROM schedule "
+                "WHERE due_at <= ? ORDER BY due_at LIMIT ?",
+                (now, limit)
+            ).fetchall()
+            retired = [(row[0],) for row in rows if row[3] + 1 >= max_reminders]
+            rearmed = [(now + repeat_interval, row[0]) for row in rows if row[3] + 1 < max_reminders]
+            conn.executemany("DELETE FROM schedule WHERE user_id = ?", retired)
+            conn.executemany(
+                "UPDATE schedule SET due_at = ?, reminders = reminders + 1 WHERE user_id = ?", rearmed
+            )
+            head = conn.execute("SELECT MIN(due_at) FROM schedule").fetchone()[0]
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        reminders = [
+            {
+                "user_id": user_id,
+                "due_at": datetime.fromtimestamp(due_at).isoformat(),
+                "risk_level": risk_level,
+                "reminder": reminders + 1,
+                "final": reminders + 1 >= max_reminders,
+                "last_assessed_at": datetime.fromtimestamp(assessed_at).isoformat(),
+            }
+            for user_id, due_at, risk_level, reminders, assessed_at in rows
+        ]
+        return reminders, head
+
+    @staticmethod
+    def _retry(conn: sqlite3.Connection, reminders: List[Dict], retry_at: float):
+        """
+        Re-arm an undelivered batch. Retired users are re-inserted; users
+        assessed since their claim keep their new schedule.
+        """
+        conn.execute("BEGIN")
+        try:
+            for reminder in reminders:
+                conn.execute(
+                    "INSERT INTO schedule (user_id, due_at, risk_level, reminders, assessed_at) "
+                    "VALUES (?, ?, ?, ?, ?) "
+                    "ON CONFLICT (user_id) DO UPDATE SET due_at = excluded.due_at, reminders = excluded.reminders "
+                    "WHERE schedule.reminders = excluded.reminders + 1",
+                    (
+                        reminder["user_id"], retry_at, reminder["risk_level"], reminder["reminder"] - 1,
+                        datetime.fromisoformat(reminder["last_assessed_at"]).timestamp()
+                    )
+                )
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+
+    def stats(self) -> Dict:
+        return {
+            "rate_per_second": self.rate,
+            "pending_writes": len(self._pending),
+            "reminders_sent": self.sent,
+            "failed_batches": self.failed_batches,
+            "next_due": datetime.fromtimestamp(self.next_due).isoformat() if self.next_due else None,
+        }
@@ -0,0 +1,273 @@
+"""
+Per-user risk baselines for personalized classification
+Streaming mean/variance (Welford) and median (P²) of each user's signature
+outputs, so risk levels and contributing factors can be judged against the
+user's own history instead of fixed global cut-offs
+"""
+
+from typing import TYPE_CHECKING, Dict, List, Optional
+from array import array
+import math
+import threading
+
+from services.orchestrationService import CONTRIBUTING_FACTORS, RISK_LEVELS
+
+if TYPE_CHECKING:
+    from services.sharedState import SharedStore
+
+# Baseline metrics and the direction in which they mean more risk
+BASELINE_METRICS = {
+    "ad_risk_score": 1,
+    "microglial_activation": 1,
+    "inflammatory_state": 1,
+    "neuronal_health": -1,
+    "metabolic_health": -1,
+}
+
+# Signature dimension behind each contributing factor
+FACTOR_METRICS = {
+    "sleep_quality": "microglial_activation",
+    "systemic_inflammation": "inflammatory_state",
+    "cognitive_decline": "neuronal_health",
+    "sedentary_lifestyle": "metabolic_health",
+}
+
+# Per-metric block layout inside UserBaseline.values:
+# count, Welford mean and M2, then the five P² marker heights and positions
+_COUNT, _MEAN, _M2 = range(3)
+_Q = 3
+_N = 8
+_BLOCK = 13
+
+# P² desired-position increments for the median markers (min, p25, p50, p75, max)
+_P2_INCREMENTS = (0.0, 0.25, 0.5, 0.75, 1.0)
+
+# SharedStore namespace of the per-user baselines
+BASELINE_NAMESPACE = "baseline"
+
+
+class UserBaseline:
+    """
+    Baseline state for one user: a single array('d') of
+    len(BASELINE_METRICS) * 13 doubles (520 bytes)
+    """
+
+    __slots__ = ("values",)
+
+    def __init__(self):
+        self.values = array('d', bytes(8 * len(BASELINE_METRICS) * _BLOCK))
+
+    @classmethod
+    def from_bytes(cls, raw: bytes) -> "UserBaseline":
+        state = cls.__new__(cls)
+        state.values = array('d')
+        state.values.frombytes(raw)
+        return state
+
+
+def _p2_update(v: array, base: int, count: int, x: float):
+    """Fold x into the P² median markers (count includes x)"""
+    q, n = base + _Q, base + _N
+    if count <= 5:
+        # Collect the first five observations, then sort them into markers
+        v[q + count - 1] = x
+        if count == 5:
+            v[q:q + 5] = array('d', sorted(v[q:q + 5]))
+            for i in range(5):
+                v[n + i] = i + 1
+        return
+
+    if x < v[q]:
+        v[q] = x
+        cell = 0
+    elif x >= v[q + 4]:
+        v[q + 4] = x
+        cell = 3
+    else:
+        cell = 0
+        while cell < 3 and x >= v[q + cell + 1]:
+            cell += 1
+    for i in range(cell + 1, 5):
+        v[n + i] += 1
+
+    for i in (1, 2, 3):
+        desired = 1 + (count - 1) * _P2_INCREMENTS[i]
+        d = desired - v[n + i]
+        if (d >= 1 and v[n + i + 1] - v[n + i] > 1) or (d <= -1 and v[n + i - 1] - v[n + i] < -1):
+            d = 1.0 if d > 0 else -1.0
+            qi, qlo, qhi = v[q + i], v[q + i - 1], v[q + i + 1]
+            ni, nlo, nhi = v[n + i], v[n + i - 1], v[n + i + 1]
+            parabolic = qi + d / (nhi - nlo) * (
+                (ni - nlo + d) * (qhi - qi) / (nhi - ni) +
+                (nhi - ni - d) * (qi - qlo) / (ni - nlo)
+            )
+            if qlo < parabolic < qhi:
+                v[q + i] = parabolic
+            else:
+                j = i + int(d)
+                v[q + i] = qi + d * (v[q + j] - qi) / (v[n + j] - ni)
+            v[n + i] += d
+
+
+def _median(v: array, base: int) -> float:
+    count = int(v[base + _COUNT])
+    if count >= 5:
+        return v[base + _Q + 2]
+    collected = sorted(v[base + _Q:base + _Q + count])
+    middle = count // 2
+    return collected[middle] if count % 2 else (collected[middle - 1] + collected[middle]) / 2
+
+
+class BaselineTracker:
+    """
+    Personal baselines and z-score classification, per user
+
+    Each observation is first judged against the user's history so far and
+    only then folded in (O(1): one Welford step and one P² step per metric).
+    The z-score of a metric is its distance from the user's median in units
+    of the user's standard deviation (floored at min_std), signed so that
+    positive always means more risk.
+
+    Until a user has min_observations analyses the global classification is
+    kept. After that:
+        risk_level  - "low"/"medium"/"high" at z < z_medium / < z_high / >= z_high,
+                      kept within one level of the global classification and
+                      always "high" at or above absolute_high
+        factors     - a globally flagged factor is kept only when its
+                      dimension is at least factor_z worse than usual; any
+                      dimension z_high worse than usual is flagged
+
+    With a SharedStore the baselines are shared by every worker process.
+    """
+
+    def __init__(
+        self,
+        min_observations: int = 10,
+        min_std: float = 0.03,
+        z_medium: float = 1.0,
+        z_high: float = 2.0,
+        factor_z: float = 1.0,
+        absolute_high: float = 0.8,
+        store: Optional["SharedStore"] = None
+    ):
+        self.min_observations = min_observations
+        self.min_std = min_std
+        self.z_medium = z_medium
+        self.z_high = z_high
+        self.factor_z = factor_z
+        self.absolute_high = absolute_high
+        self.store = store
+        self._states: Dict[str, UserBaseline] = {}
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._states)
+
+    def personalize(self, user_id: str, signature: Dict) -> Dict:
+        """
+        Signature classified against the user's baseline, which is then
+        updated with it. Returns a new dict; the input (possibly shared with
+        the result cache) is not modified.
+        """
+        observed = {
+            metric: float(signature["ad_risk_score"] if metric == "ad_risk_score" else signature["cellular_signature"][metric])
+            for metric in BASELINE_METRICS
+        }
+        if self.store is not None:
+            def fold(raw: Optional[bytes]):
+                state = UserBaseline.from_bytes(raw) if raw else UserBaseline()
+                assessment = self._observe(state, observed)
+                return state.values.tobytes(), assessment
+            assessment = self.store.update(BASELINE_NAMESPACE, user_id, fold)
+        else:
+            with self._lock:
+                state = self._states.get(user_id)
+                if state is None:
+                    state = self._states[user_id] = UserBaseline()
+                assessment = self._observe(state, observed)
+
+        personalized = dict(signature)
+        personalized["personal_baseline"] = assessment
+        if assessment["status"] == "active":
+            personalized["risk_level"] = self._classify(
+                signature["ad_risk_score"], signature["risk_level"], assessment["z_scores"]["ad_risk_score"]
+            )
+            personalized["contributing_factors"] = self._factors(
+                signature["contributing_factors"], assessment["z_scores"]
+            )
+        return personalized
+
+    def snapshot(self, user_id: str) -> Optional[Dict]:
+        """Current baseline statistics for a user"""
+        if self.store is not None:
+            raw = self.store.get(BASELINE_NAMESPACE, user_id)
+            return self._snapshot(UserBaseline.from_bytes(raw) if raw else None)
+        with self._lock:
+            return self._snapshot(self._states.get(user_id))
+
+    def _snapshot(self, state: Optional[UserBaseline]) -> Optional[Dict]:
+        if state is None:
+            return None
+        return {
+            metric: self._stats(state.values, i * _BLOCK)
+            for i, metric in enumerate(BASELINE_METRICS)
+        }
+
+    def _observe(self, state: UserBaseline, observed: Dict) -> Dict:
+        """Assess against the prior state, then fold the observation in"""
+        assessment = self._assess(state.values, observed)
+        for i, metric in enumerate(BASELINE_METRICS):
+            self._update(state.values, i * _BLOCK, observed[metric])
+        return assessment
+
+    def _update(self, v: array, base: int, x: float):
+        count = v[base + _COUNT] + 1
+        v[base + _COUNT] = count
+        delta = x - v[base + _MEAN]
+        v[base + _MEAN] += delta / count
+        v[base + _M2] += delta * (x - v[base + _MEAN])
+        _p2_update(v, base, int(count), x)
+
+    def _stats(self, v: array, base: int) -> Dict:
+        count = int(v[base + _COUNT])
+        std = math.sqrt(v[base + _M2] / (count - 1)) if count > 1 else 0.0
+        return {
+            "observations": count,
+            "mean": round(v[base + _MEAN], 4),
+            "median": round(_median(v, base), 4) if count else None,
+            "std": round(std, 4),
+        }
+
+    def _assess(self, v: array, observed: Dict) -> Dict:
+        count = int(v[_COUNT])
+        if count < self.min_observations:
+            return {"status": "warming_up", "observations": count}
+
+        z_scores = {}
+        for i, (metric, direction) in enumerate(BASELINE_METRICS.items()):
+            base = i * _BLOCK
+            std = max(math.sqrt(v[base + _M2] / (count - 1)), self.min_std)
+            z_scores[metric] = round(direction * (observed[metric] - _median(v, base)) / std, 3) + 0.0
+        return {
+            "status": "active",
+            "observations": count,
+            "baseline_median": round(_median(v, 0), 4),
+            "baseline_mean": round(v[_MEAN], 4),
+            "baseline_std": round(math.sqrt(v[_M2] / (count - 1)), 4),
+            "z_scores": z_scores,
+        }
+
+    def _classify(self, score: float, global_level: str, z: float) -> str:
+        if score >= self.absolute_high:
+            return "high"
+        personal = 2 if z >= self.z_high else 1 if z >= self.z_medium else 0
+        anchor = RISK_LEVELS.index(global_level)
+        return RISK_LEVELS[min(max(personal, anchor - 1), anchor + 1)]
+
+    def _factors(self, global_factors: List[str], z_scores: Dict) -> List[str]:
+        factors = []
+        for factor in CONTRIBUTING_FACTORS:
+            z = z_scores[FACTOR_METRICS[factor]]
+            if (factor in global_factors and z >= self.factor_z) or z >= self.z_high:
+                factors.append(factor)
+        return factors
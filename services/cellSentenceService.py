@@ -0,0 +1,333 @@
+"""
+Cell sentences from sparse scRNA-seq matrices (Phase 3)
+Chunked CSR reading, vectorized per-cell top-k gene ranking and streaming
+of token id batches into the embedding stage
+"""
+
+from typing import Iterator, List, Optional, Sequence, Tuple
+import argparse
+import os
+import struct
+import zipfile
+
+import numpy as np
+
+from services.embeddingService import PAD_ID, EmbeddingService, create_embedding_service, pad_batch
+from services.metricsService import STAGE_DURATION
+
+try:
+    import h5py
+except ImportError:  # Optional: only needed for .h5ad input
+    h5py = None
+
+# Size of the fixed part of a zip local file header
+_ZIP_LOCAL_HEADER = struct.Struct("<4s2B4HL2L2H")
+
+
+class CSRMatrix:
+    """
+    Cells x genes expression matrix in CSR form
+
+    data, indices and indptr may be memory-mapped arrays or lazily read
+    h5py datasets; only row_block() slices them, so a chunk is the only
+    part of the matrix ever held in memory.
+    """
+
+    def __init__(self, data, indices, indptr, shape: Tuple[int, int], gene_names: Optional[Sequence[str]] = None):
+        self.data = data
+        self.indices = indices
+        self.indptr = indptr
+        self.shape = (int(shape[0]), int(shape[1]))
+        self.gene_names = list(gene_names) if gene_names is not None else None
+        if len(indptr) != self.shape[0] + 1:
+            raise ValueError(f"indptr has {len(indptr)} entries for {self.shape[0]} rows")
+        if self.gene_names is not None and len(self.gene_names) != self.shape[1]:
+            raise ValueError(f"{len(self.gene_names)} gene names for {self.shape[1]} columns")
+
+    @property
+    def n_cells(self) -> int:
+        return self.shape[0]
+
+    def row_block(self, start: int, stop: int) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """
+        Rows [start, stop) as in-memory (data, indices, offsets), offsets
+        rebased so the block starts at 0
+        """
+        indptr = np.asarray(self.indptr[start:stop + 1], dtype=np.int64)
+        lo, hi = int(indptr[0]), int(indptr[-1])
+        return (
+            np.asarray(self.data[lo:hi]),
+            np.asarray(self.indices[lo:hi]),
+            indptr - lo
+        )
+
+
+def _mmap_npz_member(path: str, archive: zipfile.ZipFile, name: str) -> np.ndarray:
+    """
+    Memory-map one array of an .npz archive
+
+    np.load() ignores mmap_mode for .npz files, so uncompressed members are
+    located inside the zip and mapped directly. Compressed members
+    (np.savez_compressed, scipy save_npz default) have to be read whole.
+    """
+    info = archive.getinfo(name + ".npy")
+    if info.compress_type != zipfile.ZIP_STORED:
+        with archive.open(info) as member:
+            return np.lib.format.read_array(member)
+
+    with open(path, "rb") as f:
+        f.seek(info.header_offset)
+        header = _ZIP_LOCAL_HEADER.unpack(f.read(_ZIP_LOCAL_HEADER.size))
+        name_length, extra_length = header[-2], header[-1]
+        f.seek(info.header_offset + _ZIP_LOCAL_HEADER.size + name_length + extra_length)
+        version = np.lib.format.read_magic(f)
+        if version == (1, 0):
+            shape, fortran_order, dtype = np.lib.format.read_array_header_1_0(f)
+        else:
+            shape, fortran_order, dtype = np.lib.format.read_array_header_2_0(f)
+        offset = f.tell()
+    if not shape or 0 in shape:
+        return np.zeros(shape, dtype=dtype)
+    return np.memmap(path, dtype=dtype, mode="r", offset=offset, shape=shape, order="F" if fortran_order else "C")
+
+
+def load_npz(path: str, gene_names: Optional[Sequence[str]] = None) -> CSRMatrix:
+    """
+    CSR matrix from an .npz written by scipy.sparse.save_npz (or np.savez
+    with data/indices/indptr/shape keys). Gene names come from the
+    argument or an optional "gene_names" array in the archive.
+    """
+    with zipfile.ZipFile(path) as archive:
+        members = {name[:-4] for name in archive.namelist() if name.endswith(".npy")}
+        missing = {"data", "indices", "indptr", "shape"} - members
+        if missing:
+            raise ValueError(f"{path} is not a CSR .npz (missing {', '.join(sorted(missing))})")
+        if "format" in members:
+            matrix_format = np.lib.format.read_array(archive.open("format.npy")).item()
+            matrix_format = matrix_format.decode() if isinstance(matrix_format, bytes) else matrix_format
+            if matrix_format != "csr":
+                raise ValueError(f"{path} holds a {matrix_format} matrix; expected csr")
+        shape = tuple(np.lib.format.read_array(archive.open("shape.npy")))
+        if gene_names is None and "gene_names" in members:
+            gene_names = np.lib.format.read_array(archive.open("gene_names.npy"), allow_pickle=False).astype(str)
+        arrays = {name: _mmap_npz_member(path, archive, name) for name in ("data", "indices", "indptr")}
+    return CSRMatrix(arrays["data"], arrays["indices"], arrays["indptr"], shape, gene_names)
+
+
+def load_h5ad(path: str, gene_names: Optional[Sequence[str]] = None) -> CSRMatrix:
+    """
+    CSR matrix from the X group of an AnnData .h5ad file, read lazily
+    through h5py; gene names default to the var index
+    """
+    if h5py is None:
+        raise RuntimeError(".h5ad input needs h5py installed")
+    f = h5py.File(path, "r")
+    X = f["X"]
+    if not isinstance(X, h5py.Group):
+        raise ValueError(f"{path} stores a dense X; expected a csr_matrix group")
+    encoding = X.attrs.get("encoding-type", "csr_matrix")
+    encoding = encoding.decode() if isinstance(encoding, bytes) else encoding
+    if encoding != "csr_matrix":
+        raise ValueError(f"{path} stores X as {encoding}; expected csr_matrix")
+    shape = X.attrs["shape"] if "shape" in X.attrs else X.attrs["h5sparse_shape"]
+    if gene_names is None and "var" in f:
+        var = f["var"]
+        index_key = var.attrs.get("_index", "_index")
+        index_key = index_key.decode() if isinstance(index_key, bytes) else index_key
+        if index_key in var:
+            gene_names = [
+                name.decode() if isinstance(name, bytes) else str(name)
+                for name in var[index_key][:]
+            ]
+    return CSRMatrix(X["data"], X["indices"], X["indptr"], shape, gene_names)
+
+
+def load_matrix(path: str, gene_names: Optional[Sequence[str]] = None) -> CSRMatrix:
+    """CSR matrix from an .npz or .h5ad file"""
+    if path.endswith(".h5ad"):
+        return load_h5ad(path, gene_names)
+    return load_npz(path, gene_names)
+
+
+def _sort_row_indices(data: np.ndarray, indices: np.ndarray, offsets: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """Order each row's non-zeros by gene index, unless they already are (canonical CSR)"""
+    descending = np.flatnonzero(indices[1:] < indices[:-1]) + 1
+    # A decrease is only allowed where a new row starts
+    if np.isin(descending, offsets, assume_unique=True).all():
+        return data, indices
+    row_of = np.repeat(np.arange(len(offsets) - 1, dtype=np.int64), np.diff(offsets))
+    order = np.argsort((row_of << 32) | indices.astype(np.int64))
+    return data[order], indices[order]
+
+
+def top_genes(data: np.ndarray, indices: np.ndarray, offsets: np.ndarray, k: int) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Per-row top-k genes of a CSR block, highest expression first
+
+    The non-zeros of the block are scattered into a (rows, widest row)
+    matrix padded with -inf, so one partition call finds the k-th highest
+    expression of every row at once; selection is then a vectorized
+    threshold over the flat non-zeros and only the k survivors per row get
+    sorted. Equal expression is ranked by gene index, including at the
+    cut-off, so a cell's sentence does not depend on the chunk it was read
+    in. Explicitly stored zeros are not expressed genes and are skipped.
+
+    Returns:
+        genes: (rows, k) int32 gene indices, -1 past each row's length
+        lengths: (rows,) int32 number of genes per row (<= k)
+    """
+    rows = len(offsets) - 1
+    counts = np.diff(offsets)
+    width = int(counts.max(initial=0))
+    genes = np.full((rows, k), -1, dtype=np.int32)
+    if width == 0 or k == 0:
+        return genes, np.zeros(rows, dtype=np.int32)
+
+    # Non-zeros in gene order within each row, so ties can be cut by position
+    data, indices = _sort_row_indices(data, indices, offsets)
+    row_of = np.repeat(np.arange(rows), counts)
+    values = np.where(data > 0, data, -np.inf).astype(np.float32)
+    keep = values > -np.inf
+
+    if width > k:
+        column = np.arange(len(values)) - np.repeat(offsets[:-1], counts)
+        padded = np.full((rows, width), -np.inf, dtype=np.float32)
+        padded[row_of, column] = values
+        kth = -np.partition(-padded, k - 1, axis=1)[:, k - 1]
+        del padded
+
+        # Keep everything above the k-th value and the lowest-index genes
+        # tied with it until the row holds k
+        threshold = kth[row_of]
+        above = values > threshold
+        tied = keep & (values == threshold)
+        room = k - np.bincount(row_of, weights=above, minlength=rows).astype(np.int64)
+        tied_so_far = np.cumsum(tied)
+        tie_rank = tied_so_far - np.repeat(np.concatenate(([0], tied_so_far))[offsets[:-1]], counts)
+        keep &= above | (tied & (tie_rank <= room[row_of]))
+
+    selected = np.flatnonzero(keep)
+    selected_rows = row_of[selected]
+    lengths = np.bincount(selected_rows, minlength=rows).astype(np.int32)
+    slot = np.arange(len(selected)) - np.repeat(np.cumsum(lengths) - lengths, lengths)
+    top_values = np.full((rows, k), -np.inf, dtype=np.float32)
+    top_values[selected_rows, slot] = values[selected]
+    genes[selected_rows, slot] = indices[selected]
+
+    order = np.lexsort((np.where(genes < 0, np.iinfo(np.int32).max, genes), -top_values), axis=1)
+    return np.take_along_axis(genes, order, axis=1), lengths
+
+
+def iter_top_genes(matrix: CSRMatrix, k: int, chunk_rows: int = 2048) -> Iterator[Tuple[int, np.ndarray, np.ndarray]]:
+    """Yield (first_row, genes, lengths) per chunk of chunk_rows cells"""
+    for start in range(0, matrix.n_cells, chunk_rows):
+        stop = min(start + chunk_rows, matrix.n_cells)
+        with STAGE_DURATION.time("cell_sentence_rank"):
+            data, indices, offsets = matrix.row_block(start, stop)
+            genes, lengths = top_genes(data, indices, offsets, k)
+        yield start, genes, lengths
+
+
+def cell_sentences(matrix: CSRMatrix, k: int, chunk_rows: int = 2048) -> Iterator[List[str]]:
+    """Cell sentences as gene-name lists, one per cell, for inspection and export"""
+    if matrix.gene_names is None:
+        raise ValueError("Cell sentences need gene names")
+    names = np.asarray(matrix.gene_names, dtype=object)
+    for _, genes, lengths in iter_top_genes(matrix, k, chunk_rows):
+        for row, length in zip(genes, lengths):
+            yield names[row[:length]].tolist()
+
+
+class CellSentenceEncoder:
+    """
+    Streams a CSR matrix into token id batches for an embedding model
+
+    Gene indices are translated to token ids with one lookup table built
+    from model.encode_vocabulary(), so a chunk is tokenized with a single
+    fancy-indexing op. Models without a per-gene vocabulary (multi-token
+    gene names) fall back to model.encode() per cell; ranking stays
+    vectorized either way.
+    """
+
+    def __init__(self, service: EmbeddingService, gene_names: Sequence[str], k: Optional[int] = None):
+        self.service = service
+        self.model = service.ensure_loaded()
+        self.gene_names = list(gene_names)
+        self.k = min(k or self.model.max_tokens, self.model.max_tokens)
+        try:
+            vocabulary = self.model.encode_vocabulary(self.gene_names)
+            # Gene index -1 (padding) maps to the extra trailing PAD_ID entry
+            self.vocabulary = np.append(vocabulary.astype(np.int32), np.int32(PAD_ID))
+        except NotImplementedError:
+            self.vocabulary = None
+
+    def tokenize(self, genes: np.ndarray, lengths: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """(token_ids, lengths) padded to the longest sentence of the batch"""
+        width = max(int(lengths.max(initial=0)), 1)
+        if self.vocabulary is not None:
+            return self.vocabulary[genes[:, :width]], lengths
+        names = self.gene_names
+        return pad_batch([
+            self.model.encode([names[g] for g in row[:length]])
+            for row, length in zip(genes, lengths)
+        ])
+
+    def iter_token_batches(
+        self, matrix: CSRMatrix, chunk_rows: int = 2048, batch_size: int = 256
+    ) -> Iterator[Tuple[int, np.ndarray, np.ndarray]]:
+        """Yield (first_row, token_ids, lengths) in batches of batch_size cells"""
+        for start, genes, lengths in iter_top_genes(matrix, self.k, chunk_rows):
+            for offset in range(0, len(lengths), batch_size):
+                end = offset + batch_size
+                token_ids, token_lengths = self.tokenize(genes[offset:end], lengths[offset:end])
+                yield start + offset, token_ids, token_lengths
+
+    def embed_matrix(
+        self,
+        matrix: CSRMatrix,
+        out: Optional[np.ndarray] = None,
+        chunk_rows: int = 2048,
+        batch_size: int = 256
+    ) -> np.ndarray:
+        """
+        Embeddings (cells, dim) for every cell of the matrix
+
+        Pass a memory-mapped `out` (e.g. np.lib.format.open_memmap) to keep
+        peak memory bound by chunk_rows for the output as well.
+        """
+        if out is None:
+            out = np.empty((matrix.n_cells, self.model.dim), dtype=np.float32)
+        for start, token_ids, lengths in self.iter_token_batches(matrix, chunk_rows, batch_size):
+            with STAGE_DURATION.time("cell_sentence_embed"):
+                out[start:start + len(lengths)] = self.service.embed_token_ids(token_ids, lengths)
+        return out
+
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description="Embed every cell of a sparse scRNA-seq matrix")
+    parser.add_argument("matrix", help="CSR matrix (.npz or .h5ad), cells x genes")
+    parser.add_argument("--genes", help="Text file with one gene name per column (default: from the matrix file)")
+    parser.add_argument("--out", required=True, help="Output .npy of (cells, dim) float32 embeddings")
+    parser.add_argument("--model", default=os.getenv("BIA_EMBEDDING_MODEL", "tiny"))
+    parser.add_argument("--top-k", type=int, default=None, help="Genes per cell sentence (default: model max_tokens)")
+    parser.add_argument("--chunk-rows", type=int, default=2048)
+    parser.add_argument("--batch-size", type=int, default=256)
+    args = parser.parse_args(argv)
+
+    gene_names = None
+    if args.genes:
+        with open(args.genes) as f:
+            gene_names = [line.strip() for line in f if line.strip()]
+    matrix = load_matrix(args.matrix, gene_names)
+    if matrix.gene_names is None:
+        parser.error("no gene names in the matrix file; pass --genes")
+
+    encoder = CellSentenceEncoder(create_embedding_service(args.model), matrix.gene_names, args.top_k)
+    out = np.lib.format.open_memmap(args.out, mode="w+", dtype=np.float32, shape=(matrix.n_cells, encoder.model.dim))
+    encoder.embed_matrix(matrix, out, args.chunk_rows, args.batch_size)
+    out.flush()
+    print(f"{matrix.n_cells} cells x {matrix.shape[1]} genes -> {args.out} ({encoder.model.dim} dims, top {encoder.k} genes)")
+
+
+if __name__ == "__main__":
+    main()
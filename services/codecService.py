@@ -0,0 +1,132 @@
+"""
+Wire encoding for the orchestration API
+Fast JSON (orjson when installed) and msgpack bodies with Accept-based
+content negotiation
+"""
+
+from typing import Any, Optional
+import json
+import math
+
+import numpy as np
+from starlette.responses import Response
+
+try:
+    import orjson
+except ImportError:  # Optional: stdlib json is used instead
+    orjson = None
+
+try:
+    import msgpack
+except ImportError:  # Optional: only needed for application/msgpack bodies
+    msgpack = None
+
+JSON_CONTENT_TYPE = "application/json"
+MSGPACK_CONTENT_TYPE = "application/msgpack"
+
+
+class DecodeError(ValueError):
+    """Raised when a request body cannot be decoded (status_code is the HTTP status to answer with)"""
+
+    def __init__(self, message: str, status_code: int = 400):
+        super().__init__(message)
+        self.status_code = status_code
+
+
+def dumps(obj: Any) -> bytes:
+    """Compact UTF-8 JSON bytes; NaN/Infinity become null and numpy values are serialized"""
+    if orjson is not None:
+        return orjson.dumps(obj, option=orjson.OPT_SERIALIZE_NUMPY)
+    return json.dumps(
+        _json_safe(obj), separators=(",", ":"), ensure_ascii=False, allow_nan=False
+    ).encode("utf-8")
+
+
+def _json_safe(obj: Any) -> Any:
+    """What orjson would see: non-finite floats as None, numpy arrays and scalars as Python values"""
+    if isinstance(obj, float):
+        return obj if math.isfinite(obj) else None
+    if isinstance(obj, dict):
+        return {key: _json_safe(value) for key, value in obj.items()}
+    if isinstance(obj, (list, tuple)):
+        return [_json_safe(value) for value in obj]
+    if isinstance(obj, (np.ndarray, np.generic)):
+        return _json_safe(obj.tolist())
+    return obj
+
+
+def loads(data) -> Any:
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data, parse_constant=_reject_constant)
+
+
+def _reject_constant(name: str):
+    # NaN/Infinity are not JSON; orjson rejects them too
+    raise ValueError(f"Invalid JSON constant {name}")
+
+
+def is_msgpack(content_type: str) -> bool:
+    return "msgpack" in content_type
+
+
+def decode_body(body: bytes, content_type: str) -> Any:
+    """Decode a JSON or msgpack request body"""
+    if is_msgpack(content_type):
+        if msgpack is None:
+            raise DecodeError("msgpack bodies are not supported on this server", status_code=415)
+        try:
+            return msgpack.unpackb(body, raw=False)
+        except Exception:
+            raise DecodeError("Invalid msgpack body")
+    try:
+        return loads(body)
+    except ValueError:
+        raise DecodeError("Invalid JSON body")
+
+
+def negotiate(accept: Optional[str]) -> str:
+    """
+    Response media type for an Accept header
+
+    msgpack is chosen only when the client lists it with a higher quality
+    than JSON (or JSON not at all) and msgpack is installed; everything
+    else gets JSON.
+    """
+    if not accept or msgpack is None or "msgpack" not in accept:
+        return JSON_CONTENT_TYPE
+    quality = {}
+    for part in accept.split(","):
+        media_type, *params = [p.strip() for p in part.split(";")]
+        q = 1.0
+        for param in params:
+            if param.startswith("q="):
+                try:
+                    q = float(param[2:])
+                except ValueError:
+                    pass
+        quality[media_type.lower()] = q
+    msgpack_q = max(quality.get(MSGPACK_CONTENT_TYPE, 0), quality.get("application/x-msgpack", 0))
+    json_q = max(quality.get(JSON_CONTENT_TYPE, 0), quality.get("*/*", 0), quality.get("application/*", 0))
+    return MSGPACK_CONTENT_TYPE if msgpack_q > 0 and msgpack_q >= json_q else JSON_CONTENT_TYPE
+
+
+def encode(obj: Any, media_type: str = JSON_CONTENT_TYPE) -> bytes:
+    if media_type == MSGPACK_CONTENT_TYPE:
+        return msgpack.packb(obj, use_bin_type=True)
+    return dumps(obj)
+
+
+class EncodedResponse(Response):
+    """
+    Response for content the service built itself
+
+    FastAPI returns Response instances as-is, so the body skips
+    response_model re-validation and jsonable_encoder; the content is
+    encoded once, as JSON or msgpack depending on media_type.
+    """
+
+    media_type = JSON_CONTENT_TYPE
+
+    def render(self, content: Any) -> bytes:
+        return encode(content, self.media_type)
@@ -0,0 +1,122 @@
+"""
+Trial-level cognitive session features
+Single-pass accumulators over the raw trials of an in-app test, capturing
+the within-session variability that pre-aggregated scores hide
+"""
+
+from typing import Dict, Iterable, Optional
+
+# Features fed into the cellular signature (BIADataRequest field names)
+SESSION_INPUTS = ("rt_cv", "error_bursts", "fatigue_slope")
+
+# Reaction times outside this window (ms) are anticipations or lapses and
+# are left out of the RT statistics
+MIN_REACTION_TIME = 100.0
+MAX_REACTION_TIME = 5000.0
+
+
+class SessionAccumulator:
+    """
+    Online features of one test session, O(1) memory per session
+
+    Every trial is folded in with add(): reaction-time mean and variance
+    use Welford's update, the fatigue slope is the least-squares slope of
+    reaction time over trial number kept as a running co-moment, and error
+    bursts are runs of two or more consecutive errors.
+    """
+
+    __slots__ = (
+        "trials", "errors", "excluded",
+        "rt_count", "rt_mean", "rt_m2",
+        "index_mean", "index_m2", "comoment",
+        "run", "bursts", "longest_run",
+    )
+
+    def __init__(self):
+        self.trials = 0
+        self.errors = 0
+        self.excluded = 0
+        self.rt_count = 0
+        self.rt_mean = 0.0
+        self.rt_m2 = 0.0
+        self.index_mean = 0.0
+        self.index_m2 = 0.0
+        self.comoment = 0.0
+        self.run = 0
+        self.bursts = 0
+        self.longest_run = 0
+
+    def add(self, reaction_time: Optional[float], correct: bool = True):
+        """Fold in one trial (reaction_time None = no response)"""
+        index = float(self.trials)
+        self.trials += 1
+
+        if correct:
+            self.run = 0
+        else:
+            self.errors += 1
+            self.run += 1
+            if self.run == 2:
+                self.bursts += 1
+            self.longest_run = max(self.longest_run, self.run)
+
+        # RT statistics over correct, plausible responses only
+        if not correct or reaction_time is None:
+            return
+        if not MIN_REACTION_TIME <= reaction_time <= MAX_REACTION_TIME:
+            self.excluded += 1
+            return
+        self.rt_count += 1
+        n = self.rt_count
+        delta_rt = reaction_time - self.rt_mean
+        delta_index = index - self.index_mean
+        self.rt_mean += delta_rt / n
+        self.index_mean += delta_index / n
+        self.rt_m2 += delta_rt * (reaction_time - self.rt_mean)
+        self.index_m2 += delta_index * (index - self.index_mean)
+        self.comoment += delta_index * (reaction_time - self.rt_mean)
+
+    def features(self) -> Dict:
+        """Session features; statistics without enough trials are None"""
+        n = self.rt_count
+        variance = self.rt_m2 / (n - 1) if n > 1 else None
+        std = variance ** 0.5 if variance is not None else None
+        return {
+            "trials": self.trials,
+            "errors": self.errors,
+            "error_rate": round(self.errors / self.trials, 3) if self.trials else None,
+            "valid_reaction_times": n,
+            "excluded_reaction_times": self.excluded,
+            "rt_mean": round(self.rt_mean, 1) if n else None,
+            "rt_variance": round(variance, 1) if variance is not None else None,
+            "rt_std": round(std, 1) if std is not None else None,
+            # Intra-individual variability: coefficient of variation of RT
+            "rt_cv": round(std / self.rt_mean, 3) if std is not None else None,
+            "error_bursts": self.bursts,
+            "longest_error_run": self.longest_run,
+            # ms of slowing per trial (positive = fatigue)
+            "fatigue_slope": round(self.comoment / self.index_m2, 2) if n > 2 and self.index_m2 > 0 else None,
+        }
+
+
+def session_features(trials: Iterable[Dict]) -> Dict:
+    """Features of a whole session given as trial dicts"""
+    accumulator = SessionAccumulator()
+    for trial in trials:
+        accumulator.add(trial.get("reaction_time"), trial.get("correct", True))
+    return accumulator.features()
+
+
+def signature_inputs(features: Dict) -> Dict:
+    """The session features BIADataRequest accepts, omitting unavailable ones"""
+    return {name: features[name] for name in SESSION_INPUTS if features.get(name) is not None}
+
+
+def check_trial(trial: Dict) -> Optional[str]:
+    """Error message for a malformed trial, None if it is usable"""
+    reaction_time = trial.get("reaction_time")
+    if reaction_time is not None and (isinstance(reaction_time, bool) or not isinstance(reaction_time, (int, float))):
+        return "reaction_time must be a number of milliseconds or null"
+    if not isinstance(trial.get("correct", True), bool):
+        return "correct must be true or false"
+    return None
@@ -0,0 +1,485 @@
+"""
+Population-level cohort analytics over stored analyses
+Nightly batch job producing risk-level distribution, contributing-factor
+prevalence, age-cohort percentiles and week-over-week movers, written to
+summary tables the API serves directly
+"""
+
+from typing import Dict, List, Optional, Tuple
+from concurrent.futures import ProcessPoolExecutor
+from datetime import date, datetime, timedelta
+import asyncio
+import json
+import sqlite3
+import time
+import warnings
+
+import numpy as np
+
+from services.historyStore import to_epoch_us
+from services.metricsService import STAGE_DURATION
+from services.orchestrationService import CONTRIBUTING_FACTORS, RISK_LEVELS, factors_to_mask
+
+COHORT_SCHEMA = """
+CREATE TABLE IF NOT EXISTS cohort_runs (
+    id INTEGER PRIMARY KEY,
+    computed_at TEXT NOT NULL,
+    summary TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS cohort_user_stats (
+    user_id TEXT PRIMARY KEY,
+    computed_at TEXT NOT NULL,
+    age_band TEXT NOT NULL,
+    ad_risk_score REAL,
+    risk_level TEXT,
+    cohort_percentile REAL,
+    week_delta REAL
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS cohort_claims (
+    run_date TEXT PRIMARY KEY,
+    claimed_at TEXT NOT NULL
+) WITHOUT ROWID;
+"""
+
+# Lower bounds of the age bands; users without an age form their own cohort
+AGE_BAND_EDGES = (50, 60, 70, 80)
+AGE_BANDS = ("<50", "50-59", "60-69", "70-79", "80+", "unknown")
+
+WEEK_US = 7 * 86400 * 1_000_000
+
+# Per-user partial results a partition returns (one entry per user)
+USER_FIELDS = ("latest_ts", "score", "level", "mask", "age", "week_sum", "week_count", "prev_sum", "prev_count")
+
+_LEVEL_CODES = {level: code for code, level in enumerate(RISK_LEVELS)}
+
+
+def parse_timestamps(timestamps: List[str]) -> np.ndarray:
+    """ISO timestamps to epoch microseconds, vectorized for the naive ISO strings we store"""
+    try:
+        with warnings.catch_warnings():
+            # numpy only warns on timezone offsets; parse those exactly instead
+            warnings.simplefilter("error", DeprecationWarning)
+            return np.array(timestamps, dtype="datetime64[us]").astype(np.int64)
+    except (ValueError, DeprecationWarning):
+        return np.fromiter((to_epoch_us(t) for t in timestamps), dtype=np.int64, count=len(timestamps))
+
+
+def _chunk_columns(rows: List[Tuple]) -> Dict[str, np.ndarray]:
+    """Column arrays for (user_id, timestamp, score, level, age, mask, payload) rows"""
+    user_ids, timestamps, scores, levels, ages, masks, payloads = zip(*rows)
+    mask = np.array([-1 if m is None else m for m in masks], dtype=np.int64)
+    # Rows written before factor_mask existed only carry factors in the payload
+    for i in np.flatnonzero(mask < 0).tolist():
+        signature = json.loads(payloads[i]).get("cellular_signature", {})
+        mask[i] = factors_to_mask(signature.get("contributing_factors", []))
+    return {
+        "user_id": np.array(user_ids, dtype=object),
+        "ts": parse_timestamps(list(timestamps)),
+        "score": np.array(scores, dtype=np.float64),
+        "level": np.array([_LEVEL_CODES.get(level, 0) for level in levels], dtype=np.uint8),
+        "age": np.array(ages, dtype=np.float64),
+        "mask": mask.astype(np.uint8),
+    }
+
+
+def _reduce_users(columns: Dict[str, np.ndarray], now_us: int) -> Dict[str, np.ndarray]:
+    """
+    Per-user reductions over rows sorted by (user_id, timestamp)
+
+    Latest values come from each user's last row, the latest known age from
+    their last row with an age, and the weekly sums from bincounts over the
+    user codes.
+    """
+    users = columns["user_id"]
+    n = len(users)
+    starts = np.concatenate(([0], np.flatnonzero(users[1:] != users[:-1]) + 1))
+    last = np.concatenate((starts[1:], [n])) - 1
+    codes = np.repeat(np.arange(len(starts)), np.diff(np.concatenate((starts, [n]))))
+
+    score = columns["score"]
+    valid = ~np.isnan(score)
+    this_week = valid & (columns["ts"] > now_us - WEEK_US)
+    prev_week = valid & (columns["ts"] > now_us - 2 * WEEK_US) & ~this_week
+    filled = np.where(valid, score, 0.0)
+
+    has_age = ~np.isnan(columns["age"])
+    age_row = np.full(len(starts), -1, dtype=np.int64)
+    np.maximum.at(age_row, codes[has_age], np.flatnonzero(has_age))
+
+    size = len(starts)
+    return {
+        "user_id": users[starts],
+        "latest_ts": columns["ts"][last],
+        "score": score[last],
+        "level": columns["level"][last],
+        "mask": columns["mask"][last],
+        "age": np.where(age_row >= 0, columns["age"][age_row], np.nan),
+        "week_sum": np.bincount(codes, weights=filled * this_week, minlength=size),
+        "week_count": np.bincount(codes, weights=this_week, minlength=size),
+        "prev_sum": np.bincount(codes, weights=filled * prev_week, minlength=size),
+        "prev_count": np.bincount(codes, weights=prev_week, minlength=size),
+        "rows": np.bincount(codes, minlength=size),
+    }
+
+
+def _concat(parts: List[Dict[str, np.ndarray]]) -> Dict[str, np.ndarray]:
+    names = ("user_id", "rows") + USER_FIELDS
+    if not parts:
+        empty = {name: np.empty(0) for name in names}
+        empty["user_id"] = np.empty(0, dtype=object)
+        return empty
+    return {name: np.concatenate([part[name] for part in parts]) for name in names}
+
+
+def aggregate_partition(
+    path: str,
+    first_user: Optional[str],
+    end_user: Optional[str],
+    since: str,
+    now_us: int,
+    chunk_rows: int = 50000,
+    conn: Optional[sqlite3.Connection] = None
+) -> Dict[str, np.ndarray]:
+    """
+    Per-user partial aggregates for first_user <= user_id < end_user
+
+    Rows are streamed in chunk_rows batches ordered by (user_id, timestamp),
+    so memory stays bounded by one chunk plus the per-user results. The rows
+    of the last user in a chunk are carried over, because that user's history
+    may continue in the next chunk. Runs in a worker process with its own
+    read-only connection unless conn is given.
+    """
+    own = conn is None
+    if own:
+        conn = sqlite3.connect(f"file:{path}?mode=ro", uri=True)
+    clauses, params = ["timestamp >= ?"], [since]
+    if first_user is not None:
+        clauses.append("user_id >= ?")
+        params.append(first_user)
+    if end_user is not None:
+        clauses.append("user_id < ?")
+        params.append(end_user)
+    cursor = conn.execute(
+        "SELECT user_id, timestamp, ad_risk_score, risk_level, age, factor_mask, "
+        "CASE WHEN factor_mask IS NULL THEN payload END "
+        f"FROM analyses WHERE {' AND '.join(clauses)} ORDER BY user_id, timestamp",
+        params
+    )
+
+    parts = []
+    carry: List[Tuple] = []
+    try:
+        while True:
+            rows = cursor.fetchmany(chunk_rows)
+            if not rows:
+                break
+            rows = carry + rows
+            # Hold back the trailing user, whose rows may continue in the next chunk
+            tail_user = rows[-1][0]
+            split = len(rows)
+            while split > 0 and rows[split - 1][0] == tail_user:
+                split -= 1
+            carry = rows[split:]
+            if split:
+                parts.append(_reduce_users(_chunk_columns(rows[:split]), now_us))
+        if carry:
+            parts.append(_reduce_users(_chunk_columns(carry), now_us))
+    finally:
+        if own:
+            conn.close()
+    return _concat(parts)
+
+
+def summarize_cohort(users: Dict[str, np.ndarray], computed_at: str, window_days: int, movers: int = 10) -> Tuple[Dict, List[Tuple]]:
+    """
+    Population summary plus one cohort_user_stats row per user
+
+    A user's cohort percentile is the share of their age band whose latest
+    ad_risk_score is at or below theirs.
+    """
+    count = len(users["user_id"])
+    scores = users["score"]
+    has_score = ~np.isnan(scores)
+
+    levels = np.bincount(users["level"].astype(np.int64), minlength=len(RISK_LEVELS))
+    risk_distribution = {
+        level: {"count": int(levels[i]), "share": round(float(levels[i]) / count, 4) if count else 0.0}
+        for i, level in enumerate(RISK_LEVELS)
+    }
+
+    masks = users["mask"].astype(np.int64)
+    factor_prevalence = {
+        name: round(float(((masks >> bit) & 1).mean()), 4) if count else 0.0
+        for bit, name in enumerate(CONTRIBUTING_FACTORS)
+    }
+
+    ages = users["age"]
+    bands = np.where(np.isnan(ages), len(AGE_BANDS) - 1, np.digitize(np.nan_to_num(ages), AGE_BAND_EDGES))
+    percentiles = np.full(count, np.nan)
+    age_cohorts = {}
+    for band, label in enumerate(AGE_BANDS):
+        members = np.flatnonzero((bands == band) & has_score)
+        if len(members) == 0:
+            continue
+        band_scores = scores[members]
+        ordered = np.sort(band_scores)
+        percentiles[members] = np.searchsorted(ordered, band_scores, side="right") / len(ordered) * 100
+        p25, p50, p75, p90 = np.percentile(ordered, [25, 50, 75, 90])
+        age_cohorts[label] = {
+            "users": int(len(members)),
+            "mean_risk_score": round(float(ordered.mean()), 4),
+            "p25": round(float(p25), 4),
+            "p50": round(float(p50), 4),
+            "p75": round(float(p75), 4),
+            "p90": round(float(p90), 4),
+        }
+
+    both_weeks = (users["week_count"] > 0) & (users["prev_count"] > 0)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        week_mean = users["week_sum"] / users["week_count"]
+        prev_mean = users["prev_sum"] / users["prev_count"]
+    delta = np.where(both_weeks, week_mean - prev_mean, np.nan)
+
+    def top(indices: np.ndarray) -> List[Dict]:
+        return [
+            {
+                "user_id": users["user_id"][i],
+                "week_mean": round(float(week_mean[i]), 4),
+                "previous_week_mean": round(float(prev_mean[i]), 4),
+                "delta": round(float(delta[i]), 4),
+            }
+            for i in indices.tolist()
+        ]
+
+    movable = np.flatnonzero(both_weeks)
+    k = min(movers, len(movable))
+    if k:
+        deltas = delta[movable]
+        risers = movable[np.argpartition(-deltas, k - 1)[:k]]
+        fallers = movable[np.argpartition(deltas, k - 1)[:k]]
+        risers = risers[np.argsort(-delta[risers])]
+        fallers = fallers[np.argsort(delta[fallers])]
+        risers = risers[delta[risers] > 0]
+        fallers = fallers[delta[fallers] < 0]
+    else:
+        risers = fallers = np.empty(0, dtype=np.int64)
+
+    summary = {
+        "computed_at": computed_at,
+        "window_days": window_days,
+        "users": count,
+        "analyses": int(users["rows"].sum()),
+        "risk_distribution": risk_distribution,
+        "factor_prevalence": factor_prevalence,
+        "age_cohorts": age_cohorts,
+        "movers": {
+            "users_compared": int(len(movable)),
+            "risers": top(risers),
+            "fallers": top(fallers),
+        },
+    }
+
+    rows = [
+        (
+            user_id,
+            computed_at,
+            AGE_BANDS[band],
+            None if np.isnan(score) else round(score, 4),
+            RISK_LEVELS[level],
+            None if np.isnan(pct) else round(pct, 2),
+            None if np.isnan(d) else round(d, 4),
+        )
+        for user_id, band, score, level, pct, d in zip(
+            users["user_id"].tolist(), bands.tolist(), scores.tolist(),
+            users["level"].tolist(), percentiles.tolist(), delta.tolist()
+        )
+    ]
+    return summary, rows
+
+
+class CohortAnalytics:
+    """
+    Nightly cohort statistics job over a SQLiteStorage's analyses table
+
+    Users are split into `partitions` contiguous user_id ranges that are
+    aggregated in parallel by a process pool, each worker streaming its
+    range with its own read-only SQLite connection. The per-user partials
+    are merged with vectorized reductions and the results replace the
+    contents of cohort_user_stats plus a new cohort_runs row, so API reads
+    are single indexed lookups.
+
+    Every API worker schedules the nightly run, but each one first claims
+    the day in cohort_claims and only the worker whose claim lands runs it.
+    """
+
+    def __init__(
+        self,
+        storage,
+        workers: int = 4,
+        partitions: Optional[int] = None,
+        window_days: int = 90,
+        run_hour: int = 3,
+        chunk_rows: int = 50000
+    ):
+        self.storage = storage
+        self.pool = storage.pool
+        self.workers = workers
+        self.partitions = partitions or workers
+        self.window_days = window_days
+        self.run_hour = run_hour
+        self.chunk_rows = chunk_rows
+        self.runs = 0
+        self.last_duration: Optional[float] = None
+        self._lock = asyncio.Lock()
+        self._task: Optional[asyncio.Task] = None
+
+    async def start(self):
+        await self.pool.run(lambda conn: conn.executescript(COHORT_SCHEMA))
+        self._task = asyncio.create_task(self._run())
+
+    async def close(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def _seconds_until_next_run(self) -> float:
+        now = datetime.now()
+        next_run = now.replace(hour=self.run_hour, minute=0, second=0, microsecond=0)
+        if next_run <= now:
+            next_run += timedelta(days=1)
+        return (next_run - now).total_seconds()
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self._seconds_until_next_run())
+            try:
+                claimed = await self.pool.run(self._claim, date.today().isoformat(), datetime.now().isoformat())
+                if claimed:
+                    await self.refresh()
+            except Exception as e:
+                print(f"[Cohort] Nightly run failed: {e}")
+
+    # Job
+
+    async def refresh(self) -> Dict:
+        """Recompute all cohort statistics now; returns the summary"""
+        async with self._lock:
+            started = time.perf_counter()
+            now = datetime.now()
+            computed_at = now.isoformat()
+            since = (now - timedelta(days=self.window_days)).isoformat()
+            now_us = to_epoch_us(computed_at)
+
+            # Include analyses still buffered in the write-behind queue
+            await self.storage.flush()
+            with STAGE_DURATION.time("cohort_aggregate"):
+                users = await self._aggregate(since, now_us)
+            summary, rows = summarize_cohort(users, computed_at, self.window_days)
+            await self.pool.run(self._write, summary, rows)
+
+            self.runs += 1
+            self.last_duration = time.perf_counter() - started
+            return summary
+
+    async def _aggregate(self, since: str, now_us: int) -> Dict[str, np.ndarray]:
+        # A private in-memory database is only visible on its own connection
+        if self.pool.path == ":memory:" or self.workers <= 1:
+            return await self.pool.run(
+                lambda conn: aggregate_partition(self.pool.path, None, None, since, now_us, self.chunk_rows, conn)
+            )
+
+        bounds = await self.pool.run(self._partition_bounds, self.partitions)
+        loop = asyncio.get_running_loop()
+        with ProcessPoolExecutor(max_workers=min(self.workers, len(bounds))) as executor:
+            parts = await asyncio.gather(*(
+                loop.run_in_executor(
+                    executor, aggregate_partition,
+                    self.pool.path, first, end, since, now_us, self.chunk_rows
+                )
+                for first, end in bounds
+            ))
+        # Partitions are disjoint user ranges, so concatenation is the merge
+        return _concat(list(parts))
+
+    @staticmethod
+    def _partition_bounds(conn: sqlite3.Connection, partitions: int) -> List[Tuple[Optional[str], Optional[str]]]:
+        """Split users into contiguous, roughly equal user_id ranges (walks the user_id index)"""
+        users = conn.execute("SELECT COUNT(DISTINCT user_id) FROM analyses").fetchone()[0]
+        partitions = max(1, min(partitions, users))
+        edges = []
+        for i in range(1, partitions):
+            row = conn.execute(
+                "SELECT DISTINCT user_id FROM analyses ORDER BY user_id LIMIT 1 OFFSET ?",
+                (i * users // partitions,)
+            ).fetchone()
+            if row is not None and (not edges or row[0] > edges[-1]):
+                edges.append(row[0])
+        starts = [None] + edges
+        ends = edges + [None]
+        return list(zip(starts, ends))
+
+    @staticmethod
+    def _claim(conn: sqlite3.Connection, run_date: str, claimed_at: str) -> bool:
+        """Claim the nightly run for run_date; exactly one worker's insert succeeds"""
+        cursor = conn.execute(
+            "INSERT OR IGNORE INTO cohort_claims (run_date, claimed_at) VALUES (?, ?)",
+            (run_date, claimed_at)
+        )
+        return cursor.rowcount == 1
+
+    @staticmethod
+    def _write(conn: sqlite3.Connection, summary: Dict, rows: List[Tuple]):
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            conn.execute("DELETE FROM cohort_user_stats")
+            conn.executemany("INSERT INTO cohort_user_stats VALUES (?, ?, ?, ?, ?, ?, ?)", rows)
+            conn.execute(
+                "INSERT INTO cohort_runs (computed_at, summary) VALUES (?, ?)",
+                (summary["computed_at"], json.dumps(summary))
+            )
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+
+    # Reads
+
+    async def summary(self) -> Optional[Dict]:
+        row = await self.pool.run(
+            lambda conn: conn.execute("SELECT summary FROM cohort_runs ORDER BY id DESC LIMIT 1").fetchone()
+        )
+        return json.loads(row[0]) if row else None
+
+    async def user_stats(self, user_id: str) -> Optional[Dict]:
+        row = await self.pool.run(
+            lambda conn: conn.execute(
+                "SELECT computed_at, age_band, ad_risk_score, risk_level, cohort_percentile, week_delta "
+                "FROM cohort_user_stats WHERE user_id = ?",
+                (user_id,)
+            ).fetchone()
+        )
+        if row is None:
+            return None
+        computed_at, age_band, score, level, percentile, delta = row
+        return {
+            "user_id": user_id,
+            "computed_at": computed_at,
+            "age_band": age_band,
+            "ad_risk_score": score,
+            "risk_level": level,
+            "cohort_percentile": percentile,
+            "week_over_week_delta": delta,
+        }
+
+    def stats(self) -> Dict:
+        return {
+            "status": "ok" if self._task is not None else "stopped",
+            "runs": self.runs,
+            "last_duration_s": round(self.last_duration, 3) if self.last_duration is not None else None,
+            "workers": self.workers,
+            "window_days": self.window_days,
+        }
@@ -0,0 +1,297 @@
+"""
+Cell2Sentence embedding service (Phase 3)
+Lazy one-time model loading and dynamic micro-batching for CPU inference
+"""
+
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+import asyncio
+import threading
+import time
+import zlib
+
+import numpy as np
+
+from services.metricsService import STAGE_DURATION
+
+# Token id reserved for padding in every model
+PAD_ID = 0
+
+
+class EmbeddingModel:
+    """
+    Interface for cell-sentence embedding models
+
+    A cell sentence is a list of gene names ranked by expression, highest
+    first. Models map it to token ids with encode() and embed padded id
+    batches with embed().
+    """
+
+    name = "base"
+    dim = 0
+    max_tokens = 0
+
+    def load(self):
+        """Load weights; called once before the first embed()"""
+
+    def encode(self, genes: Sequence[str]) -> np.ndarray:
+        """Token ids (int32, no padding) for one cell sentence"""
+        raise NotImplementedError
+
+    def encode_vocabulary(self, genes: Sequence[str]) -> np.ndarray:
+        """
+        Token id per gene for a whole gene list, so gene-index arrays can be
+        translated with one fancy-indexing op. Only for single-token genes.
+        """
+        raise NotImplementedError
+
+    def embed(self, token_ids: np.ndarray, lengths: np.ndarray) -> np.ndarray:
+        """
+        Args:
+            token_ids: (batch, max_len) int32, padded with PAD_ID
+            lengths: (batch,) number of real tokens per row
+
+        Returns:
+            (batch, dim) float32 L2-normalized embeddings
+        """
+        raise NotImplementedError
+
+
+class TinyEmbeddingModel(EmbeddingModel):
+    """
+    Deterministic stand-in model for tests and development
+
+    Genes are hashed (CRC32, stable across processes) into a fixed
+    vocabulary with a seeded random embedding table. A cell embedding is the
+    rank-weighted mean of its gene vectors, so highly expressed genes
+    dominate, as in the real model.
+    """
+
+    name = "tiny"
+
+    def __init__(self, dim: int = 32, vocab_size: int = 4096, max_tokens: int = 256, seed: int = 0):
+        self.dim = dim
+        self.vocab_size = vocab_size
+        self.max_tokens = max_tokens
+        self.seed = seed
+        self._table: Optional[np.ndarray] = None
+        self._rank_weights = 1.0 / np.log2(np.arange(max_tokens) + 2.0)
+
+    def load(self):
+        rng = np.random.default_rng(self.seed)
+        table = rng.standard_normal((self.vocab_size, self.dim)).astype(np.float32)
+        table[PAD_ID] = 0.0
+        self._table = table
+
+    def _token(self, gene: str) -> int:
+        # Ids 1..vocab_size-1; 0 is padding
+        return 1 + zlib.crc32(gene.upper().encode("utf-8")) % (self.vocab_size - 1)
+
+    def encode(self, genes: Sequence[str]) -> np.ndarray:
+        return np.fromiter(
+            (self._token(gene) for gene in genes[:self.max_tokens]),
+            dtype=np.int32
+        )
+
+    def encode_vocabulary(self, genes: Sequence[str]) -> np.ndarray:
+        return np.fromiter((self._token(gene) for gene in genes), dtype=np.int32, count=len(genes))
+
+    def embed(self, token_ids: np.ndarray, lengths: np.ndarray) -> np.ndarray:
+        width = token_ids.shape[1]
+        weights = np.broadcast_to(self._rank_weights[:width], token_ids.shape).copy()
+        weights[np.arange(width)[None, :] >= lengths[:, None]] = 0.0
+
+        vectors = self._table[token_ids]                     # (batch, width, dim)
+        pooled = np.einsum("bw,bwd->bd", weights, vectors)
+        pooled /= np.maximum(weights.sum(axis=1, keepdims=True), 1e-12)
+        norms = np.linalg.norm(pooled, axis=1, keepdims=True)
+        return (pooled / np.maximum(norms, 1e-12)).astype(np.float32)
+
+
+class Cell2SentenceModel(EmbeddingModel):
+    """
+    Hugging Face Cell2Sentence checkpoint (e.g. vandijklab/C2S-Pythia-410m)
+
+    The cell sentence is fed as space-separated gene names and the last
+    hidden state is mean-pooled over real tokens. torch and transformers
+    are optional dependencies, imported on load().
+    """
+
+    name = "cell2sentence"
+
+    def __init__(self, model_name: str, max_tokens: int = 1024, threads: Optional[int] = None):
+        self.model_name = model_name
+        self.max_tokens = max_tokens
+        self.threads = threads
+        self._torch = None
+        self._tokenizer = None
+        self._model = None
+
+    def load(self):
+        try:
+            import torch
+            from transformers import AutoModel, AutoTokenizer
+        except ImportError as e:
+            raise RuntimeError(
+                "Cell2Sentence embeddings need torch and transformers installed"
+            ) from e
+        if self.threads:
+            torch.set_num_threads(self.threads)
+        self._torch = torch
+        self._tokenizer = AutoTokenizer.from_pretrained(self.model_name)
+        self._model = AutoModel.from_pretrained(self.model_name)
+        self._model.eval()
+        self.dim = self._model.config.hidden_size
+
+    def encode(self, genes: Sequence[str]) -> np.ndarray:
+        ids = self._tokenizer(" ".join(genes), add_special_tokens=False)["input_ids"]
+        return np.asarray(ids[:self.max_tokens], dtype=np.int32)
+
+    def embed(self, token_ids: np.ndarray, lengths: np.ndarray) -> np.ndarray:
+        torch = self._torch
+        mask = np.arange(token_ids.shape[1])[None, :] < lengths[:, None]
+        with torch.inference_mode():
+            output = self._model(
+                input_ids=torch.from_numpy(token_ids.astype(np.int64)),
+                attention_mask=torch.from_numpy(mask.astype(np.int64))
+            )
+            hidden = output.last_hidden_state.float().numpy()
+        pooled = (hidden * mask[:, :, None]).sum(axis=1) / np.maximum(lengths[:, None], 1)
+        norms = np.linalg.norm(pooled, axis=1, keepdims=True)
+        return (pooled / np.maximum(norms, 1e-12)).astype(np.float32)
+
+
+def pad_batch(sequences: Sequence[np.ndarray]) -> Tuple[np.ndarray, np.ndarray]:
+    """Right-pad token id sequences with PAD_ID into one (batch, max_len) array"""
+    lengths = np.fromiter((len(seq) for seq in sequences), dtype=np.int32, count=len(sequences))
+    padded = np.full((len(sequences), max(int(lengths.max(initial=0)), 1)), PAD_ID, dtype=np.int32)
+    for row, seq in enumerate(sequences):
+        padded[row, :len(seq)] = seq
+    return padded, lengths
+
+
+class EmbeddingService:
+    """
+    Embeds cell sentences with a lazily loaded model
+
+    Concurrent embed() calls are coalesced by a micro-batcher: the first
+    request opens a batch, which is dispatched once it holds max_batch_size
+    sentences or max_wait seconds have passed. Each batch is padded to its
+    longest sentence and run on a worker thread, so the model is loaded
+    once and its cost is amortized over every request in the batch.
+    """
+
+    def __init__(
+        self,
+        model_factory: Callable[[], EmbeddingModel],
+        max_batch_size: int = 32,
+        max_wait: float = 0.01
+    ):
+        self.model_factory = model_factory
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait
+        self.model: Optional[EmbeddingModel] = None
+        self.batches = 0
+        self.embedded = 0
+        self._load_lock = threading.Lock()
+        self._queue: Optional[asyncio.Queue] = None
+        self._task: Optional[asyncio.Task] = None
+
+    @property
+    def loaded(self) -> bool:
+        return self.model is not None
+
+    def ensure_loaded(self) -> EmbeddingModel:
+        """Load the model exactly once, whichever caller gets here first"""
+        if self.model is None:
+            with self._load_lock:
+                if self.model is None:
+                    started = time.perf_counter()
+                    model = self.model_factory()
+                    model.load()
+                    STAGE_DURATION.observe(time.perf_counter() - started, "embedding_model_load")
+                    self.model = model
+        return self.model
+
+    async def start(self, warm: bool = True):
+        """Start the micro-batcher; optionally load the model now instead of on first use"""
+        self._queue = asyncio.Queue()
+        self._task = asyncio.create_task(self._run())
+        if warm:
+            await asyncio.get_running_loop().run_in_executor(None, self.ensure_loaded)
+
+    async def close(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def embed(self, genes: Sequence[str]) -> np.ndarray:
+        """Embedding (dim,) for one cell sentence, batched with concurrent callers"""
+        model = self.model
+        if model is None:
+            model = await asyncio.get_running_loop().run_in_executor(None, self.ensure_loaded)
+        future = asyncio.get_running_loop().create_future()
+        await self._queue.put((model.encode(list(genes)), future))
+        return await future
+
+    def embed_token_ids(self, token_ids: np.ndarray, lengths: np.ndarray) -> np.ndarray:
+        """Synchronous batch path for pre-tokenized, pre-padded input"""
+        model = self.ensure_loaded()
+        embeddings = model.embed(token_ids, lengths)
+        self.batches += 1
+        self.embedded += len(lengths)
+        return embeddings
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            pending = [await self._queue.get()]
+            deadline = loop.time() + self.max_wait
+            while len(pending) < self.max_batch_size:
+                remaining = deadline - loop.time()
+                if remaining <= 0:
+                    break
+                try:
+                    pending.append(await asyncio.wait_for(self._queue.get(), remaining))
+                except asyncio.TimeoutError:
+                    break
+
+            token_ids, lengths = pad_batch([ids for ids, _ in pending])
+            try:
+                started = time.perf_counter()
+                embeddings = await loop.run_in_executor(None, self.embed_token_ids, token_ids, lengths)
+                STAGE_DURATION.observe(time.perf_counter() - started, "embedding_batch")
+            except Exception as e:
+                for _, future in pending:
+                    if not future.done():
+                        future.set_exception(e)
+                continue
+            for row, (_, future) in enumerate(pending):
+                if not future.done():
+                    future.set_result(embeddings[row])
+
+    def stats(self) -> Dict:
+        return {
+            "status": "loaded" if self.loaded else "not_loaded",
+            "model": getattr(self.model, "name", None),
+            "dim": getattr(self.model, "dim", None),
+            "batches": self.batches,
+            "embedded": self.embedded,
+            "mean_batch_size": round(self.embedded / self.batches, 2) if self.batches else 0.0,
+        }
+
+
+def create_embedding_service(model_name: Optional[str], **kwargs) -> Optional[EmbeddingService]:
+    """
+    Build the service from a model name
+    "tiny" selects the deterministic stand-in; anything else is treated as
+    a Hugging Face Cell2Sentence checkpoint. None disables Phase 3.
+    """
+    if not model_name:
+        return None
+    if model_name == "tiny":
+        return EmbeddingService(TinyEmbeddingModel, **kwargs)
+    return EmbeddingService(lambda: Cell2SentenceModel(model_name), **kwargs)
@@ -0,0 +1,196 @@
+"""
+Execution layer for CPU-bound orchestration work
+Keeps orchestration off the event loop with bounded queueing
+"""
+
+from typing import Callable, Dict, List, Optional, Tuple
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+import asyncio
+import multiprocessing
+
+from services.baselineService import BaselineTracker
+from services.metricsService import STAGE_DURATION
+from services.orchestrationService import OrchestrationService
+from services.sharedState import SharedStore
+from services.trendService import TrendTracker
+
+EXECUTOR_MODES = ("inline", "thread", "process")
+
+
+class ExecutorSaturated(Exception):
+    """Raised when the executor queue is full and the caller should back off"""
+
+
+def build_worker_service(config: Dict) -> OrchestrationService:
+    """
+    OrchestrationService for a process worker, built from plain settings
+
+    Keys (all optional): shared_state_path, shared_cache_size,
+    personal_baselines, baseline_min_observations. Only this dict crosses
+    the process boundary, so workers start under fork, spawn or forkserver.
+    """
+    store = None
+    if config.get("shared_state_path"):
+        store = SharedStore(config["shared_state_path"], cache_size=config.get("shared_cache_size", 4096))
+    baseline_tracker = None
+    if config.get("personal_baselines"):
+        baseline_tracker = BaselineTracker(config.get("baseline_min_observations", 10), store=store)
+    return OrchestrationService(trend_tracker=TrendTracker(store=store), baseline_tracker=baseline_tracker)
+
+
+# Service instance owned by the current worker process (process mode)
+_worker_service: Optional[OrchestrationService] = None
+
+
+def _init_worker(config: Dict):
+    """Build the worker's service once so loaded models are reused"""
+    global _worker_service
+    # A forked worker inherits the parent's observations; only ship its own
+    STAGE_DURATION.drain()
+    _worker_service = build_worker_service(config)
+
+
+def _worker_warmup() -> bool:
+    return _worker_service is not None
+
+
+# Worker tasks return their stage timings too; the parent merges them so
+# they reach /metrics
+
+def _worker_orchestrate(bia_data: Dict) -> Tuple[Dict, Dict]:
+    return _worker_service.orchestrate(bia_data), STAGE_DURATION.drain()
+
+
+def _worker_orchestrate_many(records: List[Dict]) -> Tuple[List[Tuple[Optional[Dict], Optional[str]]], Dict]:
+    return _orchestrate_many(_worker_service, records), STAGE_DURATION.drain()
+
+
+def _orchestrate_many(
+    service: OrchestrationService,
+    records: List[Dict]
+) -> List[Tuple[Optional[Dict], Optional[str]]]:
+    """Orchestrate several payloads, capturing per-record errors"""
+    outcomes = []
+    for bia_data in records:
+        try:
+            outcomes.append((service.orchestrate(bia_data), None))
+        except Exception as e:
+            outcomes.append((None, str(e)))
+    return outcomes
+
+
+class OrchestrationExecutor:
+    """
+    Dispatches orchestration calls to a worker pool
+
+    Modes:
+        inline  - run on the event loop (development/debugging only)
+        thread  - thread pool sharing `service` and its per-user state
+        process - warm process pool; each worker builds its own service from
+                  `worker_config` (see build_worker_service) once and reuses
+                  it (and any loaded models) for every task. Per-user state
+                  then lives in each worker unless shared state is configured.
+                  `start_method` picks the multiprocessing start method
+                  (default: the platform's).
+
+    At most max_workers + max_queue calls are admitted at once. Beyond
+    that, submit() raises ExecutorSaturated unless asked to wait.
+    """
+
+    def __init__(
+        self,
+        service: OrchestrationService,
+        mode: str = "thread",
+        max_workers: int = 4,
+        max_queue: int = 64,
+        worker_config: Optional[Dict] = None,
+        start_method: Optional[str] = None
+    ):
+        if mode not in EXECUTOR_MODES:
+            raise ValueError(f"Unknown executor mode '{mode}', expected one of {EXECUTOR_MODES}")
+        self.service = service
+        self.mode = mode
+        self.max_workers = max_workers
+        self.max_queue = max_queue
+        self.worker_config = worker_config or {}
+        self.start_method = start_method
+        self.capacity = max_workers + max_queue
+        self.in_flight = 0
+        self.completed = 0
+        self.rejected = 0
+        self._pool = None
+        self._slots: Optional[asyncio.Semaphore] = None
+
+    async def start(self):
+        self._slots = asyncio.Semaphore(self.capacity)
+        if self.mode == "thread":
+            self._pool = ThreadPoolExecutor(
+                max_workers=self.max_workers,
+                thread_name_prefix="orchestrator"
+            )
+        elif self.mode == "process":
+            self._pool = ProcessPoolExecutor(
+                max_workers=self.max_workers,
+                mp_context=multiprocessing.get_context(self.start_method) if self.start_method else None,
+                initializer=_init_worker,
+                initargs=(self.worker_config,)
+            )
+            # Spawn and initialize every worker now rather than on first request
+            loop = asyncio.get_running_loop()
+            await asyncio.gather(*(
+                loop.run_in_executor(self._pool, _worker_warmup)
+                for _ in range(self.max_workers)
+            ))
+
+    async def close(self):
+        if self._pool is not None:
+            self._pool.shutdown(wait=True, cancel_futures=True)
+            self._pool = None
+
+    async def orchestrate(self, bia_data: Dict, wait: bool = False) -> Dict:
+        """Run OrchestrationService.orchestrate for one payload"""
+        if self.mode == "process":
+            result, stages = await self._submit(wait, _worker_orchestrate, bia_data)
+            STAGE_DURATION.merge(stages)
+            return result
+        return await self._submit(wait, self.service.orchestrate, bia_data)
+
+    async def orchestrate_many(
+        self,
+        records: List[Dict],
+        wait: bool = True
+    ) -> List[Tuple[Optional[Dict], Optional[str]]]:
+        """Orchestrate a chunk of payloads as one task, returning (result, error) pairs"""
+        if self.mode == "process":
+            outcomes, stages = await self._submit(wait, _worker_orchestrate_many, records)
+            STAGE_DURATION.merge(stages)
+            return outcomes
+        return await self._submit(wait, _orchestrate_many, self.service, records)
+
+    async def _submit(self, wait: bool, fn: Callable, *args):
+        if not wait and self._slots.locked():
+            self.rejected += 1
+            raise ExecutorSaturated(
+                f"Orchestration queue full ({self.capacity} calls in flight)"
+            )
+
+        async with self._slots:
+            self.in_flight += 1
+            try:
+                if self._pool is None:
+                    return fn(*args)
+                loop = asyncio.get_running_loop()
+                return await loop.run_in_executor(self._pool, fn, *args)
+            finally:
+                self.in_flight -= 1
+                self.completed += 1
+
+    def stats(self) -> Dict:
+        return {
+            "mode": self.mode,
+            "max_workers": self.max_workers,
+            "capacity": self.capacity,
+            "in_flight": self.in_flight,
+            "completed": self.completed,
+            "rejected": self.rejected,
+        }
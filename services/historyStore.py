@@ -0,0 +1,512 @@
+"""
+Columnar per-user history of signature and risk outputs
+Append-only logs sealed into sorted, memory-mapped column segments, with a
+time-range index so long-range dashboard queries only touch the rows they need
+"""
+
+from typing import Dict, List, Optional, Sequence, Tuple
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from urllib.parse import quote, unquote
+import asyncio
+import os
+import threading
+
+import numpy as np
+
+try:
+    import fcntl
+except ImportError:  # Windows: single-process deployments only
+    fcntl = None
+
+from services.metricsService import STAGE_DURATION
+from services.orchestrationService import RISK_LEVELS, factors_to_mask
+
+# Column layout shared by the append log (row records) and sealed segments (column blocks)
+COLUMNS = (
+    ("ts", np.int64),                     # microseconds since the epoch
+    ("ad_risk_score", np.float32),
+    ("overall_score", np.float32),
+    ("microglial_activation", np.float32),
+    ("inflammatory_state", np.float32),
+    ("neuronal_health", np.float32),
+    ("metabolic_health", np.float32),
+    ("risk_level", np.uint8),             # index into RISK_LEVELS
+    ("contributing_factors", np.uint8),   # FACTOR_BITS mask
+)
+RECORD_DTYPE = np.dtype(list(COLUMNS))
+COLUMN_DTYPES = {name: np.dtype(dtype) for name, dtype in COLUMNS}
+
+RESOLUTIONS = ("raw", "daily", "weekly")
+
+DAY_US = 86400 * 1_000_000
+_EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+
+LOG_NAME = "active.log"
+SEALING_NAME = "active.sealing"
+COMPACTION_NAME = "compact.pending"
+LOCK_NAME = "partition.lock"
+GENERATION_NAME = "generation"
+
+
+def to_epoch_us(timestamp: str) -> int:
+    """ISO timestamp to epoch microseconds (naive timestamps are taken as UTC)"""
+    moment = datetime.fromisoformat(timestamp)
+    if moment.tzinfo is None:
+        moment = moment.replace(tzinfo=timezone.utc)
+    delta = moment - _EPOCH
+    return (delta.days * 86400 + delta.seconds) * 1_000_000 + delta.microseconds
+
+
+def from_epoch_us(ts: int) -> datetime:
+    """Epoch microseconds back to a naive (UTC wall clock) datetime"""
+    return datetime.utcfromtimestamp(ts // 1_000_000).replace(microsecond=ts % 1_000_000)
+
+
+def segment_name(first_ts: int, last_ts: int, rows: int) -> str:
+    # Deterministic from content, so re-sealing after a crash is idempotent
+    return f"seg-{first_ts:020d}-{last_ts:020d}-{rows}.col"
+
+
+def parse_segment_name(name: str) -> Optional[Tuple[int, int, int]]:
+    if not (name.startswith("seg-") and name.endswith(".col")):
+        return None
+    first_ts, last_ts, rows = name[4:-4].split("-")
+    return int(first_ts), int(last_ts), int(rows)
+
+
+def write_segment(directory: str, records: np.ndarray) -> str:
+    """
+    Write records (RECORD_DTYPE, sorted by ts) as one column block per field
+    Returns the segment file name
+    """
+    name = segment_name(int(records["ts"][0]), int(records["ts"][-1]), len(records))
+    path = os.path.join(directory, name)
+    if os.path.exists(path):
+        return name
+    tmp = path + ".tmp"
+    with open(tmp, "wb") as f:
+        for column, _ in COLUMNS:
+            f.write(np.ascontiguousarray(records[column]).tobytes())
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, path)
+    return name
+
+
+class Segment:
+    """Sealed, immutable column segment sorted by timestamp"""
+
+    __slots__ = ("path", "first_ts", "last_ts", "rows")
+
+    def __init__(self, path: str, first_ts: int, last_ts: int, rows: int):
+        self.path = path
+        self.first_ts = first_ts
+        self.last_ts = last_ts
+        self.rows = rows
+
+    def column(self, name: str) -> np.memmap:
+        offset = 0
+        for column, _ in COLUMNS:
+            if column == name:
+                break
+            offset += COLUMN_DTYPES[column].itemsize * self.rows
+        return np.memmap(self.path, dtype=COLUMN_DTYPES[name], mode="r", offset=offset, shape=(self.rows,))
+
+    def scan(self, since: int, until: int, columns: Sequence[str]) -> Dict[str, np.ndarray]:
+        """Rows with since <= ts <= until; binary search touches O(log n) pages of ts"""
+        ts = self.column("ts")
+        lo = int(np.searchsorted(ts, since, side="left"))
+        hi = int(np.searchsorted(ts, until, side="right"))
+        return {name: np.array(self.column(name)[lo:hi]) for name in columns}
+
+
+class Partition:
+    """
+    One user's directory: sealed segments plus the row-oriented append log
+
+    Several worker processes may share a partition. locked() pairs the
+    in-process lock with an flock on the directory's lock file (shared for
+    reads, exclusive for appends, seals and compactions), and seals and
+    compactions bump the generation file so other processes re-list the
+    segments before their next read.
+    """
+
+    __slots__ = ("directory", "segments", "lock", "generation")
+
+    def __init__(self, directory: str):
+        self.directory = directory
+        self.segments: List[Segment] = []
+        self.lock = threading.Lock()
+        self.generation: Optional[int] = None
+
+    def path(self, name: str) -> str:
+        return os.path.join(self.directory, name)
+
+    @contextmanager
+    def locked(self, exclusive: bool = True):
+        with self.lock:
+            # Directories are created on first append, so reads never create them
+            if fcntl is None or not os.path.isdir(self.directory):
+                yield
+                return
+            with open(self.path(LOCK_NAME), "a") as f:
+                fcntl.flock(f, fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH)
+                # Closing the file releases the flock
+                yield
+
+    def load(self):
+        """Recover from a crash and list segments; call under locked()"""
+        if not os.path.isdir(self.directory):
+            return
+        self._recover()
+        for name in os.listdir(self.directory):
+            if name.endswith(".tmp"):
+                os.remove(self.path(name))
+        log = self.path(LOG_NAME)
+        if os.path.exists(log):
+            # Drop a torn trailing record so later appends stay aligned
+            size = os.path.getsize(log)
+            if size % RECORD_DTYPE.itemsize:
+                os.truncate(log, size - size % RECORD_DTYPE.itemsize)
+        self.refresh()
+
+    def refresh(self):
+        """Re-list segments if another process sealed or compacted; call under locked()"""
+        generation = self.read_generation()
+        if generation == self.generation:
+            return
+        segments = []
+        if os.path.isdir(self.directory):
+            for name in os.listdir(self.directory):
+                parsed = parse_segment_name(name)
+                if parsed is not None:
+                    segments.append(Segment(self.path(name), *parsed))
+        self.segments = sorted(segments, key=lambda s: s.first_ts)
+        self.generation = generation
+
+    def read_generation(self) -> int:
+        try:
+            with open(self.path(GENERATION_NAME)) as f:
+                return int(f.read() or 0)
+        except FileNotFoundError:
+            return 0
+
+    def bump_generation(self):
+        tmp = self.path(GENERATION_NAME + ".tmp")
+        with open(tmp, "w") as f:
+            f.write(str(self.read_generation() + 1))
+        os.replace(tmp, self.path(GENERATION_NAME))
+
+    def log_rows(self) -> int:
+        try:
+            return os.path.getsize(self.path(LOG_NAME)) // RECORD_DTYPE.itemsize
+        except FileNotFoundError:
+            return 0
+
+    def _recover(self):
+        """
+        Finish a seal or compaction interrupted by a crash; under the exclusive
+        lock these files can only be left over from a process that died
+        """
+        pending = self.path(COMPACTION_NAME)
+        if os.path.exists(pending):
+            with open(pending) as f:
+                merged, *inputs = f.read().split()
+            if os.path.exists(self.path(merged)):
+                for name in inputs:
+                    if os.path.exists(self.path(name)):
+                        os.remove(self.path(name))
+            os.remove(pending)
+        sealing = self.path(SEALING_NAME)
+        if os.path.exists(sealing):
+            records = read_log(sealing)
+            if len(records):
+                write_segment(self.directory, np.sort(records, order="ts", kind="stable"))
+            os.remove(sealing)
+
+    def read_logs(self) -> np.ndarray:
+        parts = [read_log(self.path(name)) for name in (SEALING_NAME, LOG_NAME)]
+        return np.concatenate(parts)
+
+
+def read_log(path: str) -> np.ndarray:
+    if not os.path.exists(path):
+        return np.empty(0, dtype=RECORD_DTYPE)
+    data = np.fromfile(path, dtype=np.uint8)
+    # Ignore a torn trailing record from a crash mid-append
+    usable = len(data) - len(data) % RECORD_DTYPE.itemsize
+    return data[:usable].view(RECORD_DTYPE)
+
+
+class HistoryStore:
+    """
+    Append-only, per-user partitioned history of orchestration outputs
+
+    Layout: <root>/<quoted user_id>/
+        active.log              fixed-width RECORD_DTYPE rows, appended per analysis
+        seg-<first>-<last>-<rows>.col
+                                sealed segment: rows sorted by ts, stored as
+                                one contiguous block per column
+        partition.lock          flock target shared by worker processes
+        generation              bumped by every seal and compaction
+
+    Segment file names are the time-range index: a query opens only the
+    segments overlapping its window, binary-searches their ts column and
+    reads just the requested columns of the matching rows. Background
+    maintenance seals append logs of `segment_rows` rows or more and merges
+    small segments once a user has more than `max_segments` of them.
+    """
+
+    def __init__(
+        self,
+        root: str,
+        segment_rows: int = 4096,
+        max_segments: int = 8,
+        target_segment_rows: int = 1 << 18,
+        maintenance_interval: float = 30.0
+    ):
+        self.root = root
+        self.segment_rows = segment_rows
+        self.max_segments = max_segments
+        self.target_segment_rows = target_segment_rows
+        self.maintenance_interval = maintenance_interval
+        self.appended = 0
+        self.seals = 0
+        self.compactions = 0
+        self._partitions: Dict[str, Partition] = {}
+        self._lock = threading.Lock()
+        self._task: Optional[asyncio.Task] = None
+
+    async def start(self):
+        os.makedirs(self.root, exist_ok=True)
+        self._task = asyncio.create_task(self._run())
+
+    async def close(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            await asyncio.sleep(self.maintenance_interval)
+            try:
+                await loop.run_in_executor(None, self.maintain)
+            except Exception as e:
+                print(f"[History] Maintenance failed: {e}")
+
+    def partition(self, user_id: str) -> Partition:
+        with self._lock:
+            partition = self._partitions.get(user_id)
+            if partition is None:
+                partition = Partition(os.path.join(self.root, quote(user_id, safe="")))
+                with partition.locked():
+                    partition.load()
+                self._partitions[user_id] = partition
+            return partition
+
+    def user_ids(self) -> List[str]:
+        if not os.path.isdir(self.root):
+            return []
+        return [unquote(name) for name in os.listdir(self.root)]
+
+    # Writes
+
+    @staticmethod
+    def to_record(result: Dict) -> np.ndarray:
+        """One RECORD_DTYPE row from an orchestration result"""
+        signature = result.get("cellular_signature", {})
+        scores = signature.get("cellular_signature", {})
+        record = np.zeros(1, dtype=RECORD_DTYPE)
+        record["ts"] = to_epoch_us(result["timestamp"])
+        record["ad_risk_score"] = signature.get("ad_risk_score", 0.0)
+        record["overall_score"] = result.get("integrated_risk", {}).get("overall_score", 0.0)
+        for name in ("microglial_activation", "inflammatory_state", "neuronal_health", "metabolic_health"):
+            record[name] = scores.get(name, 0.0)
+        record["risk_level"] = RISK_LEVELS.index(signature.get("risk_level", "low"))
+        record["contributing_factors"] = factors_to_mask(signature.get("contributing_factors", []))
+        return record
+
+    def append(self, result: Dict):
+        """Append one orchestration result to its user's log"""
+        record = self.to_record(result).tobytes()
+        partition = self.partition(result["user_id"])
+        os.makedirs(partition.directory, exist_ok=True)
+        with partition.locked():
+            with open(partition.path(LOG_NAME), "ab") as f:
+                f.write(record)
+        self.appended += 1
+
+    # Reads
+
+    def scan(
+        self,
+        user_id: str,
+        since: int,
+        until: int,
+        columns: Sequence[str] = ("ts", "ad_risk_score", "risk_level")
+    ) -> Dict[str, np.ndarray]:
+        """Columns of a user's rows with since <= ts <= until, ascending by ts"""
+        columns = tuple(dict.fromkeys(("ts",) + tuple(columns)))
+        partition = self.partition(user_id)
+        # Held for the scan so no process's compaction can delete a segment being read
+        with partition.locked(exclusive=False):
+            partition.refresh()
+            parts = [
+                segment.scan(since, until, columns) for segment in partition.segments
+                if segment.last_ts >= since and segment.first_ts <= until
+            ]
+            logs = partition.read_logs()
+        if len(logs):
+            in_range = logs[(logs["ts"] >= since) & (logs["ts"] <= until)]
+            parts.append({name: in_range[name] for name in columns})
+
+        merged = {
+            name: np.concatenate([part[name] for part in parts]) if parts
+            else np.empty(0, COLUMN_DTYPES[name])
+            for name in columns
+        }
+        # Segments may overlap in time and logs are unsorted
+        order = np.argsort(merged["ts"], kind="stable")
+        return {name: values[order] for name, values in merged.items()}
+
+    def risk_history(self, user_id: str, since: int, until: int, resolution: str = "raw") -> List[Dict]:
+        with STAGE_DURATION.time("history_scan"):
+            rows = self.scan(user_id, since, until, ("ad_risk_score", "risk_level"))
+        return format_risk_history(rows["ts"], rows["ad_risk_score"], rows["risk_level"], resolution)
+
+    # Maintenance
+
+    def maintain(self):
+        """Seal large append logs and compact fragmented partitions"""
+        with self._lock:
+            partitions = list(self._partitions.values())
+        for partition in partitions:
+            # Cheap unlocked checks; seal() and compact() re-check under the lock
+            if partition.log_rows() >= self.segment_rows:
+                self.seal(partition)
+            if len(self._small_segments(partition)) > self.max_segments:
+                self.compact(partition)
+
+    def _small_segments(self, partition: Partition) -> List[Segment]:
+        return [s for s in partition.segments if s.rows < self.target_segment_rows]
+
+    def seal(self, partition: Partition):
+        """
+        Turn the append log into a sorted column segment
+
+        Runs under the exclusive lock throughout, so no other process's
+        recovery mistakes the sealing file for a crashed seal
+        """
+        with partition.locked():
+            partition.refresh()
+            # Another worker may have sealed this log already
+            if partition.log_rows() < self.segment_rows:
+                return
+            os.replace(partition.path(LOG_NAME), partition.path(SEALING_NAME))
+            with STAGE_DURATION.time("history_seal"):
+                records = read_log(partition.path(SEALING_NAME))
+                if len(records):
+                    write_segment(partition.directory, np.sort(records, order="ts", kind="stable"))
+            os.remove(partition.path(SEALING_NAME))
+            partition.bump_generation()
+            partition.refresh()
+        self.seals += 1
+
+    def compact(self, partition: Partition):
+        """Merge small segments into one, replacing them atomically via a pending manifest"""
+        with partition.locked():
+            partition.refresh()
+            segments = self._small_segments(partition)
+            # Another worker may have compacted this partition already
+            if len(segments) <= self.max_segments:
+                return
+            with STAGE_DURATION.time("history_compact"):
+                columns = {
+                    name: np.concatenate([np.array(s.column(name)) for s in segments])
+                    for name, _ in COLUMNS
+                }
+                merged = np.empty(len(columns["ts"]), dtype=RECORD_DTYPE)
+                for name, values in columns.items():
+                    merged[name] = values
+                merged = np.sort(merged, order="ts", kind="stable")
+                name = segment_name(int(merged["ts"][0]), int(merged["ts"][-1]), len(merged))
+
+                inputs = [os.path.basename(s.path) for s in segments]
+                with open(partition.path(COMPACTION_NAME), "w") as f:
+                    f.write(" ".join([name] + inputs))
+                write_segment(partition.directory, merged)
+
+            for old in inputs:
+                if old != name:
+                    os.remove(partition.path(old))
+            os.remove(partition.path(COMPACTION_NAME))
+            partition.bump_generation()
+            partition.refresh()
+        self.compactions += 1
+
+    def stats(self) -> Dict:
+        return {
+            "users_loaded": len(self._partitions),
+            "appended": self.appended,
+            "seals": self.seals,
+            "compactions": self.compactions,
+        }
+
+
+def format_risk_history(
+    ts: np.ndarray,
+    scores: np.ndarray,
+    levels: np.ndarray,
+    resolution: str = "raw"
+) -> List[Dict]:
+    """
+    Risk history rows, newest first, from ascending ts/score/level columns
+
+    raw rows keep the existing {date, risk_score, risk_level} shape. daily
+    and weekly (Monday-aligned) buckets report the mean, min and max score,
+    the worst risk level and the number of analyses in the bucket.
+    """
+    if resolution not in RESOLUTIONS:
+        raise ValueError(f"Unknown resolution '{resolution}', expected one of {RESOLUTIONS}")
+    if not len(ts):
+        return []
+
+    if resolution == "raw":
+        return [
+            {
+                "date": from_epoch_us(t).date().isoformat(),
+                "risk_score": round(score, 4),
+                "risk_level": RISK_LEVELS[level],
+            }
+            for t, score, level in zip(ts[::-1].tolist(), scores[::-1].tolist(), levels[::-1].tolist())
+        ]
+
+    days = ts // DAY_US
+    # Epoch day 0 is a Thursday; shift by 3 so weeks start on Monday
+    buckets = days if resolution == "daily" else (days + 3) // 7
+    starts = np.flatnonzero(np.diff(buckets, prepend=buckets[0] - 1))
+    counts = np.diff(np.append(starts, len(buckets)))
+    scores = scores.astype(np.float64)
+    means = np.add.reduceat(scores, starts) / counts
+    minimums = np.minimum.reduceat(scores, starts)
+    maximums = np.maximum.reduceat(scores, starts)
+    worst = np.maximum.reduceat(levels, starts)
+    first_days = buckets[starts] if resolution == "daily" else buckets[starts] * 7 - 3
+
+    rows = []
+    for i in range(len(starts) - 1, -1, -1):
+        rows.append({
+            "date": from_epoch_us(int(first_days[i]) * DAY_US).date().isoformat(),
+            "risk_score": round(float(means[i]), 4),
+            "risk_level": RISK_LEVELS[int(worst[i])],
+            "min_risk_score": round(float(minimums[i]), 4),
+            "max_risk_score": round(float(maximums[i]), 4),
+            "count": int(counts[i]),
+        })
+    return rows
@@ -0,0 +1,330 @@
+"""
+Durable background job queue
+SQLite-backed queue with group-committed enqueues, batched workers and
+retry with exponential backoff
+"""
+
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+import asyncio
+import json
+import random
+import sqlite3
+import time
+
+from services.metricsService import REGISTRY, STAGE_DURATION
+from services.storageService import AsyncConnectionPool
+
+JOBS_SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id INTEGER PRIMARY KEY,
+    kind TEXT NOT NULL,
+    payload TEXT NOT NULL,
+    state TEXT NOT NULL DEFAULT 'pending',
+    attempts INTEGER NOT NULL DEFAULT 0,
+    run_at REAL NOT NULL,
+    created_at REAL NOT NULL,
+    last_error TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_jobs_due ON jobs (state, run_at);
+"""
+
+JOB_OUTCOMES = REGISTRY.counter(
+    "bia_jobs",
+    "Background jobs finished, by kind and outcome",
+    labelnames=("kind", "outcome")
+)
+JOB_QUEUE_DEPTH = REGISTRY.gauge(
+    "bia_job_queue_depth",
+    "Jobs in the durable queue, by state",
+    labelnames=("state",)
+)
+JOB_BATCH_SIZE = REGISTRY.histogram(
+    "bia_job_batch_size",
+    "Jobs handled per worker batch",
+    labelnames=("kind",),
+    buckets=(1, 2, 5, 10, 25, 50, 100, 250, 500, 1000)
+)
+
+BatchHandler = Callable[[List[Any]], Awaitable[None]]
+
+
+class JobQueue:
+    """
+    Durable queue of JSON jobs processed in same-kind batches
+
+    enqueue() returns once the job is committed: concurrent enqueues are
+    group-committed in one transaction. Worker coroutines claim up to the
+    handler's batch_size due jobs of one kind at a time and delete them once
+    the handler returns. A failed batch is retried after
+    base_backoff * 2**attempts seconds (with jitter, capped at max_backoff);
+    after max_attempts its jobs are kept as 'dead' for inspection.
+
+    A claim is a lease: a running job's run_at is its lease expiry, and a
+    job whose lease ran out (its worker died, or took longer than
+    lease_timeout) is claimed again by any process sharing the file. Jobs
+    other live workers are still running are left alone, but delivery is
+    at-least-once and handlers should tolerate repeats.
+    """
+
+    def __init__(
+        self,
+        path: str = "suzi_jobs.db",
+        workers: int = 2,
+        max_attempts: int = 8,
+        base_backoff: float = 0.5,
+        max_backoff: float = 300.0,
+        poll_interval: float = 1.0,
+        lease_timeout: float = 600.0
+    ):
+        self.pool = AsyncConnectionPool(path, size=1)
+        self.workers = workers
+        self.max_attempts = max_attempts
+        self.base_backoff = base_backoff
+        self.max_backoff = max_backoff
+        self.poll_interval = poll_interval
+        self.lease_timeout = lease_timeout
+        self._handlers: Dict[str, Tuple[BatchHandler, int]] = {}
+        self._remote_kinds: set = set()
+        self._pending: List[Tuple[str, str, asyncio.Future]] = []
+        self._commit_task: Optional[asyncio.Task] = None
+        self._wakeup: Optional[asyncio.Event] = None
+        self._tasks: List[asyncio.Task] = []
+        self._claimed: Dict[int, None] = {}
+
+    def register(self, kind: str, handler: BatchHandler, batch_size: int = 500):
+        """handler(payloads) processes a batch of jobs of this kind"""
+        self._handlers[kind] = (handler, batch_size)
+
+    def expect(self, kind: str):
+        """Allow enqueueing a kind that another process sharing the file handles"""
+        self._remote_kinds.add(kind)
+
+    async def start(self):
+        await self.pool.open()
+        await self.pool.run(self._recover)
+        self._wakeup = asyncio.Event()
+        self._wakeup.set()
+        self._tasks = [asyncio.create_task(self._work()) for _ in range(self.workers)]
+
+    async def close(self):
+        for task in self._tasks:
+            task.cancel()
+        for task in self._tasks:
+            try:
+                await task
+            except asyncio.CancelledError:
+                pass
+        self._tasks = []
+        if self._commit_task is not None:
+            await self._commit_task
+        # Jobs claimed by a cancelled worker go back to pending now rather
+        # than when their lease expires
+        if self._claimed:
+            await self.pool.run(self._release, list(self._claimed))
+            self._claimed.clear()
+        await self.pool.close()
+
+    @staticmethod
+    def _recover(conn: sqlite3.Connection):
+        # Every enqueue is acknowledged to a client, so commits must reach disk
+        conn.execute("PRAGMA synchronous=FULL")
+        conn.executescript(JOBS_SCHEMA)
+
+    @staticmethod
+    def _release(conn: sqlite3.Connection, ids: List[int]):
+        conn.execute("BEGIN")
+        try:
+            conn.executemany(
+                "UPDATE jobs SET state = 'pending', run_at = ? WHERE id = ? AND state = 'running'",
+                [(time.time(), job_id) for job_id in ids]
+            )
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+
+    # Producers
+
+    async def enqueue(self, kind: str, payload: Any):
+        await self.enqueue_many(kind, [payload])
+
+    async def enqueue_many(self, kind: str, payloads: List[Any]):
+        """Durably add jobs; returns once they are committed"""
+        if kind not in self._handlers and kind not in self._remote_kinds:
+            raise ValueError(f"No handler registered for job kind '{kind}'")
+        loop = asyncio.get_running_loop()
+        futures = []
+        for payload in payloads:
+            future = loop.create_future()
+            self._pending.append((kind, json.dumps(payload), future))
+            futures.append(future)
+        if self._commit_task is None:
+            self._commit_task = asyncio.create_task(self._commit())
+        await asyncio.gather(*futures)
+
+    async def _commit(self):
+        """Group commit: everything enqueued while the previous commit ran goes in one transaction"""
+        try:
+            while self._pending:
+                batch = self._pending
+                self._pending = []
+                try:
+                    with STAGE_DURATION.time("job_enqueue_commit"):
+                        await self.pool.run(self._insert, [(kind, payload) for kind, payload, _ in batch])
+                except Exception as e:
+                    for _, _, future in batch:
+                        future.set_exception(e)
+                    continue
+                for _, _, future in batch:
+                    future.set_result(None)
+                self._wakeup.set()
+        finally:
+            self._commit_task = None
+
+    @staticmethod
+    def _insert(conn: sqlite3.Connection, rows: List[Tuple[str, str]]):
+        now = time.time()
+        conn.execute("BEGIN")
+        try:
+            conn.executemany(
+                "INSERT INTO jobs (kind, payload, run_at, created_at) VALUES (?, ?, ?, ?)",
+                [(kind, payload, now, now) for kind, payload in rows]
+            )
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+
+    # Workers
+
+    async def _work(self):
+        while True:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), self.poll_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+
+            while True:
+                claimed = await self.pool.run(self._claim, self._batch_sizes(), self.lease_timeout)
+                if claimed is None:
+                    break
+                # More due work may remain: let another worker pick it up
+                self._wakeup.set()
+                kind, ids, payloads, attempts = claimed
+                # Kept if the worker is cancelled mid-batch, for close() to release
+                self._claimed.update(dict.fromkeys(ids))
+                await self._run_batch(kind, ids, payloads, attempts)
+                for job_id in ids:
+                    self._claimed.pop(job_id, None)
+
+    def _batch_sizes(self) -> Dict[str, int]:
+        return {kind: batch_size for kind, (_, batch_size) in self._handlers.items()}
+
+    @staticmethod
+    def _claim(conn: sqlite3.Connection, batch_sizes: Dict[str, int], lease_timeout: float):
+        """
+        Claim due jobs (pending, or running with an expired lease) of the
+        kind whose oldest job is next in line
+        """
+        if not batch_sizes:
+            return None
+        now = time.time()
+        # Only kinds this process handles: others are left to the processes
+        # that registered them instead of blocking the queue
+        kinds = ", ".join("?" * len(batch_sizes))
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            head = conn.execute(
+                "SELECT kind FROM jobs WHERE state IN ('pending', 'running') AND run_at <= ? "
+                f"AND kind IN ({kinds}) ORDER BY run_at, id LIMIT 1",
+                (now, *batch_sizes)
+            ).fetchone()
+            if head is None:
+                conn.execute("COMMIT")
+                return None
+            kind = head[0]
+            rows = conn.execute(
+                "SELECT id, payload, attempts FROM jobs "
+                "WHERE state IN ('pending', 'running') AND run_at <= ? AND kind = ? ORDER BY run_at, id LIMIT ?",
+                (now, kind, batch_sizes[kind])
+            ).fetchall()
+            conn.executemany(
+                "UPDATE jobs SET state = 'running', run_at = ? WHERE id = ?",
+                [(now + lease_timeout, row[0]) for row in rows]
+            )
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        return (
+            kind,
+            [row[0] for row in rows],
+            [json.loads(row[1]) for row in rows],
+            max(row[2] for row in rows)
+        )
+
+    async def _run_batch(self, kind: str, ids: List[int], payloads: List[Any], attempts: int):
+        handler, _ = self._handlers[kind]
+        JOB_BATCH_SIZE.observe(len(ids), kind)
+        try:
+            with STAGE_DURATION.time(f"job_{kind}"):
+                await handler(payloads)
+        except Exception as e:
+            attempts += 1
+            dead = attempts >= self.max_attempts
+            delay = min(self.max_backoff, self.base_backoff * 2 ** (attempts - 1)) * random.uniform(0.8, 1.2)
+            await self.pool.run(self._fail, ids, attempts, time.time() + delay, repr(e), dead)
+            JOB_OUTCOMES.inc(kind, "dead" if dead else "retry", amount=len(ids))
+            print(f"[Jobs] {kind} batch of {len(ids)} failed (attempt {attempts}): {e}")
+            return
+
+        await self.pool.run(self._complete, ids)
+        JOB_OUTCOMES.inc(kind, "done", amount=len(ids))
+
+    async def counts(self) -> Dict[str, int]:
+        """
+        Jobs per state across every process sharing the file, read from the
+        table itself (and published to bia_job_queue_depth)
+        """
+        counts = await self.pool.run(self._count)
+        depth = counts.get("pending", 0) + counts.get("running", 0)
+        JOB_QUEUE_DEPTH.set(depth, "pending")
+        JOB_QUEUE_DEPTH.set(counts.get("dead", 0), "dead")
+        return {"depth": depth, "running": counts.get("running", 0), "dead": counts.get("dead", 0)}
+
+    @staticmethod
+    def _count(conn: sqlite3.Connection) -> Dict[str, int]:
+        return dict(conn.execute("SELECT state, COUNT(*) FROM jobs GROUP BY state").fetchall())
+
+    @staticmethod
+    def _complete(conn: sqlite3.Connection, ids: List[int]):
+        # One transaction: under synchronous=FULL each autocommit is an fsync
+        conn.execute("BEGIN")
+        try:
+            conn.executemany("DELETE FROM jobs WHERE id = ?", [(job_id,) for job_id in ids])
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+
+    @staticmethod
+    def _fail(conn: sqlite3.Connection, ids: List[int], attempts: int, run_at: float, error: str, dead: bool):
+        conn.execute("BEGIN")
+        try:
+            conn.executemany(
+                "UPDATE jobs SET state = ?, attempts = ?, run_at = ?, last_error = ? WHERE id = ?",
+                [("dead" if dead else "pending", attempts, run_at, error, job_id) for job_id in ids]
+            )
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+
+    async def stats(self) -> Dict:
+        return {
+            "status": "ok" if self._tasks else "stopped",
+            **await self.counts(),
+            "workers": len(self._tasks),
+            "kinds": sorted(self._handlers),
+        }
@@ -0,0 +1,406 @@
+"""
+Lightweight in-process metrics and profiling
+Prometheus text-format counters, gauges and histograms plus an on-demand
+sampling profiler
+"""
+
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+from bisect import bisect_left
+from collections import Counter as _StackCounter
+from contextlib import contextmanager
+import math
+import os
+import sys
+import threading
+import time
+
+# Latency buckets in seconds, from 50µs (scoring math) to 10s (slow requests)
+DEFAULT_BUCKETS = (
+    0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005,
+    0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0
+)
+
+
+# Leaf frames of threads that are parked waiting for work
+_IDLE_FRAMES = {"selectors.py:select", "threading.py:wait", "thread.py:_worker", "queue.py:get"}
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(labelnames: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(labelnames, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _format_value(value: float) -> str:
+    if value == math.inf:
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    """
+    Monotonically increasing counter with optional labels
+    A callback counter reports a total owned by another component instead
+    """
+
+    type_name = "counter"
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: Sequence[str] = (),
+        callback: Optional[Callable[[], float]] = None
+    ):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.callback = callback
+        self._values: Dict[Tuple[str, ...], float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, *labels: str, amount: float = 1):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def value(self, *labels: str) -> float:
+        return self._values.get(labels, 0)
+
+    def samples(self) -> List[str]:
+        if self.callback is not None:
+            return [f"{self.name}_total {_format_value(self.callback())}"]
+        with self._lock:
+            items = list(self._values.items())
+        return [
+            f"{self.name}_total{_format_labels(self.labelnames, labels)} {_format_value(value)}"
+            for labels, value in items
+        ]
+
+
+class Gauge:
+    """Point-in-time value, either set directly or read from a callback at scrape time"""
+
+    type_name = "gauge"
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: Sequence[str] = (),
+        callback: Optional[Callable[[], float]] = None
+    ):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.callback = callback
+        self._values: Dict[Tuple[str, ...], float] = {}
+
+    def set(self, value: float, *labels: str):
+        self._values[labels] = value
+
+    def samples(self) -> List[str]:
+        if self.callback is not None:
+            return [f"{self.name} {_format_value(self.callback())}"]
+        return [
+            f"{self.name}{_format_labels(self.labelnames, labels)} {_format_value(value)}"
+            for labels, value in list(self._values.items())
+        ]
+
+
+class Histogram:
+    """Cumulative-bucket histogram with optional labels"""
+
+    type_name = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: Sequence[str] = (),
+        buckets: Sequence[float] = DEFAULT_BUCKETS
+    ):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # labels -> [per-bucket counts (+Inf last), sum, count]
+        self._series: Dict[Tuple[str, ...], list] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, *labels: str):
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(labels)
+            if series is None:
+                series = self._series[labels] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            series[0][index] += 1
+            series[1] += value
+            series[2] += 1
+
+    @contextmanager
+    def time(self, *labels: str):
+        """Observe the duration of the with-block in seconds"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, *labels)
+
+    def count(self, *labels: str) -> int:
+        series = self._series.get(labels)
+        return series[2] if series else 0
+
+    def drain(self) -> Dict[Tuple[str, ...], list]:
+        """Take and reset all series (ships a worker process's observations to its parent)"""
+        with self._lock:
+            series, self._series = self._series, {}
+        return series
+
+    def merge(self, series: Dict[Tuple[str, ...], list]):
+        """Add series drained from the same histogram in another process"""
+        with self._lock:
+            for labels, (counts, total, count) in series.items():
+                mine = self._series.get(labels)
+                if mine is None:
+                    mine = self._series[labels] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+                for i, bucket_count in enumerate(counts):
+                    mine[0][i] += bucket_count
+                mine[1] += total
+                mine[2] += count
+
+    def samples(self) -> List[str]:
+        with self._lock:
+            items = [(labels, list(s[0]), s[1], s[2]) for labels, s in self._series.items()]
+        lines = []
+        for labels, counts, total, count in items:
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (math.inf,), counts):
+                cumulative += bucket_count
+                le = 'le="' + _format_value(bound) + '"'
+                lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, labels, le)} {cumulative}")
+            lines.append(f"{self.name}_sum{_format_labels(self.labelnames, labels)} {_format_value(total)}")
+            lines.append(f"{self.name}_count{_format_labels(self.labelnames, labels)} {count}")
+        return lines
+
+
+class MetricsRegistry:
+    """
+    Named collection of metrics rendered in Prometheus text format
+
+    Registering an existing name returns the existing metric, so modules
+    can declare the metrics they use at import time.
+    """
+
+    def __init__(self):
+        self._metrics: Dict[str, object] = {}
+        self._lock = threading.Lock()
+
+    def _register(self, cls, name: str, *args, **kwargs):
+        with self._lock:
+            metric = self._metrics.get(name)
+            if metric is None:
+                metric = self._metrics[name] = cls(name, *args, **kwargs)
+            elif not isinstance(metric, cls):
+                raise ValueError(f"Metric {name} already registered as {metric.type_name}")
+            return metric
+
+    def counter(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: Sequence[str] = (),
+        callback: Optional[Callable[[], float]] = None
+    ) -> Counter:
+        counter = self._register(Counter, name, documentation, labelnames)
+        if callback is not None:
+            counter.callback = callback
+        return counter
+
+    def gauge(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: Sequence[str] = (),
+        callback: Optional[Callable[[], float]] = None
+    ) -> Gauge:
+        gauge = self._register(Gauge, name, documentation, labelnames)
+        if callback is not None:
+            gauge.callback = callback
+        return gauge
+
+    def histogram(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: Sequence[str] = (),
+        buckets: Sequence[float] = DEFAULT_BUCKETS
+    ) -> Histogram:
+        return self._register(Histogram, name, documentation, labelnames, buckets)
+
+    def render(self) -> str:
+        lines = []
+        for name, metric in sorted(self._metrics.items()):
+            lines.append(f"# HELP {name} {metric.documentation}")
+            lines.append(f"# TYPE {name} {metric.type_name}")
+            lines.extend(metric.samples())
+        return "\n".join(lines) + "\n"
+
+
+# Process-wide default registry
+REGISTRY = MetricsRegistry()
+
+# Per-stage timings of the orchestration hot path and persistence
+STAGE_DURATION = REGISTRY.histogram(
+    "bia_stage_duration_seconds",
+    "Time spent in each orchestration and persistence stage",
+    labelnames=("stage",)
+)
+
+PROMETHEUS_CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+class SamplingProfiler:
+    """
+    Statistical profiler scoped to a single endpoint
+
+    While enabled, a background thread snapshots every thread's stack each
+    `interval` seconds, but only while a request to the target path is in
+    flight. Executor threads are sampled too, so time spent off the event
+    loop shows up. Results are aggregated as collapsed stacks
+    (flamegraph.pl format) and per-function self samples.
+    """
+
+    def __init__(self):
+        self.path: Optional[str] = None
+        self.interval = 0.005
+        self.samples = 0
+        self._active = 0
+        self._stacks: _StackCounter = _StackCounter()
+        self._lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+
+    @property
+    def enabled(self) -> bool:
+        return self._thread is not None
+
+    def enable(self, path: str, interval: float = 0.005):
+        """Start sampling requests to `path`, discarding previous results"""
+        self.disable()
+        with self._lock:
+            self.path = path
+            self.interval = interval
+            self.samples = 0
+            self._stacks = _StackCounter()
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="sampling-profiler", daemon=True)
+        self._thread.start()
+
+    def disable(self):
+        if self._thread is not None:
+            self._stop.set()
+            self._thread.join()
+            self._thread = None
+
+    def wants(self, path: str) -> bool:
+        return self._thread is not None and path == self.path
+
+    def request_started(self):
+        with self._lock:
+            self._active += 1
+
+    def request_finished(self):
+        with self._lock:
+            self._active -= 1
+
+    def _run(self):
+        own_id = threading.get_ident()
+        while not self._stop.wait(self.interval):
+            if not self._active:
+                continue
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == own_id:
+                    continue
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append(f"{os.path.basename(code.co_filename)}:{code.co_name}")
+                    frame = frame.f_back
+                # Skip idle threads parked in the event loop selector or a pool queue
+                if not stack or stack[0] in _IDLE_FRAMES:
+                    continue
+                with self._lock:
+                    self._stacks[";".join(reversed(stack))] += 1
+                    self.samples += 1
+
+    def report(self, limit: int = 25) -> Dict:
+        with self._lock:
+            stacks = self._stacks.most_common()
+            samples = self.samples
+        functions: _StackCounter = _StackCounter()
+        for stack, count in stacks:
+            functions[stack.rsplit(";", 1)[-1]] += count
+        return {
+            "enabled": self.enabled,
+            "path": self.path,
+            "interval_seconds": self.interval,
+            "samples": samples,
+            "top_functions": [
+                {"function": name, "samples": count, "share": round(count / samples, 4)}
+                for name, count in functions.most_common(limit)
+            ] if samples else [],
+            "collapsed_stacks": [f"{stack} {count}" for stack, count in stacks[:limit]],
+        }
+
+
+class MetricsMiddleware:
+    """
+    ASGI middleware recording request counts and latency per route template
+    and hooking the sampling profiler into requests for its target path
+    """
+
+    def __init__(self, app, registry: MetricsRegistry = REGISTRY, profiler: Optional[SamplingProfiler] = None):
+        self.app = app
+        self.profiler = profiler
+        self.requests = registry.counter(
+            "bia_http_requests",
+            "HTTP requests by route and status code",
+            labelnames=("method", "route", "status")
+        )
+        self.latency = registry.histogram(
+            "bia_http_request_duration_seconds",
+            "HTTP request latency by route",
+            labelnames=("method", "route")
+        )
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        status = [500]
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                status[0] = message["status"]
+            await send(message)
+
+        profiling = self.profiler is not None and self.profiler.wants(scope["path"])
+        if profiling:
+            self.profiler.request_started()
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            elapsed = time.perf_counter() - start
+            if profiling:
+                self.profiler.request_finished()
+            route = scope.get("route")
+            route_path = getattr(route, "path", "unmatched")
+            self.latency.observe(elapsed, scope["method"], route_path)
+            self.requests.inc(scope["method"], route_path, str(status[0]))
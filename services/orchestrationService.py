@@ -3,10 +3,75 @@ Cell2Sentence Orchestration Service for NeuroTrack-BIA
 Integrates cognitive/behavioral data with cellular analysis
 """
 
-from typing import Dict, List, Optional
+from typing import TYPE_CHECKING, Dict, List, Optional
 from datetime import datetime
+import time
 import numpy as np
 
+from services.cognitiveSession import SESSION_INPUTS
+from services.metricsService import STAGE_DURATION
+from services.resultCache import ResultCache
+from services.trendService import TrendTracker
+
+if TYPE_CHECKING:  # baselineService imports this module's constants
+    from services.baselineService import BaselineTracker
+
+# Scoring inputs consumed by CellularSignatureCalculator, with the defaults
+# used when a field is missing (mirrors calculate_signature)
+SIGNATURE_INPUTS = {
+    "sleep_efficiency": 0.8,
+    "sleep_interruptions": 2,
+    "hrv": 45,
+    "resting_hr": 72,
+    "cognitive_score": 80,
+    "reaction_time": 500,
+    "errors": 2,
+    "steps": 5000,
+    "active_minutes": 20,
+}
+
+# Risk levels indexed by the integer codes used in batch results
+RISK_LEVELS = ("low", "medium", "high")
+
+# Contributing factors in bit order (bit i of a factor mask = CONTRIBUTING_FACTORS[i])
+CONTRIBUTING_FACTORS = (
+    "sleep_quality",
+    "systemic_inflammation",
+    "cognitive_decline",
+    "sedentary_lifestyle",
+)
+FACTOR_BITS = {name: 1 << i for i, name in enumerate(CONTRIBUTING_FACTORS)}
+
+
+def factors_to_mask(factors: List[str]) -> int:
+    """Encode a list of contributing factor names as a bitmask"""
+    mask = 0
+    for name in factors:
+        mask |= FACTOR_BITS[name]
+    return mask
+
+
+def mask_to_factors(mask: int) -> List[str]:
+    """Decode a contributing factor bitmask into factor names"""
+    return [name for name, bit in FACTOR_BITS.items() if mask & bit]
+
+
+def _round3(values: np.ndarray) -> np.ndarray:
+    """
+    Round to 3 decimals exactly like the builtin round()
+
+    np.round scales by 1000 and rounds the scaled value, which can disagree
+    with Python's correctly-rounded round() right at a decimal tie. Those
+    few elements are redone the scalar way.
+    """
+    rounded = np.round(values, 3)
+    scaled = values * 1000
+    near_tie = np.abs(scaled - np.floor(scaled) - 0.5) < 1e-6
+    if near_tie.any():
+        idx = np.flatnonzero(near_tie)
+        rounded[idx] = [round(float(v), 3) for v in values[idx]]
+    return rounded
+
 class BiomarkerMapper:
     """
     Maps NeuroTrack-BIA metrics to cellular signatures
@@ -62,6 +127,29 @@ class BiomarkerMapper:
         # Weighted average
         return (cognitive_factor * 0.5 + reaction_factor * 0.3 + error_factor * 0.2)
     
+    @staticmethod
+    def apply_session_variability(
+        neuronal_health: float,
+        rt_cv: Optional[float],
+        error_bursts: Optional[float],
+        fatigue_slope: Optional[float]
+    ) -> float:
+        """
+        Literature: High intra-individual RT variability, clustered errors and
+        within-session slowing precede decline in mean performance
+        """
+        # RT coefficient of variation ~0.2 is typical, >=0.5 markedly unstable
+        variability_factor = max(0, min(1, (rt_cv - 0.2) / 0.3)) if rt_cv is not None else 0
+        
+        # Each burst of consecutive errors suggests an attention lapse
+        burst_factor = min(1, error_bursts * 0.25) if error_bursts is not None else 0
+        
+        # Slowing of 10 ms per trial or more is strong fatigue
+        fatigue_factor = max(0, min(1, fatigue_slope / 10)) if fatigue_slope is not None else 0
+        
+        penalty = variability_factor * 0.5 + burst_factor * 0.25 + fatigue_factor * 0.25
+        return neuronal_health * (1 - penalty * 0.3)
+    
     @staticmethod
     def map_activity_to_metabolic_health(steps: int, active_minutes: int) -> float:
         """
@@ -74,6 +162,61 @@ class BiomarkerMapper:
         return (steps_score + activity_score) / 2
 
 
+class BatchBiomarkerMapper:
+    """
+    Vectorized counterpart of BiomarkerMapper
+
+    Every method takes float64 arrays and performs the same operations in the
+    same order as the scalar version, so results are bit-identical.
+    """
+    
+    @staticmethod
+    def map_sleep_to_microglial_activation(
+        sleep_efficiency: np.ndarray,
+        interruptions: np.ndarray
+    ) -> np.ndarray:
+        base_activation = np.maximum(0, (0.85 - sleep_efficiency) / 0.85)
+        interruption_factor = np.minimum(0.3, interruptions * 0.05)
+        return np.minimum(1.0, base_activation + interruption_factor)
+    
+    @staticmethod
+    def map_hrv_to_inflammatory_state(hrv: np.ndarray, resting_hr: np.ndarray) -> np.ndarray:
+        hrv_score = np.where(hrv < 50, np.maximum(0, (50 - hrv) / 50), 0)
+        hr_score = np.where(resting_hr > 70, np.maximum(0, (resting_hr - 70) / 30), 0)
+        return np.minimum(1.0, (hrv_score + hr_score) / 2)
+    
+    @staticmethod
+    def map_cognitive_to_neuronal_health(
+        cognitive_score: np.ndarray,
+        reaction_time: np.ndarray,
+        errors: np.ndarray
+    ) -> np.ndarray:
+        cognitive_factor = cognitive_score / 100
+        reaction_factor = np.maximum(0, np.minimum(1, (1000 - reaction_time) / 500))
+        error_factor = np.maximum(0, 1 - (errors * 0.1))
+        return (cognitive_factor * 0.5 + reaction_factor * 0.3 + error_factor * 0.2)
+    
+    @staticmethod
+    def apply_session_variability(
+        neuronal_health: np.ndarray,
+        rt_cv: np.ndarray,
+        error_bursts: np.ndarray,
+        fatigue_slope: np.ndarray
+    ) -> np.ndarray:
+        """NaN marks a missing session feature, like None in the scalar version"""
+        variability_factor = np.nan_to_num(np.maximum(0, np.minimum(1, (rt_cv - 0.2) / 0.3)))
+        burst_factor = np.nan_to_num(np.minimum(1, error_bursts * 0.25))
+        fatigue_factor = np.nan_to_num(np.maximum(0, np.minimum(1, fatigue_slope / 10)))
+        penalty = variability_factor * 0.5 + burst_factor * 0.25 + fatigue_factor * 0.25
+        return neuronal_health * (1 - penalty * 0.3)
+    
+    @staticmethod
+    def map_activity_to_metabolic_health(steps: np.ndarray, active_minutes: np.ndarray) -> np.ndarray:
+        steps_score = np.minimum(1.0, steps / 7500)
+        activity_score = np.minimum(1.0, active_minutes / 30)
+        return (steps_score + activity_score) / 2
+
+
 class CellularSignatureCalculator:
     """
     Calculates cellular signatures from NeuroTrack-BIA data
@@ -82,6 +225,7 @@ class CellularSignatureCalculator:
     
     def __init__(self):
         self.mapper = BiomarkerMapper()
+        self.batch_mapper = BatchBiomarkerMapper()
     
     def calculate_signature(self, bia_data: Dict) -> Dict:
         """
@@ -111,6 +255,11 @@ class CellularSignatureCalculator:
             cognitive_score, reaction_time, errors
         )
         
+        # Trial-level session features, when the client sent them
+        session = [bia_data.get(name) for name in SESSION_INPUTS]
+        if any(value is not None for value in session):
+            neuronal_health = self.mapper.apply_session_variability(neuronal_health, *session)
+        
         metabolic_health = self.mapper.map_activity_to_metabolic_health(
             steps, active_minutes
         )
@@ -142,6 +291,85 @@ class CellularSignatureCalculator:
             )
         }
     
+    def calculate_signatures_batch(self, columns) -> Dict[str, np.ndarray]:
+        """
+        Vectorized calculate_signature for a whole cohort
+        
+        Args:
+            columns: Mapping of input name -> 1-D array, or a NumPy structured
+                array with named fields. Inputs not present are filled with
+                the same defaults as calculate_signature. Optional session
+                features (SESSION_INPUTS) use NaN for rows without them.
+        
+        Returns:
+            Dict of arrays, one row per input row: the four cellular scores and
+            ad_risk_score (rounded like the scalar path), risk_level as codes
+            into RISK_LEVELS (uint8) and contributing_factors as a bitmask over
+            CONTRIBUTING_FACTORS (uint8).
+        """
+        if isinstance(columns, np.ndarray):
+            names = columns.dtype.names or ()
+            columns = {name: columns[name] for name in names}
+        
+        size = None
+        for name in SIGNATURE_INPUTS:
+            if name in columns:
+                size = len(columns[name])
+                break
+        if size is None:
+            raise ValueError("calculate_signatures_batch needs at least one input column")
+        
+        inputs = {}
+        for name, default in SIGNATURE_INPUTS.items():
+            if name in columns:
+                values = np.asarray(columns[name], dtype=np.float64)
+                if values.shape != (size,):
+                    raise ValueError(f"Column '{name}' has shape {values.shape}, expected ({size},)")
+            else:
+                values = np.full(size, default, dtype=np.float64)
+            inputs[name] = values
+        
+        microglial_activation = self.batch_mapper.map_sleep_to_microglial_activation(
+            inputs['sleep_efficiency'], inputs['sleep_interruptions']
+        )
+        inflammatory_state = self.batch_mapper.map_hrv_to_inflammatory_state(
+            inputs['hrv'], inputs['resting_hr']
+        )
+        neuronal_health = self.batch_mapper.map_cognitive_to_neuronal_health(
+            inputs['cognitive_score'], inputs['reaction_time'], inputs['errors']
+        )
+        if any(name in columns for name in SESSION_INPUTS):
+            session = [
+                np.asarray(columns[name], dtype=np.float64) if name in columns else np.full(size, np.nan)
+                for name in SESSION_INPUTS
+            ]
+            neuronal_health = self.batch_mapper.apply_session_variability(neuronal_health, *session)
+        metabolic_health = self.batch_mapper.map_activity_to_metabolic_health(
+            inputs['steps'], inputs['active_minutes']
+        )
+        
+        ad_risk_score = (
+            microglial_activation * 0.25 +
+            inflammatory_state * 0.25 +
+            (1 - neuronal_health) * 0.35 +
+            (1 - metabolic_health) * 0.15
+        )
+        
+        return {
+            "microglial_activation": _round3(microglial_activation),
+            "inflammatory_state": _round3(inflammatory_state),
+            "neuronal_health": _round3(neuronal_health),
+            "metabolic_health": _round3(metabolic_health),
+            "ad_risk_score": _round3(ad_risk_score),
+            "risk_level": self._classify_risk_batch(ad_risk_score),
+            "contributing_factors": self._identify_factors_batch(
+                microglial_activation,
+                inflammatory_state,
+                neuronal_health,
+                metabolic_health
+            )
+        }
+    
     def _classify_risk(self, score: float) -> str:
         """Classify risk level based on composite score"""
         if score < 0.3:
@@ -171,93 +399,211 @@ class CellularSignatureCalculator:
             factors.append("sedentary_lifestyle")
         
         return factors
+    
+    def _classify_risk_batch(self, scores: np.ndarray) -> np.ndarray:
+        """Vectorized _classify_risk, returning codes into RISK_LEVELS"""
+        return np.where(scores < 0.3, 0, np.where(scores < 0.6, 1, 2)).astype(np.uint8)
+    
+    def _identify_factors_batch(
+        self,
+        microglial: np.ndarray,
+        inflammatory: np.ndarray,
+        neuronal: np.ndarray,
+        metabolic: np.ndarray
+    ) -> np.ndarray:
+        """Vectorized _identify_factors, returning a bitmask per row"""
+        mask = (microglial > 0.6).astype(np.uint8) * FACTOR_BITS["sleep_quality"]
+        mask |= (inflammatory > 0.6).astype(np.uint8) * FACTOR_BITS["systemic_inflammation"]
+        mask |= (neuronal < 0.4).astype(np.uint8) * FACTOR_BITS["cognitive_decline"]
+        mask |= (metabolic < 0.4).astype(np.uint8) * FACTOR_BITS["sedentary_lifestyle"]
+        return mask
+
+
+# Declarative recommendation rules, evaluated in order. A rule fires when its
+# contributing factor is present or its signature condition holds.
+RECOMMENDATION_RULES = (
+    {
+        "id": "sleep",
+        "factor": "sleep_quality",
+        "condition": ("microglial_activation", ">", 0.5),
+        "recommendation": {
+            "category": "sleep",
+            "priority": "high",
+            "title": "Melhorar Qualidade do Sono",
+            "actions": [
+                "Manter horário regular de dormir (antes das 22h)",
+                "Evitar telas 1h antes de dormir",
+                "Ambiente escuro e fresco (18-20°C)"
+            ],
+            "impact": "Reduz inflamação cerebral e melhora consolidação de memória"
+        }
+    },
+    {
+        "id": "anti_inflammatory_diet",
+        "factor": "systemic_inflammation",
+        "condition": ("inflammatory_state", ">", 0.5),
+        "recommendation": {
+            "category": "nutrition",
+            "priority": "high",
+            "title": "Dieta Anti-Inflamatória",
+            "actions": [
+                "Aumentar ômega-3 (peixes, nozes)",
+                "Reduzir açúcar e processados",
+                "Adicionar cúrcuma e chá verde"
+            ],
+            "impact": "Reduz marcadores inflamatórios sistêmicos"
+        }
+    },
+    {
+        "id": "cognitive_stimulation",
+        "factor": "cognitive_decline",
+        "condition": ("neuronal_health", "<", 0.6),
+        "recommendation": {
+            "category": "cognitive",
+            "priority": "high",
+            "title": "Estimulação Cognitiva Diária",
+            "actions": [
+                "Realizar 2-3 microtestes por dia no app",
+                "Aprender algo novo (idioma, instrumento)",
+                "Jogos de estratégia e quebra-cabeças"
+            ],
+            "impact": "Estimula plasticidade neural e neuroproteção"
+        }
+    },
+    {
+        "id": "physical_activity",
+        "factor": "sedentary_lifestyle",
+        "condition": ("metabolic_health", "<", 0.6),
+        "recommendation": {
+            "category": "exercise",
+            "priority": "medium",
+            "title": "Aumentar Atividade Física",
+            "actions": [
+                "Meta: 7500 passos por dia",
+                "30 min de exercício aeróbico 5x/semana",
+                "Incluir treino de força 2x/semana"
+            ],
+            "impact": "Melhora fluxo sanguíneo cerebral e reduz estresse oxidativo"
+        }
+    },
+    {
+        # Stress management (always relevant)
+        "id": "stress_management",
+        "factor": None,
+        "condition": ("inflammatory_state", ">", 0.4),
+        "recommendation": {
+            "category": "stress",
+            "priority": "medium",
+            "title": "Gerenciamento de Estresse",
+            "actions": [
+                "Meditação 10-15 min/dia",
+                "Exercícios de respiração profunda",
+                "Contato social regular"
+            ],
+            "impact": "Reduz cortisol e inflamação sistêmica"
+        }
+    },
+)
+
+# Recommendation IDs in bit order (bit i of a recommendation mask = RECOMMENDATION_IDS[i])
+RECOMMENDATION_IDS = tuple(rule["id"] for rule in RECOMMENDATION_RULES)
+
+
+class Recommendation(dict):
+    """
+    Read-only recommendation payload
+
+    Built once per rule and shared by every response, so mutation is
+    rejected. Still a dict, so it serializes like one.
+    """
+    
+    def _readonly(self, *args, **kwargs):
+        raise TypeError("Recommendation objects are shared and read-only")
+    
+    __setitem__ = __delitem__ = _readonly
+    clear = pop = popitem = setdefault = update = _readonly
+    
+    def __reduce__(self):
+        # Pickle/copy by value instead of item-by-item assignment
+        return (Recommendation, (dict(self),))
+
+
+class _CompiledRule:
+    """A recommendation rule reduced to a factor bitmask and one comparison"""
+    
+    __slots__ = ("bit", "factor_mask", "key", "above", "threshold", "recommendation")
+    
+    def __init__(self, index: int, rule: Dict):
+        key, op, threshold = rule["condition"]
+        if op not in (">", "<"):
+            raise ValueError(f"Unsupported operator in rule {rule['id']}: {op}")
+        self.bit = 1 << index
+        self.factor_mask = FACTOR_BITS[rule["factor"]] if rule["factor"] else 0
+        self.key = key
+        self.above = op == ">"
+        self.threshold = threshold
+        payload = dict(rule["recommendation"])
+        payload["actions"] = tuple(payload["actions"])
+        self.recommendation = Recommendation(payload)
+
+
+def _compile_rules(rules) -> tuple:
+    return tuple(_CompiledRule(i, rule) for i, rule in enumerate(rules))
 
 
 class RecommendationEngine:
     """
     Generates personalized recommendations based on cellular signatures
+    
+    RECOMMENDATION_RULES is compiled once at import; per request the engine
+    only does a bitmask test and one float comparison per rule.
     """
     
+    _rules = _compile_rules(RECOMMENDATION_RULES)
+    
     @staticmethod
     def generate_recommendations(cellular_signature: Dict, bia_data: Dict) -> List[Dict]:
         """
         Generate actionable recommendations
+        
+        The returned objects are shared between calls and read-only.
         """
-        recommendations = []
         sig = cellular_signature['cellular_signature']
-        factors = cellular_signature['contributing_factors']
-        
-        # Sleep recommendations
-        if 'sleep_quality' in factors or sig['microglial_activation'] > 0.5:
-            recommendations.append({
-                "category": "sleep",
-                "priority": "high",
-                "title": "Melhorar Qualidade do Sono",
-                "actions": [
-                    "Manter horário regular de dormir (antes das 22h)",
-                    "Evitar telas 1h antes de dormir",
-                    "Ambiente escuro e fresco (18-20°C)"
-                ],
-                "impact": "Reduz inflamação cerebral e melhora consolidação de memória"
-            })
-        
-        # Anti-inflammatory recommendations
-        if 'systemic_inflammation' in factors or sig['inflammatory_state'] > 0.5:
-            recommendations.append({
-                "category": "nutrition",
-                "priority": "high",
-                "title": "Dieta Anti-Inflamatória",
-                "actions": [
-                    "Aumentar ômega-3 (peixes, nozes)",
-                    "Reduzir açúcar e processados",
-                    "Adicionar cúrcuma e chá verde"
-                ],
-                "impact": "Reduz marcadores inflamatórios sistêmicos"
-            })
-        
-        # Cognitive stimulation
-        if 'cognitive_decline' in factors or sig['neuronal_health'] < 0.6:
-            recommendations.append({
-                "category": "cognitive",
-                "priority": "high",
-                "title": "Estimulação Cognitiva Diária",
-                "actions": [
-                    "Realizar 2-3 microtestes por dia no app",
-                    "Aprender algo novo (idioma, instrumento)",
-                    "Jogos de estratégia e quebra-cabeças"
-                ],
-                "impact": "Estimula plasticidade neural e neuroproteção"
-            })
-        
-        # Physical activity
-        if 'sedentary_lifestyle' in factors or sig['metabolic_health'] < 0.6:
-            recommendations.append({
-                "category": "exercise",
-                "priority": "medium",
-                "title": "Aumentar Atividade Física",
-                "actions": [
-                    "Meta: 7500 passos por dia",
-                    "30 min de exercício aeróbico 5x/semana",
-                    "Incluir treino de força 2x/semana"
-                ],
-                "impact": "Melhora fluxo sanguíneo cerebral e reduz estresse oxidativo"
-            })
-        
-        # Stress management (always relevant)
-        if sig['inflammatory_state'] > 0.4:
-            recommendations.append({
-                "category": "stress",
-                "priority": "medium",
-                "title": "Gerenciamento de Estresse",
-                "actions": [
-                    "Meditação 10-15 min/dia",
-                    "Exercícios de respiração profunda",
-                    "Contato social regular"
-                ],
-                "impact": "Reduz cortisol e inflamação sistêmica"
-            })
+        factor_mask = factors_to_mask(cellular_signature['contributing_factors'])
         
+        recommendations = []
+        for rule in RecommendationEngine._rules:
+            value = sig[rule.key]
+            if (factor_mask & rule.factor_mask or
+                    (value > rule.threshold if rule.above else value < rule.threshold)):
+                recommendations.append(rule.recommendation)
         return recommendations
+    
+    @staticmethod
+    def recommend_batch(signatures: Dict[str, np.ndarray]) -> np.ndarray:
+        """
+        Vectorized generate_recommendations for a cohort
+        
+        Args:
+            signatures: Output of CellularSignatureCalculator.calculate_signatures_batch
+            
+        Returns:
+            uint8 array with one bitmask per row over RECOMMENDATION_IDS
+        """
+        factor_mask = signatures['contributing_factors']
+        result = np.zeros(len(factor_mask), dtype=np.uint8)
+        for rule in RecommendationEngine._rules:
+            values = signatures[rule.key]
+            fired = values > rule.threshold if rule.above else values < rule.threshold
+            if rule.factor_mask:
+                fired |= (factor_mask & rule.factor_mask) != 0
+            result |= fired.astype(np.uint8) * np.uint8(rule.bit)
+        return result
+    
+    @staticmethod
+    def recommendations_from_mask(mask: int) -> List[Dict]:
+        """Shared recommendation objects for a recommend_batch bitmask"""
+        return [rule.recommendation for rule in RecommendationEngine._rules if mask & rule.bit]
 
 
 class OrchestrationService:
@@ -266,37 +612,47 @@ class OrchestrationService:
     Coordinates data from NeuroTrack-BIA and generates insights
     """
     
-    def __init__(self):
+    def __init__(
+        self,
+        trend_tracker: Optional[TrendTracker] = None,
+        result_cache: Optional[ResultCache] = None,
+        baseline_tracker: Optional["BaselineTracker"] = None
+    ):
         self.signature_calculator = CellularSignatureCalculator()
         self.recommendation_engine = RecommendationEngine()
+        self.trend_tracker = trend_tracker if trend_tracker is not None else TrendTracker()
+        # Optional cache of the input-determined part of the pipeline
+        self.result_cache = result_cache
+        # Optional per-user baselines; classification is then personalized
+        self.baseline_tracker = baseline_tracker
     
     def orchestrate(self, bia_data: Dict) -> Dict:
         """
         Main orchestration pipeline
         
         Args:
-            bia_data: Data from NeuroTrack-BIA app
+            bia_data: Data from NeuroTrack-BIA app. A 'cellular_embedding'
+                (Phase 3, from the embedding service) is summarized under
+                cellular_analysis; it does not feed scoring yet, so the
+                analysis type and confidence stay those of the proxies.
             
         Returns:
             Comprehensive analysis with risk scores and recommendations
         """
-        # Calculate cellular signature from proxy biomarkers
-        cellular_signature = self.signature_calculator.calculate_signature(bia_data)
-        
-        # Generate personalized recommendations
-        recommendations = self.recommendation_engine.generate_recommendations(
-            cellular_signature,
-            bia_data
+        cellular_signature, recommendations, alerts = self._analyze(bia_data)
+        cellular_signature, recommendations, alerts = self._personalize(
+            bia_data, cellular_signature, recommendations, alerts
         )
+        cellular_analysis = self._cellular_analysis(bia_data.get('cellular_embedding'))
         
-        # Calculate trend (requires historical data)
-        trend = self._calculate_trend(bia_data.get('user_id'))
+        # Update the user's rolling trend state with this observation
+        trend = self._calculate_trend(bia_data)
         
         # Compile final response
-        return {
+        result = {
             "user_id": bia_data.get('user_id'),
             "timestamp": datetime.now().isoformat(),
-            "analysis_type": "proxy_biomarkers",  # Phase 2
+            "analysis_type": "proxy_biomarkers",
             
             # Core metrics
             "cognitive_indices": {
@@ -308,13 +664,17 @@ class OrchestrationService:
             # Cellular insights (proxy)
             "cellular_signature": cellular_signature,
             
+            # Cell2Sentence embedding (Phase 3, None for proxy-only analyses)
+            "cellular_analysis": cellular_analysis,
+            
             # Integrated risk
             "integrated_risk": {
                 "overall_score": cellular_signature['ad_risk_score'],
                 "risk_level": cellular_signature['risk_level'],
                 "cognitive_component": (100 - bia_data.get('cognitive_score', 80)) / 100,
                 "cellular_component": cellular_signature['ad_risk_score'],
-                "confidence": 0.75  # Phase 2 proxy = moderate confidence
+                # Phase 2 proxy = moderate confidence
+                "confidence": 0.75
             },
             
             # Actionable insights
@@ -324,21 +684,116 @@ class OrchestrationService:
             "next_assessment_due": self._calculate_next_assessment(
                 cellular_signature['risk_level']
             ),
-            "alerts": self._generate_alerts(cellular_signature, bia_data)
+            "alerts": alerts
         }
+        
+        # Demographics are only echoed when supplied (used by cohort analytics)
+        if bia_data.get('age') is not None:
+            result["age"] = bia_data['age']
+        return result
     
-    def _calculate_trend(self, user_id: str) -> Dict:
-        """
-        Calculate trends from historical data
-        In production: query database for user's history
-        """
-        # Placeholder - would query SUZI database
+    def _cellular_analysis(self, embedding) -> Optional[Dict]:
+        """Summarize a Cell2Sentence embedding for the response (the vector itself is not echoed)"""
+        if embedding is None:
+            return None
+        vector = np.asarray(embedding, dtype=np.float32)
         return {
-            "cognitive_decline_rate": 0.5,  # % per month
-            "sleep_trend": "improving",
-            "activity_trend": "stable"
+            "embedding_dim": int(vector.shape[0]),
+            "embedding_norm": round(float(np.linalg.norm(vector)), 5),
         }
     
+    def _analyze(self, bia_data: Dict):
+        """
+        Signature, recommendations and alerts for one payload
+        
+        These depend only on the scoring inputs, so they are served from
+        result_cache when an identical payload was seen recently. Only the
+        signature timestamp is refreshed on a hit.
+        """
+        cache_key = None
+        if self.result_cache is not None:
+            cache_key = self._cache_key(bia_data)
+            cached = self.result_cache.get(cache_key)
+            if cached is not None:
+                cellular_signature, recommendations, alerts = cached
+                cellular_signature = dict(cellular_signature, timestamp=datetime.now().isoformat())
+                return cellular_signature, list(recommendations), list(alerts)
+        
+        # Calculate cellular signature from proxy biomarkers
+        started = time.perf_counter()
+        cellular_signature = self.signature_calculator.calculate_signature(bia_data)
+        signature_done = time.perf_counter()
+        
+        # Generate personalized recommendations
+        recommendations = self.recommendation_engine.generate_recommendations(
+            cellular_signature,
+            bia_data
+        )
+        recommendations_done = time.perf_counter()
+        
+        alerts = self._generate_alerts(cellular_signature, bia_data)
+        alerts_done = time.perf_counter()
+        
+        STAGE_DURATION.observe(signature_done - started, "signature")
+        STAGE_DURATION.observe(recommendations_done - signature_done, "recommendations")
+        STAGE_DURATION.observe(alerts_done - recommendations_done, "alerts")
+        
+        if cache_key is not None:
+            self.result_cache.put(cache_key, (cellular_signature, recommendations, alerts))
+        return cellular_signature, list(recommendations), list(alerts)
+    
+    def _personalize(
+        self,
+        bia_data: Dict,
+        cellular_signature: Dict,
+        recommendations: List[Dict],
+        alerts: List[Dict]
+    ):
+        """
+        Reclassify against the user's own baseline (when enabled)
+        
+        Runs after _analyze because it depends on per-user state, not just
+        on the inputs, so it must never be served from result_cache.
+        Recommendations are regenerated when the contributing factors
+        changed and alerts when the risk level changed.
+        """
+        user_id = bia_data.get('user_id')
+        if self.baseline_tracker is None or user_id is None:
+            return cellular_signature, recommendations, alerts
+        
+        personalized = self.baseline_tracker.personalize(user_id, cellular_signature)
+        if personalized['contributing_factors'] != cellular_signature['contributing_factors']:
+            recommendations = self.recommendation_engine.generate_recommendations(personalized, bia_data)
+        if personalized['risk_level'] != cellular_signature['risk_level']:
+            alerts = self._generate_alerts(personalized, bia_data)
+        return personalized, recommendations, alerts
+    
+    @staticmethod
+    def _cache_key(bia_data: Dict) -> tuple:
+        """
+        Canonical key over the scoring-relevant fields
+        Defaults are applied and numbers normalized, so 80, 80.0 and an
+        omitted field all hash the same
+        """
+        key = tuple(
+            float(bia_data.get(name, default))
+            for name, default in SIGNATURE_INPUTS.items()
+        )
+        session = tuple(bia_data.get(name) for name in SESSION_INPUTS)
+        if any(value is not None for value in session):
+            key += tuple(None if value is None else float(value) for value in session)
+        return key
+    
+    def _calculate_trend(self, bia_data: Dict) -> Dict:
+        """
+        Calculate trends from the user's rolling history
+        Each observation updates the per-user state in O(1)
+        """
+        user_id = bia_data.get('user_id')
+        if user_id is None:
+            return self.trend_tracker.snapshot(None)
+        return self.trend_tracker.observe(user_id, bia_data)
+    
     def _calculate_next_assessment(self, risk_level: str) -> str:
         """
         Determine when next assessment should be done
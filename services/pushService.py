@@ -0,0 +1,178 @@
+"""
+In-process pub/sub hub for caregiver dashboards
+Pushes analyses, alerts and recommendation changes to WebSocket/SSE
+subscribers and keeps each user's latest analysis for instant snapshots
+"""
+
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+from collections import deque
+import asyncio
+import json
+import math
+
+from services.resultCache import ResultCache
+
+class PushSubscriber:
+    """
+    One connected dashboard
+
+    Idle subscribers hold only a small deque and an Event, so a worker can
+    keep tens of thousands of them. Frames are pre-encoded by the hub; a
+    subscriber that falls max_pending frames behind loses the oldest ones.
+    """
+
+    __slots__ = ("hub", "topics", "pending", "ready", "dropped", "closed")
+
+    def __init__(self, hub: "PushHub", topics: Set[str], max_pending: int):
+        self.hub = hub
+        self.topics = topics
+        self.pending: deque = deque(maxlen=max_pending)
+        self.ready = asyncio.Event()
+        self.dropped = 0
+        self.closed = False
+
+    def deliver(self, frame: Tuple[str, str]):
+        if len(self.pending) == self.pending.maxlen:
+            self.dropped += 1
+        self.pending.append(frame)
+        self.ready.set()
+
+    async def next(self, timeout: Optional[float] = None) -> Optional[List[Tuple[str, str]]]:
+        """
+        Wait for frames; returns all pending (event, json) frames, [] on
+        timeout (send a heartbeat) or None once the subscriber is closed
+        """
+        if not self.pending and not self.closed:
+            try:
+                await asyncio.wait_for(self.ready.wait(), timeout)
+            except asyncio.TimeoutError:
+                return []
+        if self.closed:
+            return None
+        self.ready.clear()
+        frames = list(self.pending)
+        self.pending.clear()
+        return frames
+
+    def close(self):
+        if not self.closed:
+            self.closed = True
+            self.ready.set()
+            self.hub.unsubscribe(self)
+
+
+class PushHub:
+    """
+    Topic-per-user pub/sub with a latest-analysis cache
+
+    Each published event is JSON-encoded once and the same frame is handed
+    to every subscriber of the user, so fan-out costs one deque append per
+    connection.
+
+    With a latest_store (a SharedStore holding every worker's latest
+    analyses under latest_namespace) snapshots and recommendation deltas
+    are read from it instead of the local cache, so a dashboard connected
+    to one worker sees analyses handled by the others. The caller writes
+    results to the store after publish_analysis().
+    """
+
+    def __init__(
+        self,
+        max_pending: int = 256,
+        latest_cache_size: int = 4096,
+        latest_store=None,
+        latest_namespace: str = "latest"
+    ):
+        self.max_pending = max_pending
+        self.latest_store = latest_store
+        self.latest_namespace = latest_namespace
+        # Latest analysis per user when there is no shared store; LRU-bounded, never expires
+        self.latest_cache = ResultCache(max_entries=latest_cache_size, ttl=math.inf)
+        self.published = 0
+        self.delivered = 0
+        self.connections = 0
+        self._topics: Dict[str, Set[PushSubscriber]] = {}
+
+    def subscribe(self, user_ids: Iterable[str]) -> PushSubscriber:
+        subscriber = PushSubscriber(self, set(user_ids), self.max_pending)
+        self.connections += 1
+        for user_id in subscriber.topics:
+            self._topics.setdefault(user_id, set()).add(subscriber)
+        return subscriber
+
+    def unsubscribe(self, subscriber: PushSubscriber):
+        self.connections -= 1
+        for user_id in subscriber.topics:
+            subscribers = self._topics.get(user_id)
+            if subscribers is not None:
+                subscribers.discard(subscriber)
+                if not subscribers:
+                    del self._topics[user_id]
+
+    @staticmethod
+    def encode(event: str, user_id: str, data) -> str:
+        return json.dumps({"event": event, "user_id": user_id, "data": data})
+
+    def publish(self, user_id: str, event: str, data) -> int:
+        """Send an event to the user's subscribers; returns how many received it"""
+        subscribers = self._topics.get(user_id)
+        self.published += 1
+        if not subscribers:
+            return 0
+        frame = (event, self.encode(event, user_id, data))
+        for subscriber in subscribers:
+            subscriber.deliver(frame)
+        self.delivered += len(subscribers)
+        return len(subscribers)
+
+    def publish_analysis(self, result: Dict):
+        """Cache a new orchestration result and push it plus any recommendation change"""
+        user_id = result.get("user_id")
+        if user_id is None:
+            return
+        if self.latest_store is None:
+            previous = self.latest_cache.get(user_id)
+            self.latest_cache.put(user_id, result)
+        if user_id not in self._topics:
+            return
+        if self.latest_store is not None:
+            # Not yet replaced by this result (see the class docstring)
+            previous = self.latest(user_id)
+
+        self.publish(user_id, "analysis", result)
+        delta = recommendation_delta(
+            previous.get("recommendations", []) if previous else [],
+            result.get("recommendations", [])
+        )
+        if delta is not None:
+            self.publish(user_id, "recommendations", delta)
+
+    def latest(self, user_id: str) -> Optional[Dict]:
+        if self.latest_store is not None:
+            return self.latest_store.get_json(self.latest_namespace, user_id)
+        return self.latest_cache.get(user_id)
+
+    def remember(self, result: Dict):
+        """Seed the cache (e.g. from storage) without notifying anyone"""
+        if self.latest_store is None:
+            self.latest_cache.put(result["user_id"], result)
+
+    def stats(self) -> Dict:
+        return {
+            "connections": self.connections,
+            "topics": len(self._topics),
+            "published": self.published,
+            "delivered": self.delivered,
+            "latest_cached": len(self.latest_cache),
+        }
+
+
+def recommendation_delta(previous: List[Dict], current: List[Dict]) -> Optional[Dict]:
+    """Added/removed recommendations by category, or None when unchanged"""
+    before = {r.get("category"): r for r in previous}
+    after = {r.get("category"): r for r in current}
+    added = [r for category, r in after.items() if category not in before]
+    removed = [category for category in before if category not in after]
+    if not added and not removed:
+        return None
+    return {"added": added, "removed": removed, "current": [r.get("category") for r in current]}
@@ -0,0 +1,227 @@
+"""
+Cross-worker shared state
+Key/value store in a local SQLite WAL file, shared by every uvicorn worker
+on the host, with a per-process read-through cache
+"""
+
+from typing import Any, Callable, Dict, Hashable, List, Optional, Tuple
+from collections import OrderedDict
+import os
+import sqlite3
+import threading
+
+from services.codecService import dumps, loads
+
+SHARED_SCHEMA = """
+CREATE TABLE IF NOT EXISTS kv (
+    namespace TEXT NOT NULL,
+    key TEXT NOT NULL,
+    version INTEGER NOT NULL,
+    value BLOB NOT NULL,
+    PRIMARY KEY (namespace, key)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS idx_kv_version ON kv (version);
+"""
+
+# A refresh touching more rows than this drops the whole cache instead
+_MAX_REFRESH_ROWS = 10000
+
+
+class SharedStore:
+    """
+    Host-wide key/value store for per-user state
+
+    The SQLite file is the single copy of the state: every worker process
+    maps the same pages through the OS page cache, so memory does not grow
+    with the worker count beyond each process's bounded cache.
+
+    Reads are served from an LRU of raw values. Before each read the cache
+    is validated with PRAGMA data_version, which changes only when another
+    connection has committed; the rows written since (every write bumps a
+    global version) are then refreshed in place. A cache hit costs one
+    pragma and a dict lookup, a miss one primary-key lookup.
+
+    update() is an atomic read-modify-write across processes
+    (BEGIN IMMEDIATE), for state folded incrementally by whichever worker
+    receives the request. Connections are opened lazily per process, so a
+    store can be handed to forked or spawned workers.
+    """
+
+    def __init__(self, path: str, cache_size: int = 4096, timeout: float = 5.0):
+        self.path = path
+        self.cache_size = cache_size
+        self.timeout = timeout
+        self.hits = 0
+        self.misses = 0
+        self.refreshes = 0
+        self.writes = 0
+        self._reset()
+
+    def _reset(self):
+        self._pid = os.getpid()
+        self._reader: Optional[sqlite3.Connection] = None
+        self._writer: Optional[sqlite3.Connection] = None
+        self._read_lock = threading.Lock()
+        self._write_lock = threading.Lock()
+        self._cache: "OrderedDict[Hashable, Optional[bytes]]" = OrderedDict()
+        self._data_version = None
+        self._seen_version = 0
+
+    def __getstate__(self) -> Dict:
+        return {"path": self.path, "cache_size": self.cache_size, "timeout": self.timeout}
+
+    def __setstate__(self, state: Dict):
+        self.__init__(**state)
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.path, timeout=self.timeout, check_same_thread=False, isolation_level=None)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        return conn
+
+    def _connections(self) -> Tuple[sqlite3.Connection, sqlite3.Connection]:
+        if self._pid != os.getpid():
+            # Inherited through fork: never share sqlite handles across processes
+            self._reset()
+        if self._writer is None:
+            with self._write_lock:
+                if self._writer is None:
+                    writer = self._connect()
+                    writer.executescript(SHARED_SCHEMA)
+                    self._reader = self._connect()
+                    self._seen_version = self._reader.execute(
+                        "SELECT COALESCE(MAX(version), 0) FROM kv"
+                    ).fetchone()[0]
+                    self._writer = writer
+        return self._reader, self._writer
+
+    def open(self):
+        """Create the schema and connect now rather than on first use"""
+        self._connections()
+
+    def close(self):
+        with self._write_lock, self._read_lock:
+            for conn in (self._reader, self._writer):
+                if conn is not None:
+                    conn.close()
+            self._reader = self._writer = None
+            self._cache.clear()
+
+    def get(self, namespace: str, key: str) -> Optional[bytes]:
+        """Current value, None if the key was never written"""
+        reader, _ = self._connections()
+        with self._read_lock:
+            self._validate(reader)
+            cache_key = (namespace, key)
+            if cache_key in self._cache:
+                self._cache.move_to_end(cache_key)
+                self.hits += 1
+                return self._cache[cache_key]
+            self.misses += 1
+            row = reader.execute(
+                "SELECT value FROM kv WHERE namespace = ? AND key = ?", (namespace, key)
+            ).fetchone()
+            value = row[0] if row else None
+            self._remember(cache_key, value)
+            return value
+
+    def put(self, namespace: str, key: str, value: bytes):
+        self.update(namespace, key, lambda _: (value, None))
+
+    def put_many(self, namespace: str, items: List[Tuple[str, bytes]]):
+        """Write several keys in one transaction (later duplicates win)"""
+        _, writer = self._connections()
+        with self._write_lock:
+            writer.execute("BEGIN IMMEDIATE")
+            try:
+                version = writer.execute("SELECT COALESCE(MAX(version), 0) FROM kv").fetchone()[0]
+                writer.executemany(
+                    "INSERT OR REPLACE INTO kv (namespace, key, version, value) VALUES (?, ?, ?, ?)",
+                    [(namespace, key, version + i, value) for i, (key, value) in enumerate(items, 1)]
+                )
+                writer.execute("COMMIT")
+            except BaseException:
+                writer.execute("ROLLBACK")
+                raise
+            self.writes += len(items)
+        with self._read_lock:
+            for key, _ in items:
+                self._cache.pop((namespace, key), None)
+
+    def update(self, namespace: str, key: str, fn: Callable[[Optional[bytes]], Tuple[bytes, Any]]) -> Any:
+        """
+        Atomically replace a value with fn(current)[0] and return fn(current)[1]
+
+        Concurrent updates of any key from any process are serialized, so
+        fn always sees the latest committed value.
+        """
+        _, writer = self._connections()
+        with self._write_lock:
+            writer.execute("BEGIN IMMEDIATE")
+            try:
+                row = writer.execute(
+                    "SELECT value FROM kv WHERE namespace = ? AND key = ?", (namespace, key)
+                ).fetchone()
+                value, result = fn(row[0] if row else None)
+                writer.execute(
+                    "INSERT OR REPLACE INTO kv (namespace, key, version, value) "
+                    "VALUES (?, ?, (SELECT COALESCE(MAX(version), 0) + 1 FROM kv), ?)",
+                    (namespace, key, value)
+                )
+                writer.execute("COMMIT")
+            except BaseException:
+                writer.execute("ROLLBACK")
+                raise
+            self.writes += 1
+        # Drop rather than cache our value: a newer write from another worker
+        # may already have been refreshed into the cache
+        with self._read_lock:
+            self._cache.pop((namespace, key), None)
+        return result
+
+    def get_json(self, namespace: str, key: str) -> Optional[Any]:
+        value = self.get(namespace, key)
+        return loads(value) if value is not None else None
+
+    def put_json(self, namespace: str, key: str, obj: Any):
+        self.put(namespace, key, dumps(obj))
+
+    def _remember(self, cache_key: Hashable, value: Optional[bytes]):
+        self._cache[cache_key] = value
+        self._cache.move_to_end(cache_key)
+        while len(self._cache) > self.cache_size:
+            self._cache.popitem(last=False)
+
+    def _validate(self, reader: sqlite3.Connection):
+        """Refresh cached entries other connections have written since the last read"""
+        data_version = reader.execute("PRAGMA data_version").fetchone()[0]
+        if data_version == self._data_version:
+            return
+        self._data_version = data_version
+        self.refreshes += 1
+        rows = reader.execute(
+            "SELECT namespace, key, version, value FROM kv WHERE version > ? ORDER BY version LIMIT ?",
+            (self._seen_version, _MAX_REFRESH_ROWS + 1)
+        ).fetchall()
+        if len(rows) > _MAX_REFRESH_ROWS:
+            self._cache.clear()
+            self._seen_version = reader.execute("SELECT COALESCE(MAX(version), 0) FROM kv").fetchone()[0]
+            return
+        for namespace, key, version, value in rows:
+            cache_key = (namespace, key)
+            if cache_key in self._cache:
+                self._cache[cache_key] = value
+            self._seen_version = version
+
+    def stats(self) -> Dict:
+        lookups = self.hits + self.misses
+        return {
+            "path": self.path,
+            "cached": len(self._cache),
+            "cache_size": self.cache_size,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": round(self.hits / lookups, 4) if lookups else 0.0,
+            "refreshes": self.refreshes,
+            "writes": self.writes,
+        }
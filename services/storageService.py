@@ -0,0 +1,653 @@
+"""
+Persistence layer for the SUZI unified database
+Pluggable storage backends with a SQLite reference implementation
+"""
+
+from typing import Any, Callable, Dict, List, Optional, Tuple
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+import asyncio
+import functools
+import json
+import sqlite3
+import time
+
+import numpy as np
+
+from services.historyStore import HistoryStore, format_risk_history, to_epoch_us
+from services.metricsService import REGISTRY, STAGE_DURATION
+from services.orchestrationService import RISK_LEVELS, factors_to_mask
+
+
+class StorageBackend:
+    """
+    Interface every storage backend implements
+    The API only talks to this interface, so backends can be swapped
+    """
+
+    async def start(self):
+        """Open connections and start background workers"""
+
+    async def close(self):
+        """Flush pending writes and release resources"""
+
+    async def flush(self):
+        """Force pending buffered writes to durable storage"""
+
+    async def save_analysis(self, result: Dict):
+        raise NotImplementedError
+
+    async def save_analyses(self, results: List[Dict]):
+        """
+        Durably write several results before returning; on error none of
+        them count as saved, so the caller can retry the whole batch
+        """
+        for result in results:
+            await self.save_analysis(result)
+        await self.flush()
+
+    async def save_assessment(self, assessment: Dict):
+        raise NotImplementedError
+
+    async def save_behavior_event(self, event: Dict):
+        raise NotImplementedError
+
+    async def save_vital_sign(self, vital: Dict):
+        raise NotImplementedError
+
+    async def save_vital_signs_bulk(self, batch) -> int:
+        """Write a VitalsBatch in one operation, returning rows inserted"""
+        raise NotImplementedError
+
+    async def fetch_sync_cursors(self, user_id: str, device_id: str) -> Dict[str, int]:
+        """Per vital type high-water mark (epoch ms) already stored for a device"""
+        raise NotImplementedError
+
+    async def save_vitals_delta(self, batch, device_id: str) -> Dict:
+        """
+        Store the samples of a VitalsBatch newer than the device's cursors and
+        advance the cursors, atomically. Returns inserted/stale counts and
+        the new cursors.
+        """
+        raise NotImplementedError
+
+    async def fetch_risk_history(self, user_id: str, days: int, resolution: str = "raw") -> List[Dict]:
+        raise NotImplementedError
+
+    async def fetch_risk_histories(
+        self,
+        user_ids: List[str],
+        days: int,
+        resolution: str = "raw"
+    ) -> Dict[str, List[Dict]]:
+        """Risk history for several users (e.g. a caregiver group)"""
+        return {
+            user_id: await self.fetch_risk_history(user_id, days, resolution)
+            for user_id in user_ids
+        }
+
+    async def fetch_latest_analysis(self, user_id: str) -> Optional[Dict]:
+        raise NotImplementedError
+
+    async def health(self) -> Dict:
+        """Component status for /health"""
+        return {"status": "unknown", "backend": type(self).__name__}
+
+
+class AsyncConnectionPool:
+    """
+    Fixed-size pool of SQLite connections driven from asyncio
+
+    Each call checks out an idle connection and runs the blocking sqlite3
+    work on a dedicated thread pool, so the event loop never blocks on I/O.
+    """
+
+    def __init__(self, path: str, size: int = 4):
+        # A private in-memory database only exists on its own connection
+        self.path = path
+        self.size = 1 if path == ":memory:" else size
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._idle: Optional[asyncio.Queue] = None
+        self._connections: List[sqlite3.Connection] = []
+
+    async def open(self):
+        self._executor = ThreadPoolExecutor(
+            max_workers=self.size,
+            thread_name_prefix="sqlite-pool"
+        )
+        self._idle = asyncio.Queue()
+        loop = asyncio.get_running_loop()
+        for _ in range(self.size):
+            conn = await loop.run_in_executor(self._executor, self._connect)
+            self._connections.append(conn)
+            self._idle.put_nowait(conn)
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute("PRAGMA busy_timeout=5000")
+        return conn
+
+    async def run(self, fn: Callable[..., Any], *args) -> Any:
+        """Run fn(conn, *args) on a pooled connection"""
+        conn = await self._idle.get()
+        try:
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(self._executor, fn, conn, *args)
+        finally:
+            self._idle.put_nowait(conn)
+
+    async def close(self):
+        for conn in self._connections:
+            conn.close()
+        self._connections = []
+        if self._executor is not None:
+            self._executor.shutdown(wait=True)
+            self._executor = None
+
+
+WRITE_BEHIND_FAILURES = REGISTRY.counter(
+    "bia_write_behind_failures",
+    "Write-behind flushes that failed and were requeued"
+)
+
+
+class WriteBehindQueue:
+    """
+    Buffers inserts and writes them in batched transactions
+
+    Rows are flushed by a background task when the buffer reaches
+    max_batch_size rows or flush_interval seconds have passed since the
+    oldest pending row, whichever comes first. Producers are held back once
+    max_pending rows are buffered.
+
+    A failed flush (e.g. "database is locked") puts its rows back ahead of
+    newer ones, and the background task retries with exponential backoff
+    up to max_backoff seconds; rows are never dropped. on_commit callbacks
+    run once their rows are committed, and only then.
+    """
+
+    def __init__(
+        self,
+        pool: AsyncConnectionPool,
+        max_batch_size: int = 500,
+        flush_interval: float = 0.5,
+        max_pending: int = 50000,
+        max_backoff: float = 30.0
+    ):
+        self.pool = pool
+        self.max_batch_size = max_batch_size
+        self.flush_interval = flush_interval
+        self.max_pending = max_pending
+        self.max_backoff = max_backoff
+        self.rows_written = 0
+        self.flush_count = 0
+        self.failed_flushes = 0
+        self._failures = 0
+        self._buffers: Dict[str, List[Tuple]] = {}
+        self._callbacks: List[Callable[[], None]] = []
+        self._pending = 0
+        self._oldest: Optional[float] = None
+        self._wakeup: Optional[asyncio.Event] = None
+        self._flush_lock: Optional[asyncio.Lock] = None
+        self._task: Optional[asyncio.Task] = None
+
+    @property
+    def pending(self) -> int:
+        return self._pending
+
+    async def start(self):
+        self._wakeup = asyncio.Event()
+        self._flush_lock = asyncio.Lock()
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        await self.flush()
+
+    async def put(self, sql: str, row: Tuple, on_commit: Optional[Callable[[], None]] = None):
+        """Queue one row for the given INSERT statement"""
+        await self.put_many(sql, [row], on_commit)
+
+    async def put_many(self, sql: str, rows: List[Tuple], on_commit: Optional[Callable[[], None]] = None):
+        """Queue several rows for the given INSERT statement"""
+        if self._pending >= self.max_pending:
+            await self.flush()
+
+        self._buffers.setdefault(sql, []).extend(rows)
+        if on_commit is not None:
+            self._callbacks.append(on_commit)
+        self._pending += len(rows)
+        if self._oldest is None:
+            self._oldest = time.monotonic()
+        # While backing off after a failure, the retry timer decides
+        if self._pending >= self.max_batch_size and not self._failures:
+            self._wakeup.set()
+
+    async def flush(self):
+        """Write everything buffered so far"""
+        async with self._flush_lock:
+            if not self._pending:
+                return
+            buffers, callbacks, oldest = self._buffers, self._callbacks, self._oldest
+            self._buffers = {}
+            self._callbacks = []
+            self._pending = 0
+            self._oldest = None
+            try:
+                with STAGE_DURATION.time("db_write_behind_flush"):
+                    await self.pool.run(self._write, buffers)
+            except Exception:
+                # Requeue ahead of rows buffered meanwhile, keeping insert order
+                for sql, rows in self._buffers.items():
+                    buffers.setdefault(sql, []).extend(rows)
+                self._buffers = buffers
+                self._callbacks = callbacks + self._callbacks
+                self._pending = sum(len(rows) for rows in buffers.values())
+                self._oldest = oldest
+                self._failures += 1
+                self.failed_flushes += 1
+                WRITE_BEHIND_FAILURES.inc()
+                raise
+            self._failures = 0
+            self.rows_written += sum(len(rows) for rows in buffers.values())
+            self.flush_count += 1
+            for callback in callbacks:
+                try:
+                    callback()
+                except Exception as e:
+                    print(f"[DB] Write-behind commit callback failed: {e}")
+
+    @staticmethod
+    def _write(conn: sqlite3.Connection, buffers: Dict[str, List[Tuple]]):
+        conn.execute("BEGIN")
+        try:
+            for sql, rows in buffers.items():
+                conn.executemany(sql, rows)
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+
+    async def _run(self):
+        while True:
+            timeout = self.flush_interval
+            if self._failures:
+                timeout = min(self.max_backoff, self.flush_interval * 2 ** self._failures)
+            elif self._oldest is not None:
+                timeout = max(0.0, self._oldest + self.flush_interval - time.monotonic())
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+
+            due = (
+                self._failures or
+                self._pending >= self.max_batch_size or
+                (self._oldest is not None and
+                 time.monotonic() - self._oldest >= self.flush_interval)
+            )
+            if due:
+                try:
+                    await self.flush()
+                except Exception as e:
+                    # The batch stays buffered and is retried after a backoff
+                    print(f"[DB] Write-behind flush failed, {self._pending} rows requeued: {e}")
+
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS analyses (
+    id INTEGER PRIMARY KEY,
+    user_id TEXT NOT NULL,
+    timestamp TEXT NOT NULL,
+    ad_risk_score REAL,
+    risk_level TEXT,
+    payload TEXT NOT NULL,
+    age INTEGER,
+    factor_mask INTEGER
+);
+CREATE INDEX IF NOT EXISTS idx_analyses_user_ts ON analyses (user_id, timestamp);
+
+CREATE TABLE IF NOT EXISTS assessments (
+    id INTEGER PRIMARY KEY,
+    user_id TEXT NOT NULL,
+    timestamp TEXT NOT NULL,
+    type TEXT,
+    score REAL,
+    duration INTEGER,
+    errors INTEGER
+);
+CREATE INDEX IF NOT EXISTS idx_assessments_user_ts ON assessments (user_id, timestamp);
+
+CREATE TABLE IF NOT EXISTS behavior_events (
+    id INTEGER PRIMARY KEY,
+    user_id TEXT NOT NULL,
+    timestamp TEXT NOT NULL,
+    type TEXT,
+    severity INTEGER,
+    notes TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_behavior_events_user_ts ON behavior_events (user_id, timestamp);
+
+CREATE TABLE IF NOT EXISTS vital_signs (
+    id INTEGER PRIMARY KEY,
+    user_id TEXT NOT NULL,
+    timestamp TEXT NOT NULL,
+    type TEXT,
+    value REAL,
+    unit TEXT,
+    source TEXT,
+    metadata TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_vital_signs_user_ts ON vital_signs (user_id, timestamp);
+CREATE UNIQUE INDEX IF NOT EXISTS idx_vital_signs_dedupe ON vital_signs (user_id, type, timestamp);
+
+CREATE TABLE IF NOT EXISTS sync_cursors (
+    user_id TEXT NOT NULL,
+    device_id TEXT NOT NULL,
+    type TEXT NOT NULL,
+    high_water_ms INTEGER NOT NULL,
+    updated_at TEXT NOT NULL,
+    PRIMARY KEY (user_id, device_id, type)
+) WITHOUT ROWID;
+"""
+
+# Columns added after the first release: (table, column, declaration)
+MIGRATIONS = (
+    ("analyses", "age", "INTEGER"),
+    ("analyses", "factor_mask", "INTEGER"),
+)
+
+INSERT_ANALYSIS = (
+    "INSERT INTO analyses (user_id, timestamp, ad_risk_score, risk_level, payload, age, factor_mask) "
+    "VALUES (?, ?, ?, ?, ?, ?, ?)"
+)
+INSERT_ASSESSMENT = (
+    "INSERT INTO assessments (user_id, timestamp, type, score, duration, errors) "
+    "VALUES (?, ?, ?, ?, ?, ?)"
+)
+INSERT_BEHAVIOR_EVENT = (
+    "INSERT INTO behavior_events (user_id, timestamp, type, severity, notes) "
+    "VALUES (?, ?, ?, ?, ?)"
+)
+INSERT_VITAL_SIGN = (
+    "INSERT OR IGNORE INTO vital_signs (user_id, timestamp, type, value, unit, source, metadata) "
+    "VALUES (?, ?, ?, ?, ?, ?, ?)"
+)
+UPSERT_SYNC_CURSOR = (
+    "INSERT INTO sync_cursors (user_id, device_id, type, high_water_ms, updated_at) "
+    "VALUES (?, ?, ?, ?, ?) "
+    "ON CONFLICT (user_id, device_id, type) DO UPDATE SET "
+    "high_water_ms = MAX(high_water_ms, excluded.high_water_ms), updated_at = excluded.updated_at"
+)
+
+
+class SQLiteStorage(StorageBackend):
+    """
+    SQLite reference backend
+    Writes go through a write-behind queue; reads flush it first so a
+    caller always sees its own writes. With a HistoryStore, analyses are
+    also appended to it and risk history is served from it.
+    """
+
+    def __init__(
+        self,
+        path: str = "suzi.db",
+        pool_size: int = 4,
+        max_batch_size: int = 500,
+        flush_interval: float = 0.5,
+        max_pending: int = 50000,
+        history: Optional[HistoryStore] = None
+    ):
+        self.history = history
+        self.pool = AsyncConnectionPool(path, pool_size)
+        self.writer = WriteBehindQueue(
+            self.pool,
+            max_batch_size=max_batch_size,
+            flush_interval=flush_interval,
+            max_pending=max_pending
+        )
+
+    async def start(self):
+        await self.pool.open()
+        await self.pool.run(self._migrate)
+        await self.writer.start()
+        if self.history is not None:
+            await self.history.start()
+
+    @staticmethod
+    def _migrate(conn: sqlite3.Connection):
+        """Create missing tables and add columns older databases lack"""
+        conn.executescript(SCHEMA)
+        for table, column, declaration in MIGRATIONS:
+            existing = {row[1] for row in conn.execute(f"PRAGMA table_info({table})")}
+            if column not in existing:
+                conn.execute(f"ALTER TABLE {table} ADD COLUMN {column} {declaration}")
+
+    async def close(self):
+        if self.history is not None:
+            await self.history.close()
+        await self.writer.stop()
+        await self.pool.close()
+
+    async def flush(self):
+        await self.writer.flush()
+
+    @staticmethod
+    def _analysis_row(result: Dict) -> Tuple:
+        signature = result.get('cellular_signature', {})
+        return (
+            result['user_id'],
+            result['timestamp'],
+            signature.get('ad_risk_score'),
+            signature.get('risk_level'),
+            json.dumps(result),
+            result.get('age'),
+            factors_to_mask(signature.get('contributing_factors', []))
+        )
+
+    async def save_analysis(self, result: Dict):
+        # History rows are appended once the analysis row is committed, so a
+        # failed flush never leaves them in the history alone
+        on_commit = None
+        if self.history is not None:
+            on_commit = functools.partial(self.history.append, result)
+        await self.writer.put(INSERT_ANALYSIS, self._analysis_row(result), on_commit)
+
+    async def save_analyses(self, results: List[Dict]):
+        # Bypasses the write-behind buffer: a failed batch is rolled back
+        # rather than requeued, so retrying it cannot write rows twice
+        with STAGE_DURATION.time("db_analyses_batch"):
+            await self.pool.run(self._write_rows, INSERT_ANALYSIS, [self._analysis_row(r) for r in results])
+        if self.history is not None:
+            for result in results:
+                self.history.append(result)
+
+    async def save_assessment(self, assessment: Dict):
+        await self.writer.put(INSERT_ASSESSMENT, (
+            assessment['user_id'],
+            assessment['timestamp'],
+            assessment.get('type'),
+            assessment.get('score'),
+            assessment.get('duration'),
+            assessment.get('errors')
+        ))
+
+    async def save_behavior_event(self, event: Dict):
+        await self.writer.put(INSERT_BEHAVIOR_EVENT, (
+            event['user_id'],
+            event['timestamp'],
+            event.get('type'),
+            event.get('severity'),
+            event.get('notes')
+        ))
+
+    async def save_vital_sign(self, vital: Dict):
+        metadata = vital.get('metadata')
+        await self.writer.put(INSERT_VITAL_SIGN, (
+            vital['user_id'],
+            str(vital.get('timestamp')),
+            vital.get('type'),
+            vital.get('value'),
+            vital.get('unit'),
+            vital.get('source'),
+            json.dumps(metadata) if metadata is not None else None
+        ))
+
+    async def save_vital_signs_bulk(self, batch) -> int:
+        with STAGE_DURATION.time("db_vitals_bulk"):
+            return await self.pool.run(self._write_rows, INSERT_VITAL_SIGN, list(batch.rows()))
+
+    @staticmethod
+    def _write_rows(conn: sqlite3.Connection, sql: str, rows: List[Tuple]) -> int:
+        """Insert rows in one transaction, returning how many were inserted"""
+        before = conn.total_changes
+        conn.execute("BEGIN")
+        try:
+            conn.executemany(sql, rows)
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        return conn.total_changes - before
+
+    async def fetch_sync_cursors(self, user_id: str, device_id: str) -> Dict[str, int]:
+        return await self.pool.run(self._read_cursors, user_id, device_id)
+
+    @staticmethod
+    def _read_cursors(conn: sqlite3.Connection, user_id: str, device_id: str) -> Dict[str, int]:
+        return dict(conn.execute(
+            "SELECT type, high_water_ms FROM sync_cursors WHERE user_id = ? AND device_id = ?",
+            (user_id, device_id)
+        ).fetchall())
+
+    async def save_vitals_delta(self, batch, device_id: str) -> Dict:
+        with STAGE_DURATION.time("db_vitals_delta"):
+            return await self.pool.run(self._apply_delta, batch, device_id)
+
+    @classmethod
+    def _apply_delta(cls, conn: sqlite3.Connection, batch, device_id: str) -> Dict:
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            cursors = cls._read_cursors(conn, batch.user_id, device_id)
+            types = np.asarray(batch.types, dtype=object)
+            floor = np.fromiter(
+                (cursors.get(t, -1) for t in batch.types),
+                dtype=np.int64,
+                count=len(batch)
+            )
+            fresh = batch.epoch_ms > floor
+            new_rows = batch.select(fresh)
+
+            before = conn.total_changes
+            conn.executemany(INSERT_VITAL_SIGN, new_rows.rows())
+            inserted = conn.total_changes - before
+
+            now = datetime.now().isoformat()
+            advanced = []
+            for vital_type in set(new_rows.types):
+                high_water = int(new_rows.epoch_ms[types[fresh] == vital_type].max())
+                cursors[vital_type] = high_water
+                advanced.append((batch.user_id, device_id, vital_type, high_water, now))
+            conn.executemany(UPSERT_SYNC_CURSOR, advanced)
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        return {
+            "inserted": inserted,
+            "stale": len(batch) - len(new_rows),
+            "cursors": cursors,
+        }
+
+    async def fetch_risk_history(self, user_id: str, days: int, resolution: str = "raw") -> List[Dict]:
+        histories = await self.fetch_risk_histories([user_id], days, resolution)
+        return histories[user_id]
+
+    async def fetch_risk_histories(
+        self,
+        user_ids: List[str],
+        days: int,
+        resolution: str = "raw"
+    ) -> Dict[str, List[Dict]]:
+        now = datetime.now()
+        if self.history is not None:
+            since = to_epoch_us((now - timedelta(days=days)).isoformat())
+            until = to_epoch_us(now.isoformat())
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(None, self._history_for, user_ids, since, until, resolution)
+
+        if self.writer.pending:
+            await self.writer.flush()
+        since = (now - timedelta(days=days)).isoformat()
+        histories = {}
+        for user_id in user_ids:
+            rows = await self.pool.run(
+                lambda conn: conn.execute(
+                    "SELECT timestamp, ad_risk_score, risk_level FROM analyses "
+                    "WHERE user_id = ? AND timestamp >= ? ORDER BY timestamp",
+                    (user_id, since)
+                ).fetchall()
+            )
+            histories[user_id] = format_risk_history(
+                np.array([to_epoch_us(timestamp) for timestamp, _, _ in rows], dtype=np.int64),
+                np.array([score for _, score, _ in rows], dtype=np.float64),
+                np.array([RISK_LEVELS.index(level) for _, _, level in rows], dtype=np.uint8),
+                resolution
+            )
+        return histories
+
+    def _history_for(self, user_ids: List[str], since: int, until: int, resolution: str) -> Dict[str, List[Dict]]:
+        return {
+            user_id: self.history.risk_history(user_id, since, until, resolution)
+            for user_id in user_ids
+        }
+
+    async def fetch_latest_analysis(self, user_id: str) -> Optional[Dict]:
+        if self.writer.pending:
+            await self.writer.flush()
+        row = await self.pool.run(
+            lambda conn: conn.execute(
+                "SELECT payload FROM analyses WHERE user_id = ? "
+                "ORDER BY timestamp DESC LIMIT 1",
+                (user_id,)
+            ).fetchone()
+        )
+        return json.loads(row[0]) if row else None
+
+    async def health(self) -> Dict:
+        started = time.perf_counter()
+        try:
+            await self.pool.run(lambda conn: conn.execute("SELECT 1").fetchone())
+        except Exception as e:
+            return {"status": "error", "backend": "sqlite", "error": str(e)}
+        return {
+            "status": "ok",
+            "backend": "sqlite",
+            "path": self.pool.path,
+            "ping_ms": round((time.perf_counter() - started) * 1000, 3),
+            "pending_writes": self.writer.pending,
+            "rows_written": self.writer.rows_written,
+            "failed_flushes": self.writer.failed_flushes,
+            "history": self.history.stats() if self.history is not None else None,
+        }
+
+
+def create_storage(url: str, history_path: Optional[str] = None) -> StorageBackend:
+    """
+    Build a storage backend from a URL
+    Supported: sqlite:///path/to/file.db, sqlite:///:memory:
+    history_path enables the columnar risk history store in that directory
+    """
+    if url.startswith("sqlite:///"):
+        history = HistoryStore(history_path) if history_path else None
+        return SQLiteStorage(url[len("sqlite:///"):], history=history)
+    raise ValueError(f"Unsupported storage URL: {url}")
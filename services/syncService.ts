@@ -1,5 +1,78 @@
+import AsyncStorage from '@react-native-async-storage/async-storage';
 import { healthService } from './healthService';
 import { useNeuroStore } from '@/store/neuroStore';
+import { VitalSign } from '@/types/neuro';
+
+// Binary vitals frame (see services/vitalsService.py): 9 bytes per sample
+const VITALS_FRAME_CONTENT_TYPE = 'application/x-bia-vitals';
+const VITALS_FRAME_VERSION = 1;
+// Per-sample offsets are u32 milliseconds, so one frame spans at most ~49.7 days
+const MAX_FRAME_SPAN_MS = 0xFFFFFFFF;
+const DEVICE_ID_KEY = 'bia.sync.deviceId';
+
+function encodeVitalsFrame(vitals: VitalSign[], source: string): ArrayBuffer {
+  const encoder = new TextEncoder();
+  const types: string[] = [];
+  const units: string[] = [];
+  const typeIndex = new Map<string, number>();
+  vitals.forEach(vital => {
+    if (!typeIndex.has(vital.type)) {
+      typeIndex.set(vital.type, types.length);
+      types.push(vital.type);
+      units.push(vital.unit || '');
+    }
+  });
+
+  const times = vitals.map(vital => new Date(vital.timestamp).getTime());
+  const baseMs = times.reduce((min, time) => Math.min(min, time), times.length ? times[0] : 0);
+  const strings = [source, ...types.flatMap((type, i) => [type, units[i]])].map(s => encoder.encode(s));
+  const headerSize = 18 + strings.reduce((size, bytes) => size + 1 + bytes.length, 0);
+
+  const buffer = new ArrayBuffer(headerSize + vitals.length * 9);
+  const view = new DataView(buffer);
+  const bytes = new Uint8Array(buffer);
+  bytes.set(encoder.encode('BIAV'), 0);
+  view.setUint8(4, VITALS_FRAME_VERSION);
+  view.setUint8(5, types.length);
+  view.setUint32(6, vitals.length, true);
+  view.setBigInt64(10, BigInt(baseMs), true);
+
+  let offset = 18;
+  strings.forEach(value => {
+    view.setUint8(offset, value.length);
+    bytes.set(value, offset + 1);
+    offset += 1 + value.length;
+  });
+  vitals.forEach((vital, i) => {
+    const offsetMs = times[i] - baseMs;
+    if (!(offsetMs >= 0 && offsetMs <= MAX_FRAME_SPAN_MS)) {
+      throw new RangeError(`Vitals frame spans more than ${MAX_FRAME_SPAN_MS} ms; split it with splitVitalsFrames`);
+    }
+    view.setUint8(offset, typeIndex.get(vital.type)!);
+    view.setUint32(offset + 1, offsetMs, true);
+    view.setFloat32(offset + 5, vital.value, true);
+    offset += 9;
+  });
+  return buffer;
+}
+
+// Time-ordered groups of samples that each fit in one frame
+function splitVitalsFrames(vitals: VitalSign[]): VitalSign[][] {
+  const sorted = [...vitals].sort(
+    (a, b) => new Date(a.timestamp).getTime() - new Date(b.timestamp).getTime()
+  );
+  const frames: VitalSign[][] = [];
+  let frameStart = 0;
+  sorted.forEach(vital => {
+    const time = new Date(vital.timestamp).getTime();
+    if (frames.length === 0 || time - frameStart > MAX_FRAME_SPAN_MS) {
+      frames.push([]);
+      frameStart = time;
+    }
+    frames[frames.length - 1].push(vital);
+  });
+  return frames;
+}
 
 /**
  * Background sync service for HealthKit/Health Connect data
@@ -8,6 +81,35 @@ import { useNeuroStore } from '@/store/neuroStore';
 class SyncService {
   private syncInterval: NodeJS.Timeout | null = null;
   private isSyncing: boolean = false;
+  // Newest sample time (epoch ms) the backend has per vital type, from the last delta sync
+  private cursors: Record<string, number> = {};
+  private deviceId: string | null = null;
+  private userId: string | null = null;
+  // User the cursors above belong to
+  private cursorsUserId: string | null = null;
+
+  // Overrides the signed-in user from the store (useNeuroStore().setUserId)
+  setUser(userId: string | null) {
+    this.userId = userId;
+  }
+
+  private resolveUserId(): string | null {
+    return this.userId ?? useNeuroStore.getState().userId;
+  }
+
+  // Stable per-install id, so each device of a user keeps its own sync cursors
+  private async getDeviceId(): Promise<string> {
+    if (this.deviceId) {
+      return this.deviceId;
+    }
+    let deviceId = await AsyncStorage.getItem(DEVICE_ID_KEY);
+    if (!deviceId) {
+      deviceId = `${Date.now().toString(36)}-${Math.random().toString(36).slice(2, 12)}`;
+      await AsyncStorage.setItem(DEVICE_ID_KEY, deviceId);
+    }
+    this.deviceId = deviceId;
+    return deviceId;
+  }
 
   async startBackgroundSync(intervalMinutes: number = 30) {
     // Initialize health service
@@ -29,6 +131,11 @@ class SyncService {
       this.performSync();
     }, intervalMinutes * 60 * 1000);
 
+    // Restore the signed-in user if the app shell has not yet
+    if (!this.resolveUserId()) {
+      await useNeuroStore.getState().loadUserId();
+    }
+
     // Perform initial sync
     await this.performSync();
   }
@@ -66,16 +173,27 @@ class SyncService {
 
       console.log('Health data sync completed');
       
-      // Send to SUZI backend (shared database)
-      await this.syncToBackend({
-        timestamp: new Date(),
-        vitals: [...data.steps, ...data.heartRate, ...data.hrv],
-        sleep: data.sleep,
-        deviceInfo: {
-          platform: 'ios', // or 'android'
-          source: 'healthkit' // or 'health_connect'
-        }
-      });
+      // Send to SUZI backend (shared database): new vitals only, then sleep
+      const vitals = [...data.steps, ...data.heartRate, ...data.hrv];
+      // Delta sync needs the user id for its per-device cursors; without a
+      // signed-in user, fall back to the full sync (user resolved from the token)
+      const userId = this.resolveUserId();
+      if (!userId) {
+        console.warn('No signed-in user, skipping delta sync');
+      }
+      const deltaSynced = userId ? await this.syncVitalsDelta(userId, vitals) : false;
+      if (!deltaSynced || data.sleep) {
+        await this.syncToBackend({
+          userId: userId ?? undefined,
+          timestamp: new Date(),
+          vitals: deltaSynced ? [] : vitals,
+          sleep: data.sleep,
+          deviceInfo: {
+            platform: 'ios', // or 'android'
+            source: 'healthkit' // or 'health_connect'
+          }
+        });
+      }
       
     } catch (error) {
       console.error('Sync failed:', error);
@@ -130,6 +248,68 @@ class SyncService {
     }
   }
   
+  async syncVitalsDelta(userId: string, vitals: VitalSign[]): Promise<boolean> {
+    if (!userId) {
+      throw new Error('syncVitalsDelta requires a user id');
+    }
+    const params = new URLSearchParams({ user_id: userId, device_id: await this.getDeviceId() });
+    if (userId !== this.cursorsUserId) {
+      this.cursors = {};
+      this.cursorsUserId = userId;
+    }
+
+    // After an app restart, ask the backend what it already has from this device
+    if (Object.keys(this.cursors).length === 0) {
+      try {
+        const response = await fetch(`https://api.suzi.health/v1/bia/sync/cursors?${params}`, {
+          headers: { 'Authorization': `Bearer ${getUserToken()}` }
+        });
+        if (response.ok) {
+          this.cursors = (await response.json()).cursors;
+        }
+      } catch (error) {
+        console.warn('Could not fetch sync cursors, sending all samples:', error);
+      }
+    }
+
+    // Only samples newer than what the backend already has from this device
+    const fresh = vitals.filter(
+      vital => new Date(vital.timestamp).getTime() > (this.cursors[vital.type] ?? -1)
+    );
+    if (fresh.length === 0) {
+      return true;
+    }
+
+    try {
+      // Oldest first, so the cursors only advance past samples already stored
+      let synced = 0;
+      for (const frame of splitVitalsFrames(fresh)) {
+        const response = await fetch(`https://api.suzi.health/v1/bia/sync/delta?${params}`, {
+          method: 'POST',
+          headers: {
+            'Content-Type': VITALS_FRAME_CONTENT_TYPE,
+            'Authorization': `Bearer ${getUserToken()}`,
+            'X-Source-App': 'NeuroTrack-BIA'
+          },
+          body: encodeVitalsFrame(frame, frame[0].source)
+        });
+
+        if (!response.ok) {
+          return false;
+        }
+
+        const result = await response.json();
+        this.cursors = result.cursors;
+        synced += result.synced_count;
+      }
+      console.log(`✅ Delta sync: ${synced} new vitals (${fresh.length} sent)`);
+      return true;
+    } catch (error) {
+      console.error('❌ Delta sync error:', error);
+      return false;
+    }
+  }
+
   async syncCognitiveAssessment(assessment: any) {
     // Enviar avaliações cognitivas para orquestração
     console.log('📤 Syncing cognitive assessment to SUZI');
@@ -0,0 +1,235 @@
+"""
+Incremental per-user trend engine
+Keeps compact rolling state per user so each observation is O(1)
+"""
+
+from typing import TYPE_CHECKING, Dict, Optional
+from array import array
+from datetime import datetime
+import math
+import threading
+
+if TYPE_CHECKING:
+    from services.sharedState import SharedStore
+
+# Metrics tracked per user, with the monthly change considered "stable"
+TREND_METRICS = {
+    "cognitive_score": 1.0,     # points (0-100) per month
+    "sleep_efficiency": 0.02,   # fraction per month
+    "hrv": 2.0,                 # ms per month
+    "steps": 500.0,             # steps/day per month
+}
+
+# Per-metric block layout inside UserTrendState.values
+_COUNT, _EWMA, _SX, _SY, _SXX, _SXY, _MIN, _MAX = range(8)
+_HEADER = 8
+
+_DAY_SECONDS = 86400.0
+
+# SharedStore namespace of the per-user states
+TREND_NAMESPACE = "trend"
+
+
+class UserTrendState:
+    """
+    Rolling trend state for one user
+
+    All numbers live in a single array('d'): for each metric a header
+    (count, EWMA, exponentially-decayed regression sums, window min/max)
+    followed by a ring buffer of the last `window` values.
+    """
+
+    __slots__ = ("origin", "values")
+
+    def __init__(self, origin: float, window: int):
+        self.origin = origin
+        self.values = array('d', bytes(8 * len(TREND_METRICS) * (_HEADER + window)))
+
+    def to_bytes(self) -> bytes:
+        return array('d', [self.origin]).tobytes() + self.values.tobytes()
+
+    @classmethod
+    def from_bytes(cls, raw: bytes) -> "UserTrendState":
+        state = cls.__new__(cls)
+        values = array('d')
+        values.frombytes(raw)
+        state.origin = values[0]
+        state.values = values[1:]
+        return state
+
+
+class TrendTracker:
+    """
+    Maintains an EWMA, a decayed streaming linear-regression slope and a
+    windowed min/max for every metric in TREND_METRICS, per user
+
+    States live in this process unless a SharedStore is given, in which
+    case every worker folds observations into the same host-wide state.
+    """
+
+    def __init__(
+        self,
+        window: int = 7,
+        alpha: float = 0.3,
+        decay: float = 0.95,
+        store: Optional["SharedStore"] = None
+    ):
+        """
+        Args:
+            window: Number of recent observations covered by min/max
+            alpha: EWMA smoothing factor
+            decay: Per-observation forgetting factor of the regression sums
+                (0.95 weights roughly the last 20 observations)
+            store: Optional cross-worker store for the per-user states
+        """
+        self.window = window
+        self.alpha = alpha
+        self.decay = decay
+        self.store = store
+        self._block = _HEADER + window
+        self._states: Dict[str, UserTrendState] = {}
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._states)
+
+    def observe(self, user_id: str, bia_data: Dict) -> Dict:
+        """
+        Fold one BIA observation into the user's state and return the
+        updated trend summary. Metrics missing from bia_data are skipped.
+        """
+        timestamp = _parse_timestamp(bia_data.get('timestamp'))
+
+        if self.store is not None:
+            def fold(raw: Optional[bytes]):
+                state = UserTrendState.from_bytes(raw) if raw else UserTrendState(timestamp, self.window)
+                summary = self._fold(state, timestamp, bia_data)
+                return state.to_bytes(), summary
+            return self.store.update(TREND_NAMESPACE, user_id, fold)
+
+        with self._lock:
+            state = self._states.get(user_id)
+            if state is None:
+                state = UserTrendState(timestamp, self.window)
+                self._states[user_id] = state
+            return self._fold(state, timestamp, bia_data)
+
+    def snapshot(self, user_id: str) -> Dict:
+        """Current trend summary without adding an observation"""
+        if self.store is not None:
+            raw = self.store.get(TREND_NAMESPACE, user_id) if user_id is not None else None
+            return self._summarize(UserTrendState.from_bytes(raw) if raw else None)
+        with self._lock:
+            return self._summarize(self._states.get(user_id))
+
+    def _fold(self, state: UserTrendState, timestamp: float, bia_data: Dict) -> Dict:
+        x = (timestamp - state.origin) / _DAY_SECONDS
+        for i, metric in enumerate(TREND_METRICS):
+            y = bia_data.get(metric)
+            if y is None:
+                continue
+            self._update(state.values, i * self._block, x, float(y))
+        return self._summarize(state)
+
+    def _update(self, v: array, base: int, x: float, y: float):
+        count = v[base + _COUNT] + 1
+        v[base + _COUNT] = count
+
+        if count == 1:
+            v[base + _EWMA] = y
+        else:
+            v[base + _EWMA] += self.alpha * (y - v[base + _EWMA])
+
+        d = self.decay
+        v[base + _SX] = d * v[base + _SX] + x
+        v[base + _SY] = d * v[base + _SY] + y
+        v[base + _SXX] = d * v[base + _SXX] + x * x
+        v[base + _SXY] = d * v[base + _SXY] + x * y
+
+        # Ring buffer for the windowed min/max
+        window = self.window
+        slot = base + _HEADER + int(count - 1) % window
+        evicted = v[slot] if count > window else None
+        v[slot] = y
+
+        if count == 1:
+            v[base + _MIN] = v[base + _MAX] = y
+            return
+
+        low, high = v[base + _MIN], v[base + _MAX]
+        stale = evicted is not None and (
+            (evicted == low and y > low) or (evicted == high and y < high)
+        )
+        if stale:
+            # The evicted value was an extreme: rescan the (fixed-size) window
+            filled = v[base + _HEADER:base + _HEADER + window]
+            v[base + _MIN], v[base + _MAX] = min(filled), max(filled)
+        else:
+            if y < low:
+                v[base + _MIN] = y
+            if y > high:
+                v[base + _MAX] = y
+
+    def _slope(self, v: array, base: int) -> float:
+        """Weighted least-squares slope per day, 0 when undetermined"""
+        count = v[base + _COUNT]
+        # Total weight of `count` decayed observations (geometric series)
+        w = (1 - self.decay ** count) / (1 - self.decay) if self.decay < 1 else count
+        sx = v[base + _SX]
+        denominator = w * v[base + _SXX] - sx * sx
+        if count < 2 or denominator <= 1e-9 * max(1.0, w * v[base + _SXX]):
+            return 0.0
+        return (w * v[base + _SXY] - sx * v[base + _SY]) / denominator
+
+    def _summarize(self, state: Optional[UserTrendState]) -> Dict:
+        metrics = {}
+        directions = {}
+        slopes = {}
+        for i, (metric, tolerance) in enumerate(TREND_METRICS.items()):
+            if state is None or state.values[i * self._block + _COUNT] == 0:
+                metrics[metric] = None
+                directions[metric] = "stable"
+                continue
+
+            v, base = state.values, i * self._block
+            slope = slopes[metric] = self._slope(v, base)
+            metrics[metric] = {
+                "observations": int(v[base + _COUNT]),
+                "ewma": round(v[base + _EWMA], 3),
+                "slope_per_day": round(slope, 6),
+                "window_min": v[base + _MIN],
+                "window_max": v[base + _MAX],
+            }
+            monthly = slope * 30
+            if monthly > tolerance:
+                directions[metric] = "improving"
+            elif monthly < -tolerance:
+                directions[metric] = "declining"
+            else:
+                directions[metric] = "stable"
+
+        # Positive = points (% of the 0-100 scale) lost per month;
+        # adding 0.0 folds a negative zero into 0.0
+        decline_rate = -slopes.get("cognitive_score", 0.0) * 30
+
+        return {
+            "cognitive_decline_rate": round(decline_rate, 3) + 0.0,
+            "cognitive_trend": directions["cognitive_score"],
+            "sleep_trend": directions["sleep_efficiency"],
+            "hrv_trend": directions["hrv"],
+            "activity_trend": directions["steps"],
+            "metrics": metrics,
+        }
+
+
+def _parse_timestamp(value) -> float:
+    """Observation time as epoch seconds; unparseable values mean 'now'"""
+    if isinstance(value, str):
+        try:
+            parsed = datetime.fromisoformat(value.replace("Z", "+00:00"))
+            return parsed.timestamp()
+        except ValueError:
+            pass
+    elif isinstance(value, (int, float)) and math.isfinite(value):
+        return float(value)
+    return datetime.now().timestamp()
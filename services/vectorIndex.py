@@ -0,0 +1,515 @@
+"""
+On-disk approximate nearest-neighbour index
+IVF (inverted file) index over memory-mapped NumPy arrays, used to compare
+patient signatures and cellular embeddings against reference cohorts
+"""
+
+from typing import Dict, List, Optional, Tuple
+from array import array
+import json
+import os
+import threading
+import time
+
+import numpy as np
+
+try:
+    import fcntl
+except ImportError:  # Windows: single-process deployments only
+    fcntl = None
+
+METRICS = ("l2", "cosine")
+
+
+def _kmeans(data: np.ndarray, k: int, iterations: int = 10, seed: int = 0) -> np.ndarray:
+    """Plain Lloyd's k-means; returns (k, dim) float32 centroids"""
+    rng = np.random.default_rng(seed)
+    centroids = data[rng.choice(len(data), size=k, replace=False)].astype(np.float32)
+    for _ in range(iterations):
+        assignment = _nearest(data, centroids)
+        sums = np.zeros_like(centroids)
+        np.add.at(sums, assignment, data)
+        counts = np.bincount(assignment, minlength=k)
+        empty = counts == 0
+        centroids[~empty] = sums[~empty] / counts[~empty, None]
+        # Re-seed empty clusters with random points
+        if empty.any():
+            centroids[empty] = data[rng.choice(len(data), size=int(empty.sum()))]
+    return centroids
+
+
+def _nearest(data: np.ndarray, centroids: np.ndarray) -> np.ndarray:
+    """Index of the nearest centroid (L2) for every row"""
+    distances = (
+        (data * data).sum(axis=1)[:, None]
+        - 2 * data @ centroids.T
+        + (centroids * centroids).sum(axis=1)[None, :]
+    )
+    return distances.argmin(axis=1).astype(np.int32)
+
+
+class IVFIndex:
+    """
+    Memory-mapped IVF index with incremental insertion
+
+    Layout of the index directory:
+        meta.json      dim, metric, nlist, count, capacity
+        vectors.f32    (capacity, dim) float32 vectors, row id = position
+        assign.i32     (capacity,) inverted list of each row (-1 = untrained)
+        centroids.npy  (nlist, dim) coarse quantizer, once trained
+
+    Until `train_threshold` vectors exist queries are exact scans. The
+    index then trains its coarse quantizer with k-means and from there on
+    a query only scans the `nprobe` inverted lists closest to it. Cosine
+    vectors are stored L2-normalized.
+
+    A read_only index maps the files without writing them, for processes
+    reading an index another process owns.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        dim: int,
+        metric: str = "l2",
+        nlist: int = 64,
+        nprobe: int = 8,
+        train_threshold: Optional[int] = None,
+        read_only: bool = False
+    ):
+        if metric not in METRICS:
+            raise ValueError(f"Unknown metric '{metric}', expected one of {METRICS}")
+        self.path = path
+        self.nprobe = nprobe
+        self.read_only = read_only
+        self._lock = threading.RLock()
+        os.makedirs(path, exist_ok=True)
+
+        meta_path = os.path.join(path, "meta.json")
+        if os.path.exists(meta_path):
+            with open(meta_path) as f:
+                meta = json.load(f)
+            if meta["dim"] != dim or meta["metric"] != metric:
+                raise ValueError(
+                    f"Index at {path} is {meta['metric']}/{meta['dim']}d, "
+                    f"requested {metric}/{dim}d"
+                )
+        else:
+            meta = {"dim": dim, "metric": metric, "nlist": nlist, "count": 0, "capacity": 0}
+
+        self.dim = meta["dim"]
+        self.metric = meta["metric"]
+        self.nlist = meta["nlist"]
+        self.count = meta["count"]
+        self.capacity = meta["capacity"]
+        # faiss' rule of thumb: ~39 training points per list
+        self.train_threshold = train_threshold or self.nlist * 39
+
+        self._vectors: Optional[np.memmap] = None
+        self._assign: Optional[np.memmap] = None
+        self._map_arrays()
+
+        centroids_path = os.path.join(path, "centroids.npy")
+        self.centroids = np.load(centroids_path) if os.path.exists(centroids_path) else None
+        self._lists: List[array] = []
+        if self.centroids is not None:
+            self._build_lists()
+
+    def __len__(self) -> int:
+        return self.count
+
+    @property
+    def trained(self) -> bool:
+        return self.centroids is not None
+
+    def _file(self, name: str) -> str:
+        return os.path.join(self.path, name)
+
+    def _map_arrays(self):
+        if self.capacity == 0:
+            self._vectors = self._assign = None
+            return
+        mode = "r" if self.read_only else "r+"
+        self._vectors = np.memmap(self._file("vectors.f32"), dtype=np.float32, mode=mode,
+                                  shape=(self.capacity, self.dim))
+        self._assign = np.memmap(self._file("assign.i32"), dtype=np.int32, mode=mode,
+                                 shape=(self.capacity,))
+
+    def _grow(self, needed: int):
+        """Double capacity until `needed` rows fit, extending files in place"""
+        capacity = max(self.capacity, 1024)
+        while capacity < needed:
+            capacity *= 2
+        if capacity == self.capacity:
+            return
+        if self._vectors is not None:
+            self._vectors.flush()
+            self._assign.flush()
+        self._vectors = self._assign = None
+        for name, row_bytes in (("vectors.f32", 4 * self.dim), ("assign.i32", 4)):
+            with open(self._file(name), "ab") as f:
+                f.truncate(capacity * row_bytes)
+        old_capacity = self.capacity
+        self.capacity = capacity
+        self._map_arrays()
+        self._assign[old_capacity:] = -1
+
+    def _build_lists(self):
+        """Rebuild in-memory inverted lists from the assignment column"""
+        assign = np.asarray(self._assign[:self.count]) if self.count else np.empty(0, np.int32)
+        order = np.argsort(assign, kind="stable")
+        bounds = np.searchsorted(assign[order], np.arange(self.nlist + 1))
+        self._lists = [
+            array("q", order[bounds[j]:bounds[j + 1]].astype(np.int64).tobytes())
+            for j in range(self.nlist)
+        ]
+
+    def _prepare(self, vectors: np.ndarray) -> np.ndarray:
+        vectors = np.atleast_2d(np.asarray(vectors, dtype=np.float32))
+        if vectors.shape[1] != self.dim:
+            raise ValueError(f"Expected {self.dim}-d vectors, got {vectors.shape[1]}")
+        if self.metric == "cosine":
+            norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+            vectors = vectors / np.maximum(norms, 1e-12)
+        return vectors
+
+    def add(self, vectors: np.ndarray) -> np.ndarray:
+        """Append vectors; returns their row ids"""
+        if self.read_only:
+            raise RuntimeError(f"Index at {self.path} is open read-only")
+        vectors = self._prepare(vectors)
+        with self._lock:
+            start = self.count
+            end = start + len(vectors)
+            self._grow(end)
+            self._vectors[start:end] = vectors
+            self.count = end
+            if self.trained:
+                assignment = _nearest(vectors, self.centroids)
+                self._assign[start:end] = assignment
+                for offset, list_id in enumerate(assignment.tolist()):
+                    self._lists[list_id].append(start + offset)
+            elif self.count >= self.train_threshold:
+                self.train()
+            return np.arange(start, end, dtype=np.int64)
+
+    def train(self, sample_size: Optional[int] = None, seed: int = 0):
+        """(Re)train the coarse quantizer and reassign every stored vector"""
+        with self._lock:
+            if self.count < self.nlist:
+                raise ValueError(f"Need at least {self.nlist} vectors to train, have {self.count}")
+            sample_size = min(self.count, sample_size or self.nlist * 256)
+            rng = np.random.default_rng(seed)
+            rows = np.sort(rng.choice(self.count, size=sample_size, replace=False))
+            self.centroids = _kmeans(np.asarray(self._vectors[rows]), self.nlist, seed=seed)
+            np.save(self._file("centroids.npy"), self.centroids)
+            for start in range(0, self.count, 65536):
+                end = min(start + 65536, self.count)
+                self._assign[start:end] = _nearest(np.asarray(self._vectors[start:end]), self.centroids)
+            self._build_lists()
+            self.flush()
+
+    def truncate(self, count: int):
+        """Drop every row from `count` on (e.g. rows whose metadata was lost)"""
+        with self._lock:
+            if count >= self.count:
+                return
+            self._assign[count:self.count] = -1
+            self.count = count
+            if self.trained:
+                self._build_lists()
+
+    def vector(self, row: int) -> np.ndarray:
+        return np.array(self._vectors[row])
+
+    def _distances(self, query: np.ndarray, candidates: np.ndarray) -> np.ndarray:
+        if self.metric == "cosine":
+            return 1.0 - candidates @ query
+        diff = candidates - query
+        return np.einsum("ij,ij->i", diff, diff)
+
+    def search(self, query: np.ndarray, k: int = 10, nprobe: Optional[int] = None) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Top-k neighbours of one query vector
+
+        Returns (distances, row ids), nearest first. Distances are squared
+        L2, or 1 - cosine similarity for cosine indexes.
+        """
+        query = self._prepare(query)[0]
+        with self._lock:
+            if self.count == 0:
+                return np.empty(0, np.float32), np.empty(0, np.int64)
+            if not self.trained:
+                return self._scan(query, k)
+
+            nprobe = min(nprobe or self.nprobe, self.nlist)
+            coarse = ((self.centroids - query) ** 2).sum(axis=1)
+            probes = np.argpartition(coarse, nprobe - 1)[:nprobe]
+            rows = np.concatenate([
+                np.frombuffer(self._lists[j], dtype=np.int64) for j in probes
+                if len(self._lists[j])
+            ] or [np.empty(0, np.int64)])
+            if not len(rows):
+                return np.empty(0, np.float32), np.empty(0, np.int64)
+            rows.sort()  # Sequential page access on the memmap
+            distances = self._distances(query, np.asarray(self._vectors[rows]))
+        return _top_k(distances, rows, k)
+
+    def _scan(self, query: np.ndarray, k: int) -> Tuple[np.ndarray, np.ndarray]:
+        """Exact search over every stored vector, in chunks"""
+        best_d = np.empty(0, np.float32)
+        best_i = np.empty(0, np.int64)
+        for start in range(0, self.count, 65536):
+            end = min(start + 65536, self.count)
+            d = self._distances(query, np.asarray(self._vectors[start:end]))
+            d, i = _top_k(d, np.arange(start, end, dtype=np.int64), k)
+            best_d, best_i = _top_k(np.concatenate([best_d, d]), np.concatenate([best_i, i]), k)
+        return best_d, best_i
+
+    def flush(self):
+        if self.read_only:
+            return
+        with self._lock:
+            if self._vectors is not None:
+                self._vectors.flush()
+                self._assign.flush()
+            meta = {
+                "dim": self.dim,
+                "metric": self.metric,
+                "nlist": self.nlist,
+                "count": self.count,
+                "capacity": self.capacity,
+            }
+            tmp = self._file("meta.json.tmp")
+            with open(tmp, "w") as f:
+                json.dump(meta, f)
+            os.replace(tmp, self._file("meta.json"))
+
+    def close(self):
+        self.flush()
+        self._vectors = self._assign = None
+
+
+def _top_k(distances: np.ndarray, ids: np.ndarray, k: int) -> Tuple[np.ndarray, np.ndarray]:
+    if len(distances) > k:
+        part = np.argpartition(distances, k - 1)[:k]
+        distances, ids = distances[part], ids[part]
+    order = np.argsort(distances, kind="stable")
+    return distances[order], ids[order]
+
+
+SIGNATURE_DIMENSIONS = ("microglial_activation", "inflammatory_state", "neuronal_health", "metabolic_health")
+
+
+class SignatureIndex:
+    """
+    Nearest-neighbour search over patient signature trajectories
+
+    Each CellularSignatureCalculator output is indexed as a trajectory: the
+    user's last `window` four-dimension signatures concatenated oldest
+    first (padded with the first one for new users). The previous
+    trajectory is read back from the index itself, so only each user's
+    latest row id is kept in memory. Row owners are kept in an append-only
+    rows.tsv next to the vectors. Files are opened by open().
+
+    One process owns the directory: open() takes an exclusive flock on
+    owner.lock, and only the holder writes. Other processes (further
+    uvicorn workers) open it read-only as followers and reload vectors and
+    owners whenever the owner has flushed meta.json, which it does every
+    flush_every adds or flush_interval seconds. Followers forward their
+    adds to the owner (see backend_api.index_signatures); calling add()
+    on a follower raises.
+
+    add() is called from request threads and the event loop alike; one lock
+    covers each vector append together with its owner entry, so row ids and
+    owners never drift apart.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        window: int = 3,
+        flush_every: int = 1000,
+        flush_interval: float = 1.0,
+        **index_kwargs
+    ):
+        self.path = path
+        self.window = window
+        self.flush_every = flush_every
+        self.flush_interval = flush_interval
+        self.index_kwargs = index_kwargs
+        self.index: Optional[IVFIndex] = None
+        self.owner = False
+        self._following = False
+        self._owners: List[Tuple[str, str]] = []
+        self._latest: Dict[str, int] = {}
+        self._rows_file = None
+        self._lock_file = None
+        self._rows_offset = 0
+        self._meta_mtime = None
+        self._unflushed = 0
+        self._last_flush = time.monotonic()
+        self._lock = threading.RLock()
+
+    def __len__(self) -> int:
+        return len(self.index) if self.index is not None else 0
+
+    def _open_index(self, read_only: bool) -> IVFIndex:
+        return IVFIndex(
+            self.path,
+            dim=len(SIGNATURE_DIMENSIONS) * self.window,
+            metric="l2",
+            read_only=read_only,
+            **self.index_kwargs
+        )
+
+    def open(self):
+        os.makedirs(self.path, exist_ok=True)
+        self._lock_file = open(os.path.join(self.path, "owner.lock"), "a")
+        self.owner = True
+        if fcntl is not None:
+            try:
+                fcntl.flock(self._lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                self.owner = False
+        if not self.owner:
+            self._lock_file.close()
+            self._lock_file = None
+            self._following = True
+            self._refresh()
+            return
+
+        self.index = self._open_index(read_only=False)
+        rows_path = os.path.join(self.path, "rows.tsv")
+        if os.path.exists(rows_path):
+            with open(rows_path) as f:
+                for row, line in enumerate(f):
+                    if row >= len(self.index):
+                        break  # Vectors written after the last flush were lost
+                    user_id, timestamp = line.rstrip("\n").split("\t")
+                    self._owners.append((user_id, timestamp))
+                    self._latest[user_id] = row
+            if len(self._owners) < len(self.index):
+                # Owners written after the last flush were lost; drop their vectors
+                self.index.truncate(len(self._owners))
+            with open(rows_path, "r+b") as f:
+                f.truncate(sum(len(f"{u}\t{t}\n".encode("utf-8")) for u, t in self._owners))
+        self._rows_file = open(rows_path, "a")
+
+    def _refresh(self):
+        """Follower: pick up what the owner flushed since the last call"""
+        if self.owner:
+            return
+        with self._lock:
+            try:
+                mtime = os.stat(os.path.join(self.path, "meta.json")).st_mtime_ns
+            except FileNotFoundError:
+                return
+            if mtime == self._meta_mtime:
+                return
+            self._meta_mtime = mtime
+            self.index = self._open_index(read_only=True)
+            count = len(self.index)
+            if count < len(self._owners):
+                # The owner dropped rows it lost on restart: reload from scratch
+                self._owners, self._latest, self._rows_offset = [], {}, 0
+            rows_path = os.path.join(self.path, "rows.tsv")
+            if len(self._owners) >= count or not os.path.exists(rows_path):
+                return
+            with open(rows_path, "rb") as f:
+                f.seek(self._rows_offset)
+                while len(self._owners) < count:
+                    line = f.readline()
+                    if not line.endswith(b"\n"):
+                        break
+                    user_id, timestamp = line.decode("utf-8").rstrip("\n").split("\t")
+                    self._latest[user_id] = len(self._owners)
+                    self._owners.append((user_id, timestamp))
+                    self._rows_offset += len(line)
+
+    def add(self, user_id: str, cellular_signature: Dict) -> int:
+        """Index one calculate_signature() output for a user (owner only)"""
+        if not self.owner:
+            raise RuntimeError(f"Signature index at {self.path} is owned by another process")
+        scores = cellular_signature["cellular_signature"]
+        current = np.array([scores[name] for name in SIGNATURE_DIMENSIONS], dtype=np.float32)
+        timestamp = cellular_signature.get("timestamp", "")
+
+        with self._lock:
+            previous_row = self._latest.get(user_id)
+            if previous_row is None:
+                trajectory = np.tile(current, self.window)
+            else:
+                previous = self.index.vector(previous_row)
+                trajectory = np.concatenate([previous[len(SIGNATURE_DIMENSIONS):], current])
+
+            row = int(self.index.add(trajectory)[0])
+            self._owners.append((user_id, timestamp))
+            self._latest[user_id] = row
+            self._rows_file.write(f"{user_id}\t{timestamp}\n")
+            self._unflushed += 1
+            if (self._unflushed >= self.flush_every or
+                    time.monotonic() - self._last_flush >= self.flush_interval):
+                self.flush()
+        return row
+
+    def similar(self, user_id: str, k: int = 5) -> List[Dict]:
+        """
+        Users whose recent trajectory is closest to this user's latest one
+        One match (the closest point) per other user
+        """
+        self._refresh()
+        with self._lock:
+            row = self._latest.get(user_id)
+            if row is None or row >= len(self.index):
+                return []
+            query = self.index.vector(row)
+
+            matches: Dict[str, Dict] = {}
+            fetch = k * 4
+            while True:
+                distances, rows = self.index.search(query, fetch)
+                for distance, match_row in zip(distances.tolist(), rows.tolist()):
+                    other, timestamp = self._owners[match_row]
+                    if other == user_id or other in matches:
+                        continue
+                    matches[other] = {
+                        "user_id": other,
+                        "timestamp": timestamp,
+                        "distance": round(float(np.sqrt(max(distance, 0.0))), 4),
+                    }
+                if len(matches) >= k or len(rows) < fetch or fetch >= len(self.index):
+                    break
+                fetch *= 4
+        return sorted(matches.values(), key=lambda m: m["distance"])[:k]
+
+    def flush(self):
+        with self._lock:
+            if self._rows_file is not None:
+                self._rows_file.flush()
+                self.index.flush()
+            self._unflushed = 0
+            self._last_flush = time.monotonic()
+
+    def close(self):
+        with self._lock:
+            if self._rows_file is not None:
+                self.flush()
+                self._rows_file.close()
+                self._rows_file = None
+            if self.index is not None:
+                self.index.close()
+            self._following = False
+            if self._lock_file is not None:
+                # Closing the file releases the flock for the next owner
+                self._lock_file.close()
+                self._lock_file = None
+
+    def stats(self) -> Dict:
+        return {
+            "status": "ok" if self._rows_file is not None or self._following else "closed",
+            "role": "owner" if self.owner else "follower",
+            "vectors": len(self),
+            "users": len(self._latest),
+            "trained": self.index.trained if self.index is not None else False,
+        }
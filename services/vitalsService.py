@@ -0,0 +1,295 @@
+"""
+Vital sign ingestion for HealthKit/Health Connect syncs
+Validates raw vitals payloads into typed columnar batches
+"""
+
+from typing import Dict, Iterator, List, Optional, Sequence, Tuple
+from datetime import datetime, timezone
+import json
+import struct
+import numpy as np
+
+# Compact binary framing for delta syncs (Content-Type: application/x-bia-vitals)
+#
+#   header  "BIAV" | version u8 | type count u8 | record count u32 | base epoch ms i64
+#           | source length u8 | source utf-8
+#   types   per type: name length u8 | name utf-8 | unit length u8 | unit utf-8
+#   records per sample: type index u8 | ms after base u32 | value f32
+#
+# All integers are little-endian. A sample costs 9 bytes instead of ~120 as JSON.
+# Offsets are u32, so one frame spans at most MAX_FRAME_SPAN_MS (~49.7 days);
+# longer uploads (first sync, backfills) are split into several frames.
+VITALS_FRAME_CONTENT_TYPE = "application/x-bia-vitals"
+VITALS_FRAME_MAGIC = b"BIAV"
+VITALS_FRAME_VERSION = 1
+_FRAME_HEADER = struct.Struct("<4sBBIq")
+FRAME_RECORD_DTYPE = np.dtype([("type", "u1"), ("offset_ms", "<u4"), ("value", "<f4")])
+MAX_FRAME_SPAN_MS = 2 ** 32 - 1
+
+
+class VitalsValidationError(ValueError):
+    """Raised when a vitals payload contains an invalid record"""
+
+    def __init__(self, index: int, message: str):
+        super().__init__(f"vitals[{index}]: {message}")
+        self.index = index
+
+
+def normalize_timestamp(value) -> str:
+    """
+    Normalize a vital timestamp to an ISO-8601 string
+    Accepts ISO strings (with or without 'Z') and epoch seconds/milliseconds
+    """
+    if isinstance(value, str):
+        parsed = datetime.fromisoformat(value.replace("Z", "+00:00"))
+    elif isinstance(value, (int, float)) and not isinstance(value, bool):
+        # Values this large can only be epoch milliseconds (JS Date.getTime())
+        seconds = value / 1000 if value > 1e11 else value
+        parsed = datetime.fromtimestamp(seconds, tz=timezone.utc)
+    else:
+        raise ValueError("timestamp must be an ISO string or epoch number")
+    return parsed.isoformat()
+
+
+def timestamp_to_epoch_ms(timestamp: str) -> int:
+    """Epoch milliseconds of a normalized timestamp (naive values are taken as UTC)"""
+    parsed = datetime.fromisoformat(timestamp)
+    if parsed.tzinfo is None:
+        parsed = parsed.replace(tzinfo=timezone.utc)
+    return int(parsed.timestamp() * 1000)
+
+
+class VitalsBatch:
+    """
+    Columnar batch of vital signs for one user
+
+    Duplicate (type, timestamp) pairs within the payload keep the last
+    occurrence, matching how a re-sent sample overwrites an earlier one.
+    """
+
+    __slots__ = ("user_id", "timestamps", "types", "values", "units", "sources", "metadata", "duplicates", "epoch_ms")
+
+    def __init__(
+        self,
+        user_id: str,
+        timestamps: List[str],
+        types: List[str],
+        values: np.ndarray,
+        units: List[Optional[str]],
+        sources: List[Optional[str]],
+        metadata: List[Optional[str]],
+        duplicates: int = 0,
+        epoch_ms: Optional[np.ndarray] = None
+    ):
+        self.user_id = user_id
+        self.timestamps = timestamps
+        self.types = types
+        self.values = values
+        self.units = units
+        self.sources = sources
+        self.metadata = metadata
+        self.duplicates = duplicates
+        if epoch_ms is None:
+            epoch_ms = np.fromiter(
+                (timestamp_to_epoch_ms(t) for t in timestamps),
+                dtype=np.int64,
+                count=len(timestamps)
+            )
+        self.epoch_ms = epoch_ms
+
+    def __len__(self) -> int:
+        return len(self.timestamps)
+
+    @classmethod
+    def from_records(cls, user_id: str, records: List[Dict]) -> "VitalsBatch":
+        """Validate raw vital dicts into a deduplicated batch"""
+        if not isinstance(records, list):
+            raise VitalsValidationError(0, "vitals must be a list")
+
+        positions: Dict[Tuple[str, str], int] = {}
+        timestamps, types, values, units, sources, metadata = [], [], [], [], [], []
+
+        for index, record in enumerate(records):
+            if not isinstance(record, dict):
+                raise VitalsValidationError(index, "must be an object")
+
+            vital_type = record.get('type')
+            if not isinstance(vital_type, str) or not vital_type:
+                raise VitalsValidationError(index, "type is required")
+
+            try:
+                timestamp = normalize_timestamp(record.get('timestamp'))
+            except (ValueError, OverflowError, OSError) as e:
+                raise VitalsValidationError(index, str(e))
+
+            value = record.get('value')
+            if isinstance(value, bool) or not isinstance(value, (int, float)):
+                raise VitalsValidationError(index, "value must be a number")
+
+            extra = record.get('metadata')
+            row = (
+                float(value),
+                record.get('unit'),
+                record.get('source'),
+                json.dumps(extra) if extra is not None else None
+            )
+
+            key = (vital_type, timestamp)
+            position = positions.get(key)
+            if position is None:
+                positions[key] = len(timestamps)
+                timestamps.append(timestamp)
+                types.append(vital_type)
+                values.append(row[0])
+                units.append(row[1])
+                sources.append(row[2])
+                metadata.append(row[3])
+            else:
+                values[position], units[position], sources[position], metadata[position] = row
+
+        return cls(
+            user_id,
+            timestamps,
+            types,
+            np.asarray(values, dtype=np.float64),
+            units,
+            sources,
+            metadata,
+            duplicates=len(records) - len(timestamps)
+        )
+
+    @classmethod
+    def from_frame(cls, user_id: str, body: bytes) -> "VitalsBatch":
+        """Decode a binary vitals frame into a deduplicated batch"""
+        names, units, source, records, base_ms = decode_vitals_frame(body)
+        if len(records) and int(records["type"].max()) >= len(names):
+            raise VitalsValidationError(int(np.argmax(records["type"] >= len(names))), "unknown type index")
+        bad = ~np.isfinite(records["value"])
+        if bad.any():
+            raise VitalsValidationError(int(np.argmax(bad)), "value must be a finite number")
+
+        epoch_ms = base_ms + records["offset_ms"].astype(np.int64)
+        # Keep the last occurrence of each (type, timestamp), like from_records
+        keys = records["type"].astype(np.int64) << 48 | (epoch_ms - base_ms)
+        _, last_reversed = np.unique(keys[::-1], return_index=True)
+        keep = np.sort(len(keys) - 1 - last_reversed)
+        epoch_ms = epoch_ms[keep]
+        type_index = records["type"][keep].tolist()
+
+        return cls(
+            user_id,
+            [
+                datetime.fromtimestamp(ms / 1000, tz=timezone.utc).isoformat()
+                for ms in epoch_ms.tolist()
+            ],
+            [names[i] for i in type_index],
+            # Via the shortest float32 repr, so 0.8 is stored as 0.8 rather than 0.800000011920929
+            records["value"][keep].astype(str).astype(np.float64),
+            [units[i] for i in type_index],
+            [source] * len(keep),
+            [None] * len(keep),
+            duplicates=len(records) - len(keep),
+            epoch_ms=epoch_ms
+        )
+
+    def select(self, mask: np.ndarray) -> "VitalsBatch":
+        """Sub-batch of the rows where mask is True"""
+        positions = np.flatnonzero(mask).tolist()
+        return VitalsBatch(
+            self.user_id,
+            [self.timestamps[i] for i in positions],
+            [self.types[i] for i in positions],
+            self.values[mask],
+            [self.units[i] for i in positions],
+            [self.sources[i] for i in positions],
+            [self.metadata[i] for i in positions],
+            duplicates=self.duplicates,
+            epoch_ms=self.epoch_ms[mask]
+        )
+
+    def rows(self) -> Iterator[Tuple]:
+        """Rows in vital_signs column order"""
+        user_id = self.user_id
+        for i, value in enumerate(self.values.tolist()):
+            yield (
+                user_id,
+                self.timestamps[i],
+                self.types[i],
+                value,
+                self.units[i],
+                self.sources[i],
+                self.metadata[i]
+            )
+
+
+def _read_string(body: bytes, pos: int) -> Tuple[str, int]:
+    length = body[pos]
+    end = pos + 1 + length
+    if end > len(body):
+        raise ValueError("truncated frame")
+    return body[pos + 1:end].decode("utf-8"), end
+
+
+def decode_vitals_frame(body: bytes) -> Tuple[List[str], List[Optional[str]], Optional[str], np.ndarray, int]:
+    """
+    Parse a binary vitals frame
+
+    Returns (type names, units, source, FRAME_RECORD_DTYPE records, base
+    epoch ms). Raises VitalsValidationError on malformed frames.
+    """
+    try:
+        magic, version, type_count, record_count, base_ms = _FRAME_HEADER.unpack_from(body, 0)
+        if magic != VITALS_FRAME_MAGIC or version != VITALS_FRAME_VERSION:
+            raise ValueError("not a BIAV v1 frame")
+        source, pos = _read_string(body, _FRAME_HEADER.size)
+        names, units = [], []
+        for _ in range(type_count):
+            name, pos = _read_string(body, pos)
+            unit, pos = _read_string(body, pos)
+            names.append(name)
+            units.append(unit or None)
+        if len(body) - pos != record_count * FRAME_RECORD_DTYPE.itemsize:
+            raise ValueError("record section does not match record count")
+    except (struct.error, IndexError, UnicodeDecodeError, ValueError) as e:
+        raise VitalsValidationError(0, f"invalid frame: {e}")
+    records = np.frombuffer(body, dtype=FRAME_RECORD_DTYPE, offset=pos, count=record_count)
+    return names, units, source or None, records, base_ms
+
+
+def encode_vitals_frame(
+    types: Sequence[str],
+    epoch_ms: Sequence[int],
+    values: Sequence[float],
+    units: Optional[Dict[str, str]] = None,
+    source: str = ""
+) -> bytes:
+    """
+    Build a binary vitals frame (the inverse of decode_vitals_frame)
+    Raises ValueError if the samples span more than MAX_FRAME_SPAN_MS
+    """
+    units = units or {}
+    names = list(dict.fromkeys(types))
+    index = {name: i for i, name in enumerate(names)}
+    epoch_ms = np.asarray(epoch_ms, dtype=np.int64)
+    base_ms = int(epoch_ms.min()) if len(epoch_ms) else 0
+    if len(epoch_ms) and int(epoch_ms.max()) - base_ms > MAX_FRAME_SPAN_MS:
+        raise ValueError(f"samples span more than {MAX_FRAME_SPAN_MS} ms; split them into several frames")
+
+    records = np.empty(len(epoch_ms), dtype=FRAME_RECORD_DTYPE)
+    records["type"] = [index[t] for t in types]
+    records["offset_ms"] = epoch_ms - base_ms
+    records["value"] = values
+
+    def string(value: str) -> bytes:
+        data = value.encode("utf-8")
+        return bytes([len(data)]) + data
+
+    parts = [
+        _FRAME_HEADER.pack(VITALS_FRAME_MAGIC, VITALS_FRAME_VERSION, len(names), len(records), base_ms),
+        string(source),
+    ]
+    for name in names:
+        parts.append(string(name))
+        parts.append(string(units.get(name, "")))
+    parts.append(records.tobytes())
+    return b"".join(parts)
@@ -0,0 +1,242 @@
+"""
+What-if analysis
+Risk surface, marginal effects and the cheapest change of risk level over
+grids of scoring inputs, evaluated in one vectorized pass
+"""
+
+from typing import Dict, List, Optional, Sequence
+
+import numpy as np
+
+from services.cognitiveSession import SESSION_INPUTS
+from services.orchestrationService import RISK_LEVELS, SIGNATURE_INPUTS, CellularSignatureCalculator
+
+# Largest grid (product of sweep lengths) evaluated per request
+MAX_GRID_POINTS = 1_000_000
+
+
+class WhatIfError(ValueError):
+    """Raised for sweeps that cannot be evaluated"""
+
+
+def sweep_values(name: str, spec: Dict) -> np.ndarray:
+    """
+    Sorted, de-duplicated values of one sweep: either explicit `values` or
+    `steps` evenly spaced points from `start` to `stop` inclusive
+    """
+    if spec.get("values") is not None:
+        values = np.asarray(spec["values"], dtype=np.float64)
+    elif spec.get("start") is not None and spec.get("stop") is not None and spec.get("steps"):
+        values = np.linspace(spec["start"], spec["stop"], int(spec["steps"]))
+    else:
+        raise WhatIfError(f"Sweep '{name}' needs values or start, stop and steps")
+    if values.size == 0 or not np.isfinite(values).all():
+        raise WhatIfError(f"Sweep '{name}' needs at least one finite value")
+    return np.unique(values)
+
+
+class WhatIfAnalyzer:
+    """
+    Evaluates every combination of swept scoring inputs around a base request
+
+    Inputs that are not swept stay at the base request's values (or the
+    scoring defaults). The grid is built by broadcasting the sweep axes and
+    scored with a single calculate_signatures_batch() call, so results
+    are identical to orchestrating each scenario separately.
+
+    The cheapest crossing is the grid point at a lower risk level than the base
+    with the lowest change cost: sum over inputs of weight * |value - base|.
+    A sweep's weight is its `cost` per unit when given, otherwise one over
+    the sweep's range, so moving any input across its whole sweep costs 1.
+    """
+
+    def __init__(self, calculator: Optional[CellularSignatureCalculator] = None, max_points: int = MAX_GRID_POINTS):
+        self.calculator = calculator or CellularSignatureCalculator()
+        self.max_points = max_points
+
+    def analyze(self, base: Dict, sweeps: Dict[str, Dict], include_surface: bool = True) -> Dict:
+        names = list(sweeps)
+        if not names:
+            raise WhatIfError("At least one sweep is required")
+        unknown = [name for name in names if name not in SIGNATURE_INPUTS]
+        if unknown:
+            raise WhatIfError(
+                f"Cannot sweep {', '.join(unknown)}; sweepable inputs are {', '.join(SIGNATURE_INPUTS)}"
+            )
+        axes = [sweep_values(name, sweeps[name]) for name in names]
+        shape = tuple(len(axis) for axis in axes)
+        size = int(np.prod(shape))
+        if size > self.max_points:
+            raise WhatIfError(f"Grid has {size} points; the limit is {self.max_points}")
+
+        base_point = {
+            name: float(default if base.get(name) is None else base[name])
+            for name, default in SIGNATURE_INPUTS.items()
+        }
+        session = {name: float(base[name]) for name in SESSION_INPUTS if base.get(name) is not None}
+
+        # Every grid point, flattened in C order over the sweep axes
+        columns = dict(session)
+        columns.update(base_point)
+        for i, (name, axis) in enumerate(zip(names, axes)):
+            view = [1] * len(axes)
+            view[i] = len(axis)
+            columns[name] = np.broadcast_to(axis.reshape(view), shape).ravel()
+        grid = self._score(columns, size)
+        risk = grid["ad_risk_score"].reshape(shape)
+        levels = grid["risk_level"].reshape(shape)
+
+        reference = self._score(dict(columns, **{name: base_point[name] for name in names}), 1)
+        base_risk = float(reference["ad_risk_score"][0])
+        base_level = int(reference["risk_level"][0])
+
+        weights = {
+            name: self._weight(sweeps[name], axis)
+            for name, axis in zip(names, axes)
+        }
+        analysis = {
+            "base": {
+                "inputs": {name: base_point[name] for name in names},
+                "ad_risk_score": base_risk,
+                "risk_level": RISK_LEVELS[base_level],
+            },
+            "grid_points": size,
+            "summary": {
+                "min_ad_risk_score": float(risk.min()),
+                "max_ad_risk_score": float(risk.max()),
+                "risk_level_share": {
+                    level: round(float(share), 4)
+                    for level, share in zip(RISK_LEVELS, np.bincount(levels.ravel(), minlength=len(RISK_LEVELS)) / size)
+                },
+            },
+            "marginal_effects": self._marginal_effects(columns, names, axes, risk, base_point, base_risk),
+            "cheapest_crossing": self._cheapest_crossing(
+                columns, names, axes, risk, levels, base_point, base_level, weights
+            ),
+        }
+        if include_surface:
+            analysis["surface"] = {
+                "axes": {name: axis.tolist() for name, axis in zip(names, axes)},
+                "shape": list(shape),
+                "ad_risk_score": risk.tolist(),
+                "risk_level": levels.tolist(),
+                "risk_levels": list(RISK_LEVELS),
+            }
+        return analysis
+
+    def _score(self, columns: Dict, size: int) -> Dict[str, np.ndarray]:
+        return self.calculator.calculate_signatures_batch({
+            name: value if isinstance(value, np.ndarray) else np.full(size, value)
+            for name, value in columns.items()
+        })
+
+    @staticmethod
+    def _weight(spec: Dict, axis: np.ndarray) -> float:
+        if spec.get("cost") is not None:
+            return float(spec["cost"])
+        span = float(axis[-1] - axis[0])
+        return 1.0 / span if span > 0 else 1.0
+
+    def _marginal_effects(
+        self,
+        columns: Dict,
+        names: List[str],
+        axes: List[np.ndarray],
+        risk: np.ndarray,
+        base_point: Dict,
+        base_risk: float
+    ) -> Dict:
+        """
+        Per input: risk along its sweep with everything else at base, and
+        the partial dependence (mean over the other swept inputs)
+        """
+        effects = {}
+        for i, (name, axis) in enumerate(zip(names, axes)):
+            # Scored separately rather than sliced out of the grid, since base
+            # values need not lie on the other sweeps
+            alone = dict(columns, **{other: base_point[other] for other in names})
+            alone[name] = axis
+            scores = self._score(alone, len(axis))["ad_risk_score"]
+            other_axes = tuple(j for j in range(len(axes)) if j != i)
+            partial = risk.mean(axis=other_axes) if other_axes else risk
+            effects[name] = {
+                "values": axis.tolist(),
+                "ad_risk_score": scores.tolist(),
+                "delta_vs_base": np.round(scores - base_risk, 3).tolist(),
+                "partial_dependence": np.round(partial, 4).tolist(),
+                "range_effect": round(float(scores.max() - scores.min()), 3),
+            }
+        return effects
+
+    def _cheapest_crossing(
+        self,
+        columns: Dict,
+        names: List[str],
+        axes: List[np.ndarray],
+        risk: np.ndarray,
+        levels: np.ndarray,
+        base_point: Dict,
+        base_level: int,
+        weights: Dict[str, float]
+    ) -> Optional[Dict]:
+        """Lowest-cost grid point below the base risk level, with a stepwise path to it"""
+        if base_level == 0:
+            return None
+        cost = np.zeros(risk.shape)
+        for i, (name, axis) in enumerate(zip(names, axes)):
+            view = [1] * len(axes)
+            view[i] = len(axis)
+            cost = cost + (weights[name] * np.abs(axis - base_point[name])).reshape(view)
+        crossing = levels < base_level
+        if not crossing.any():
+            return None
+        masked = np.where(crossing, cost, np.inf).ravel()
+        # Cheapest first, then lowest risk among equally cheap points
+        best = int(np.lexsort((risk.ravel(), masked))[0])
+        index = np.unravel_index(best, risk.shape)
+        target = {name: float(axis[k]) for name, axis, k in zip(names, axes, index)}
+        return {
+            "target_risk_level": RISK_LEVELS[int(levels[index])],
+            "ad_risk_score": float(risk[index]),
+            "cost": round(float(cost[index]), 4),
+            "changes": {
+                name: {"from": base_point[name], "to": value}
+                for name, value in target.items() if value != base_point[name]
+            },
+            "path": self._path(columns, names, base_point, target, weights),
+        }
+
+    def _path(
+        self,
+        columns: Dict,
+        names: Sequence[str],
+        base_point: Dict,
+        target: Dict,
+        weights: Dict[str, float]
+    ) -> List[Dict]:
+        """
+        Apply the target's changes one input at a time, each step taking the
+        change that lowers risk most (ties: the cheaper one)
+        """
+        fixed = {key: value for key, value in columns.items() if key not in names}
+        current = {name: base_point[name] for name in names}
+        remaining = [name for name in names if target[name] != base_point[name]]
+        path = []
+        while remaining:
+            candidates = {name: np.full(len(remaining), current[name]) for name in names}
+            for row, name in enumerate(remaining):
+                candidates[name][row] = target[name]
+            scored = self._score(dict(fixed, **candidates), len(remaining))
+            step_costs = [weights[name] * abs(target[name] - base_point[name]) for name in remaining]
+            row = int(np.lexsort((step_costs, scored["ad_risk_score"]))[0])
+            name = remaining.pop(row)
+            path.append({
+                "parameter": name,
+                "from": current[name],
+                "to": target[name],
+                "cost": round(step_costs[row], 4),
+                "ad_risk_score": float(scored["ad_risk_score"][row]),
+                "risk_level": RISK_LEVELS[int(scored["risk_level"][row])],
+            })
+            current[name] = target[name]
+        return path
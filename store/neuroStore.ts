@@ -11,7 +11,12 @@ import {
   TherapySession
 } from '@/types/neuro';
 
+const USER_ID_KEY = 'bia.userId';
+
 interface NeuroStore {
+  // Signed-in user (backend user id), persisted across app starts
+  userId: string | null;
+  
   // Cognitive
   assessments: CognitiveAssessment[];
   currentIndex: CognitiveIndex | null;
@@ -33,6 +38,8 @@ interface NeuroStore {
   therapySessions: TherapySession[];
   
   // Actions
+  setUserId: (userId: string | null) => Promise<void>;
+  loadUserId: () => Promise<void>;
   addAssessment: (assessment: CognitiveAssessment) => void;
   addBehaviorLog: (log: BehaviorLog) => void;
   addVitalSign: (vital: VitalSign) => void;
@@ -45,6 +52,7 @@ interface NeuroStore {
 }
 
 export const useNeuroStore = create<NeuroStore>((set, get) => ({
+  userId: null,
   assessments: [],
   currentIndex: null,
   behaviorLogs: [],
@@ -75,6 +83,22 @@ export const useNeuroStore = create<NeuroStore>((set, get) => ({
   caregiverNotes: [],
   therapySessions: [],
 
+  setUserId: async (userId) => {
+    set({ userId });
+    if (userId) {
+      await AsyncStorage.setItem(USER_ID_KEY, userId);
+    } else {
+      await AsyncStorage.removeItem(USER_ID_KEY);
+    }
+  },
+
+  loadUserId: async () => {
+    const userId = await AsyncStorage.getItem(USER_ID_KEY);
+    if (userId) {
+      set({ userId });
+    }
+  },
+
   addAssessment: (assessment) => {
     set((state) => ({
       assessments: [assessment, ...state.assessments]